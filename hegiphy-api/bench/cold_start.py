@@ -0,0 +1,145 @@
+"""
+Measures the cold start of lambda_handler: the time to import it in a fresh
+interpreter and the time to answer the first request, against local Giphy,
+Auth0 and DynamoDB stubs and without SSM. With --warm, a scheduled warm-up ping
+is answered before the first request, and its duration is reported too.
+
+    python bench/cold_start.py --runs 10 --path /giphy/trending
+    python bench/cold_start.py --warm --path /giphy/query --query q=cats
+"""
+
+from stubs import DynamoDbStub, StubServer
+import argparse
+import statistics
+import subprocess
+import json
+import sys
+import os
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+HEAVY_MODULES = ["boto3", "botocore", "marshmallow", "awsgi", "jose", "asyncio"]
+
+CHILD = """
+import json, sys, time
+
+start = time.perf_counter()
+import lambda_handler
+imported = time.perf_counter()
+
+# Auth0 is reached over https only; the stub speaks plain http.
+import auth
+auth._userinfo_url = lambda: sys.argv[4]
+
+ping = json.loads(sys.argv[3])
+
+if ping is not None:
+    lambda_handler.handler(ping, None)
+
+warmed = time.perf_counter()
+response = lambda_handler.handler(json.loads(sys.argv[1]), None)
+responded = time.perf_counter()
+
+print(json.dumps({
+    "import": imported - start,
+    "warm": warmed - imported,
+    "first_response": responded - warmed,
+    "status": int(response["statusCode"]),
+    "loaded": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+
+def run_once(event, ping, userinfo_url, env):
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CHILD,
+            json.dumps(event),
+            json.dumps(HEAVY_MODULES),
+            json.dumps(ping),
+            userinfo_url,
+        ],
+        env=env,
+        cwd=SRC_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2),
+        "min_ms": round(min(values) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--path", default="/giphy/trending")
+    parser.add_argument("--query", default="", help="e.g. q=cats&limit=25")
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--token", help="sent as a bearer token, e.g. for /favorites")
+    parser.add_argument("--warm", action="store_true", help="ping before the request")
+    parser.add_argument("--warm-terms", default="", help="e.g. cats,dogs")
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency).start()
+    dynamodb = DynamoDbStub(latency=args.latency).start()
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": SRC_DIR,
+        "GIPHY_BASE_URL": f"{server.base_url}/v1",
+        "GIPHY_API_KEY": "bench",
+        "SSM_PARAMS_PATH": "",
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        "AWS_ENDPOINT_URL_DYNAMODB": dynamodb.base_url,
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+    }
+    query = dict(it.split("=", 1) for it in args.query.split("&") if it)
+    event = {
+        "httpMethod": "GET",
+        "path": args.path,
+        "queryStringParameters": query or None,
+        "headers": {"Authorization": f"Bearer {args.token}"} if args.token else {},
+        "body": None,
+        "requestContext": {},
+    }
+    terms = [it for it in args.warm_terms.split(",") if it]
+    ping = {"source": "aws.events", "warmer": {"terms": terms}} if args.warm else None
+    userinfo_url = f"{server.base_url}/userinfo"
+
+    try:
+        runs = [run_once(event, ping, userinfo_url, env) for _ in range(args.runs)]
+    finally:
+        server.stop()
+        dynamodb.stop()
+
+    warm = {"warm": summarize([it["warm"] for it in runs])} if args.warm else {}
+
+    print(
+        json.dumps(
+            {
+                "path": args.path,
+                "runs": args.runs,
+                "statuses": sorted({it["status"] for it in runs}),
+                "import": summarize([it["import"] for it in runs]),
+                **warm,
+                "first_response": summarize([it["first_response"] for it in runs]),
+                "heavy_modules_loaded": runs[-1]["loaded"],
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
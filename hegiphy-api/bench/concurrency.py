@@ -0,0 +1,176 @@
+"""
+Compares how many concurrent requests the WSGI app (on a fixed pool of worker
+threads) and the ASGI app (on a single event loop) sustain when Giphy is slow,
+using a local Giphy stub. Every request uses a distinct search term, so none is
+served from the response cache.
+
+    python bench/concurrency.py --concurrency 200 --requests 1000 --latency 0.1
+"""
+
+from stubs import StubServer
+import argparse
+import statistics
+import subprocess
+import aiohttp
+import asyncio
+import socket
+import time
+import json
+import sys
+import os
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+WSGI_SERVER = """
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from app import APP
+import sys
+
+
+class QuietHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    request_queue_size = 1024
+    pool = ThreadPoolExecutor(max_workers=int(sys.argv[2]))
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+make_server(
+    "127.0.0.1", int(sys.argv[1]), APP, PooledWSGIServer, QuietHandler
+).serve_forever()
+"""
+
+ASGI_SERVER = """
+from asgi import application
+import uvicorn
+import sys
+
+uvicorn.run(
+    application, port=int(sys.argv[1]), log_level="warning", backlog=1024
+)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(source, port, threads, env):
+    process = subprocess.Popen(
+        [sys.executable, "-c", source, str(port), str(threads)], env=env, cwd=SRC_DIR
+    )
+
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+async def load(base_url, concurrency, total, limit, prefix):
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with aiohttp.ClientSession(connector=connector) as client:
+
+        async def one(i):
+            nonlocal errors
+
+            async with semaphore:
+                start = time.perf_counter()
+                async with client.get(
+                    f"{base_url}/giphy/query",
+                    params={"q": f"{prefix}{i}", "limit": limit},
+                ) as response:
+                    await response.read()
+
+                latencies.append(time.perf_counter() - start)
+
+                if response.status != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(total)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return {
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--limit", type=int, default=5, help="GIFs per page")
+    parser.add_argument("--threads", type=int, default=16, help="WSGI workers")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": SRC_DIR,
+        "GIPHY_BASE_URL": f"{stub.base_url}/v1",
+        "GIPHY_API_KEY": "bench",
+        "GIPHY_POOL_SIZE": str(args.concurrency),
+        "SSM_PARAMS_PATH": "",
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    }
+
+    results = {}
+
+    try:
+        for name, source in (("wsgi", WSGI_SERVER), ("asgi", ASGI_SERVER)):
+            port = free_port()
+            server = start_server(source, port, args.threads, env)
+
+            try:
+                results[name] = asyncio.run(
+                    load(
+                        f"http://127.0.0.1:{port}",
+                        args.concurrency,
+                        args.requests,
+                        args.limit,
+                        name,
+                    )
+                )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stub.stop()
+
+    print(json.dumps({"args": vars(args), **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
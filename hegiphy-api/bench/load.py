@@ -0,0 +1,407 @@
+"""
+Drives APP (through a WSGI test client) or lambda_handler.handler (with API
+Gateway events) with a weighted mix of trending, search, favorites list, tag
+filter and tag edit requests, against local Giphy, Auth0 and DynamoDB stubs with
+configurable latency. Reports latency percentiles, throughput and upstream calls
+per route, and compares two saved runs.
+
+    python bench/load.py run --target lambda --requests 2000 --save head.json
+    python bench/load.py compare base.json head.json --tolerance 0.1
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from stubs import DynamoDbStub, StubServer, api_gateway_event
+from urllib.parse import urlsplit
+import collections
+import threading
+import argparse
+import random
+import statistics
+import time
+import json
+import sys
+import os
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+TAGS = ["funny", "cats", "reaction", "work", "love"]
+
+DEFAULT_MIX = "trending=30,search=30,favorites=20,favorites_by_tag=10,tag_edit=10"
+
+# The route the current worker thread is driving, so that upstream calls made
+# while answering it are attributed to it.
+_ROUTE = threading.local()
+
+
+class Upstream:
+    def __init__(self):
+        self.calls = collections.defaultdict(collections.Counter)
+        # Calls made off the worker threads, by prefetches or refreshes for
+        # instance, once the table has been seeded.
+        self.default = "setup"
+        self._lock = threading.Lock()
+
+    def record(self, name):
+        with self._lock:
+            self.calls[getattr(_ROUTE, "name", self.default)][name] += 1
+
+
+def parse_mix(value):
+    mix = {}
+
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+
+    unknown = set(mix) - set(ROUTES)
+
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown routes: {', '.join(unknown)}")
+
+    return mix
+
+
+def trending(rng, args):
+    return "GET", "/giphy/trending", {"limit": "25"}, None
+
+
+def search(rng, args):
+    last = getattr(_ROUTE, "search", None)
+
+    # Some searches ask for the next page of the worker's previous one.
+    if last and rng.random() < args.page_through:
+        term, offset = last[0], last[1] + 25
+    else:
+        # A small vocabulary, so that popular terms repeat like in practice.
+        term, offset = f"term{int(rng.paretovariate(1.2)) % args.terms}", 0
+
+    _ROUTE.search = (term, offset)
+
+    return (
+        "GET",
+        "/giphy/query",
+        {"q": term, "offset": str(offset), "limit": "25"},
+        None,
+    )
+
+
+def favorites(rng, args):
+    return "GET", "/favorites", {"limit": "50"}, _user(rng, args)
+
+
+def favorites_by_tag(rng, args):
+    return "GET", "/favorites", {"tag": rng.choice(TAGS)}, _user(rng, args)
+
+
+def tag_edit(rng, args):
+    method = rng.choice(["POST", "DELETE"])
+    path = f"/favorites/gif{rng.randrange(args.favorites)}/tags/{rng.choice(TAGS)}"
+    return method, path, None, _user(rng, args)
+
+
+ROUTES = {
+    "trending": trending,
+    "search": search,
+    "favorites": favorites,
+    "favorites_by_tag": favorites_by_tag,
+    "tag_edit": tag_edit,
+}
+
+
+def _user(rng, args):
+    return f"user{rng.randrange(args.users)}"
+
+
+def app_driver():
+    from app import APP
+
+    clients = threading.local()
+
+    def call(method, path, query, token):
+        if not hasattr(clients, "client"):
+            clients.client = APP.test_client()
+
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = clients.client.open(
+            path, method=method, query_string=query, headers=headers
+        )
+        response.close()
+
+        return response.status_code
+
+    return call
+
+
+def lambda_driver():
+    import lambda_handler
+
+    def call(method, path, query, token):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        event = api_gateway_event(method, path, query, headers)
+
+        return int(lambda_handler.handler(event, None)["statusCode"])
+
+    return call
+
+
+def configure(giphy, auth0, dynamodb):
+    os.environ.update(
+        {
+            "GIPHY_BASE_URL": f"{giphy.base_url}/v1",
+            "GIPHY_API_KEY": "bench",
+            "SSM_PARAMS_PATH": "",
+            "AWS_ENDPOINT_URL_DYNAMODB": dynamodb.base_url,
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+        }
+    )
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    sys.path.insert(0, SRC_DIR)
+
+    import auth
+
+    # Auth0 is reached over https only; the stub speaks plain http.
+    auth._userinfo_url = lambda: f"{auth0.base_url}/userinfo"
+
+
+def instrument(upstream):
+    from requests.adapters import HTTPAdapter
+    import favorites_client
+
+    send = HTTPAdapter.send
+
+    def counting_send(self, request, **kwargs):
+        upstream.record(urlsplit(request.url).path)
+        return send(self, request, **kwargs)
+
+    HTTPAdapter.send = counting_send
+
+    favorites_client.get_client().meta.events.register(
+        "before-send.dynamodb",
+        lambda request, **kwargs: upstream.record(
+            "dynamodb " + request.headers["X-Amz-Target"].decode().split(".")[-1]
+        ),
+    )
+
+
+def seed(args):
+    from favorites_client import FavoritesClient
+
+    client = FavoritesClient()
+    rng = random.Random(args.seed)
+
+    for user in range(args.users):
+        client.create_favorites(
+            # The Auth0 stub answers with "<token>@bench.local".
+            f"user{user}@bench.local",
+            [
+                {"id": f"gif{it}", "tags": rng.sample(TAGS, rng.randrange(3))}
+                for it in range(args.favorites)
+            ],
+        )
+
+
+def percentile(latencies, n):
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0
+
+    return statistics.quantiles(latencies, n=100)[n - 1]
+
+
+def summarize(latencies, errors, elapsed, upstream):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "upstream": dict(sorted(upstream.items())),
+    }
+
+
+def run(args):
+    giphy = StubServer(latency=args.giphy_latency).start()
+    auth0 = StubServer(latency=args.auth_latency).start()
+    dynamodb = DynamoDbStub().start()
+
+    try:
+        configure(giphy, auth0, dynamodb)
+
+        upstream = Upstream()
+        call = app_driver() if args.target == "app" else lambda_driver()
+        instrument(upstream)
+        seed(args)
+        upstream.default = "background"
+
+        dynamodb.latency = args.dynamodb_latency
+        names = list(args.mix)
+        weights = list(args.mix.values())
+        latencies = collections.defaultdict(list)
+        errors = collections.Counter()
+        lock = threading.Lock()
+
+        def worker(index, count):
+            rng = random.Random(args.seed + index + 1)
+
+            for _ in range(count):
+                name = rng.choices(names, weights)[0]
+                request = ROUTES[name](rng, args)
+                _ROUTE.name = name
+
+                start = time.perf_counter()
+                status = call(*request)
+                elapsed = time.perf_counter() - start
+
+                with lock:
+                    latencies[name].append(elapsed)
+
+                    if status >= 400:
+                        errors[name] += 1
+
+        shares = [
+            args.requests // args.concurrency
+            + (1 if i < args.requests % args.concurrency else 0)
+            for i in range(args.concurrency)
+        ]
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for future in [
+                executor.submit(worker, i, it) for i, it in enumerate(shares)
+            ]:
+                future.result()
+
+        elapsed = time.perf_counter() - start
+    finally:
+        for stub in (giphy, auth0, dynamodb):
+            stub.stop()
+
+    routes = {
+        name: summarize(latencies[name], errors[name], elapsed, upstream.calls[name])
+        for name in names
+        if latencies[name]
+    }
+    total = summarize(
+        [it for values in latencies.values() for it in values],
+        sum(errors.values()),
+        elapsed,
+        sum((upstream.calls[name] for name in names), collections.Counter()),
+    )
+    settings = {k: v for k, v in vars(args).items() if k != "func"}
+    result = {
+        "args": settings,
+        "total": total,
+        "routes": routes,
+        "background_upstream": dict(sorted(upstream.calls["background"].items())),
+    }
+
+    import app
+
+    if app.PREFETCHER.initialized:
+        result["prefetch"] = app.PREFETCHER.stats()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+
+
+def _change(before, after):
+    return (after - before) / before if before else 0
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    regressions = []
+    report = {}
+
+    for name in head["routes"]:
+        if name not in base["routes"]:
+            continue
+
+        before = base["routes"][name]
+        after = head["routes"][name]
+        changes = {
+            key: round(_change(before[key], after[key]), 3)
+            for key in ("p50_ms", "p95_ms", "p99_ms", "requests_per_second")
+        }
+
+        # Upstream calls are compared per request, since runs may differ in size.
+        upstream = {
+            key: (
+                before["upstream"].get(key, 0) / before["requests"],
+                after["upstream"].get(key, 0) / after["requests"],
+            )
+            for key in sorted(set(before["upstream"]) | set(after["upstream"]))
+        }
+        report[name] = {
+            "change": changes,
+            "upstream_per_request": {
+                key: [round(it, 3) for it in rates] for key, rates in upstream.items()
+            },
+        }
+
+        for key, change in changes.items():
+            worse = -change if key == "requests_per_second" else change
+
+            if worse > args.tolerance:
+                regressions.append(f"{name} {key} {change:+.1%}")
+
+        for key, (rate_before, rate_after) in upstream.items():
+            if rate_after > rate_before * (1 + args.tolerance):
+                regressions.append(
+                    f"{name} {key} {rate_before:.3f} -> {rate_after:.3f} per request"
+                )
+
+    print(json.dumps({"routes": report, "regressions": regressions}, indent=2))
+
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.set_defaults(func=run)
+    run_parser.add_argument("--target", choices=["app", "lambda"], default="app")
+    run_parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    run_parser.add_argument("--requests", type=int, default=2000)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--giphy-latency", type=float, default=0.05)
+    run_parser.add_argument("--auth-latency", type=float, default=0.05)
+    run_parser.add_argument("--dynamodb-latency", type=float, default=0.005)
+    run_parser.add_argument("--users", type=int, default=20)
+    run_parser.add_argument("--favorites", type=int, default=100, help="per user")
+    run_parser.add_argument("--terms", type=int, default=200, help="search terms")
+    run_parser.add_argument(
+        "--page-through",
+        type=float,
+        default=0.3,
+        help="share of searches asking for the next page of the previous one",
+    )
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--save", help="write the results to this file")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.set_defaults(func=compare)
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="allowed relative slowdown"
+    )
+
+    args = parser.parse_args()
+
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares JSON encode time and response size on realistic payloads: a page of
+favorites, the same page expanded with Giphy metadata, and a Giphy search page.
+Encoders are the standard library provider and the orjson provider; sizes are
+reported raw, gzipped and brotli compressed.
+
+    PYTHONPATH=src python bench/serialization.py --favorites 100 --gifs 50 --iterations 200
+"""
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from stubs import gif, page
+import argparse
+import timeit
+import json
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from compression import _ENCODERS  # noqa: E402
+from json_provider import OrjsonProvider, orjson  # noqa: E402
+
+
+def favorites(count, expand=False):
+    items = [{"id": f"gif{i}", "tags": ["funny", f"tag{i % 7}"]} for i in range(count)]
+
+    if expand:
+        items = [{**it, "gif": gif(it["id"])} for it in items]
+
+    return items
+
+
+def measure(provider, payload, iterations):
+    seconds = timeit.timeit(lambda: provider.dumps(payload), number=iterations)
+    return round(seconds / iterations * 1000, 3)
+
+
+def sizes(body):
+    result = {"raw": len(body)}
+
+    for name, encode in _ENCODERS.items():
+        seconds = timeit.timeit(lambda: encode(body), number=10) / 10
+        result[name] = {"bytes": len(encode(body)), "ms": round(seconds * 1000, 3)}
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--favorites", type=int, default=100)
+    parser.add_argument("--gifs", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = {"json": DefaultJSONProvider(app)}
+
+    if orjson:
+        providers["orjson"] = OrjsonProvider(app)
+
+    payloads = {
+        "favorites": favorites(args.favorites),
+        "favorites_expanded": favorites(args.favorites, expand=True),
+        "giphy_search": page([f"cat{i}" for i in range(args.gifs)]),
+    }
+
+    results = {}
+
+    for name, payload in payloads.items():
+        results[name] = {
+            "encode_ms": {
+                provider_name: measure(provider, payload, args.iterations)
+                for provider_name, provider in providers.items()
+            },
+            "size": sizes(providers["json"].dumps(payload).encode("utf-8")),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
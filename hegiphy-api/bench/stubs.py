@@ -0,0 +1,456 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import collections
+import threading
+import json
+import time
+
+RENDITIONS = [
+    "original",
+    "original_still",
+    "fixed_height",
+    "fixed_height_still",
+    "fixed_height_downsampled",
+    "fixed_height_small",
+    "fixed_height_small_still",
+    "fixed_width",
+    "fixed_width_still",
+    "fixed_width_downsampled",
+    "fixed_width_small",
+    "fixed_width_small_still",
+    "downsized",
+    "downsized_still",
+    "preview_gif",
+]
+
+
+def gif(id):
+    base = f"https://media.giphy.com/media/{id}"
+
+    return {
+        "type": "gif",
+        "id": id,
+        "url": f"https://giphy.com/gifs/{id}",
+        "slug": f"funny-cat-{id}",
+        "bitly_url": f"https://gph.is/{id}",
+        "embed_url": f"https://giphy.com/embed/{id}",
+        "username": "",
+        "source": "",
+        "title": f"Funny Cat GIF {id}",
+        "rating": "g",
+        "import_datetime": "2020-01-01 00:00:00",
+        "trending_datetime": "0000-00-00 00:00:00",
+        "images": {
+            name: {
+                "url": f"{base}/{name}.gif",
+                "width": "200",
+                "height": "200",
+                "size": "123456",
+                "mp4": f"{base}/{name}.mp4",
+                "mp4_size": "65432",
+                "webp": f"{base}/{name}.webp",
+                "webp_size": "54321",
+            }
+            for name in RENDITIONS
+        },
+    }
+
+
+def page(ids, offset=0, total_count=10000):
+    return {
+        "data": [gif(id) for id in ids],
+        "pagination": {"total_count": total_count, "count": len(ids), "offset": offset},
+        "meta": {"status": 200, "msg": "OK", "response_id": "bench"},
+    }
+
+
+# Local stand-in for the Giphy API and Auth0's /userinfo endpoint. Responses are
+# delayed by `latency` seconds, and calls per path and accepted connections are
+# counted so that benchmarks can report upstream usage.
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0, port=0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.connections = 0
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def record(self, path):
+        with self._lock:
+            self.calls[path] += 1
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+            self.calls.clear()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        self.server.record(url.path)
+        time.sleep(self.server.latency)
+
+        if url.path.endswith("/userinfo"):
+            token = self.headers.get("Authorization", "").split()[-1]
+            return self._send({"email": f"{token}@bench.local"})
+
+        if url.path.endswith("/gifs/trending") or url.path.endswith("/gifs/search"):
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 25))
+            ids = [
+                f"{query.get('q', 'trending')}{i}"
+                for i in range(offset, offset + limit)
+            ]
+            return self._send(page(ids, offset))
+
+        if url.path.endswith("/gifs"):
+            return self._send(page(query.get("ids", "").split(","), total_count=0))
+
+        self._send({"meta": {"status": 404, "msg": "Not Found"}}, 404)
+
+    def _send(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConditionalCheckFailed(Exception):
+    def __init__(self, item=None):
+        super().__init__()
+        self.item = item
+
+
+class TransactionCanceled(Exception):
+    def __init__(self, reasons):
+        super().__init__()
+        self.reasons = reasons
+
+
+def _split(expression, separator):
+    # Splits on `separator` outside of parentheses.
+    parts, depth, start = [], 0, 0
+
+    for i, char in enumerate(expression):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+
+        if not depth and expression.startswith(separator, i):
+            parts.append(expression[start:i])
+            start = i + len(separator)
+
+    return parts + [expression[start:]]
+
+
+# Local, in-memory stand-in for the DynamoDB API, reached by pointing boto3 at
+# it (AWS_ENDPOINT_URL_DYNAMODB). It understands the operations and the few
+# expression forms FavoritesClient uses, and nothing more. Responses are delayed
+# by `latency` seconds and calls per operation are counted.
+class DynamoDbStub(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0, port=0):
+        super().__init__(("127.0.0.1", port), DynamoDbHandler)
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.items = collections.defaultdict(dict)
+        self._lock = threading.Lock()
+
+    base_url = StubServer.base_url
+    start = StubServer.start
+    stop = StubServer.stop
+
+    def call(self, operation, request):
+        with self._lock:
+            self.calls[operation] += 1
+            return getattr(self, operation)(request)
+
+    def _get(self, key):
+        return self.items[key["pk"]["S"]].get(key["sk"]["S"])
+
+    def _put(self, item):
+        self.items[item["pk"]["S"]][item["sk"]["S"]] = item
+
+    def _delete(self, key):
+        return self.items[key["pk"]["S"]].pop(key["sk"]["S"], None)
+
+    def _evaluate(self, condition, item, names, values):
+        condition = condition.strip()
+
+        for separator, combine in ((" OR ", any), (" AND ", all)):
+            parts = _split(condition, separator)
+
+            if len(parts) > 1:
+                return combine(self._evaluate(it, item, names, values) for it in parts)
+
+        if condition.startswith("NOT "):
+            return not self._evaluate(condition[4:], item, names, values)
+
+        if condition.startswith("("):
+            return self._evaluate(condition[1:-1], item, names, values)
+
+        def attribute(name):
+            return item.get(names.get(name, name))
+
+        # "#name = :value" or "size(#name) < :value"
+        if " = " in condition or " < " in condition:
+            name, operator, value = condition.split()
+            value = values[value]
+
+            if operator == "<":
+                current = attribute(name[len("size(") : -1]) or {"SS": []}
+                return len(current["SS"]) < int(value["N"])
+
+            current = attribute(name)
+
+            if current and "SS" in current:
+                return set(current["SS"]) == set(value["SS"])
+
+            return current == value
+
+        # attribute_exists(#name), attribute_not_exists(#name) or
+        # contains(#name, :value)
+        function, arguments = condition[:-1].split("(")
+        arguments = [it.strip() for it in arguments.split(",")]
+        current = attribute(arguments[0])
+
+        if function == "attribute_exists":
+            return current is not None
+        elif function == "attribute_not_exists":
+            return current is None
+
+        return current is not None and values[arguments[1]]["S"] in current["SS"]
+
+    def _check(self, request, item):
+        condition = request.get("ConditionExpression")
+
+        if condition is not None and not self._evaluate(
+            condition,
+            item or {},
+            request.get("ExpressionAttributeNames", {}),
+            request.get("ExpressionAttributeValues", {}),
+        ):
+            raise ConditionalCheckFailed(
+                item
+                if item
+                and request.get("ReturnValuesOnConditionCheckFailure") == "ALL_OLD"
+                else None
+            )
+
+    def _capacity(self, request, units=1.0):
+        if request.get("ReturnConsumedCapacity", "NONE") == "NONE":
+            return {}
+
+        return {"ConsumedCapacity": {"TableName": "hegiphy", "CapacityUnits": units}}
+
+    def _returned(self, request, old, new):
+        values = request.get("ReturnValues", "NONE")
+        item = old if values == "ALL_OLD" else new if values == "ALL_NEW" else None
+
+        return {"Attributes": item} if item else {}
+
+    def GetItem(self, request):
+        item = self._get(request["Key"])
+        return {**({"Item": item} if item else {}), **self._capacity(request, 0.5)}
+
+    def PutItem(self, request):
+        item = request["Item"]
+        old = self._get(item)
+        self._check(request, old)
+        self._put(item)
+
+        return {**self._returned(request, old, item), **self._capacity(request)}
+
+    def DeleteItem(self, request):
+        old = self._get(request["Key"])
+        self._check(request, old)
+        self._delete(request["Key"])
+
+        return {**self._returned(request, old, None), **self._capacity(request)}
+
+    def UpdateItem(self, request):
+        key = request["Key"]
+        old = self._get(key)
+        self._check(request, old)
+
+        # "ADD #name :value" or "DELETE #name :value"
+        action, name, value = request["UpdateExpression"].split()
+        name = request.get("ExpressionAttributeNames", {}).get(name, name)
+        value = request["ExpressionAttributeValues"][value]
+        item = dict(old or key)
+
+        if "N" in value:
+            current = float(item.get(name, {"N": "0"})["N"])
+            item[name] = {"N": f"{current + float(value['N']):g}"}
+        else:
+            current = set(item.get(name, {"SS": []})["SS"])
+            current = current | set(value["SS"]) if action == "ADD" else current
+            current = current - set(value["SS"]) if action == "DELETE" else current
+
+            if current:
+                item[name] = {"SS": sorted(current)}
+            else:
+                item.pop(name, None)
+
+        self._put(item)
+
+        return {**self._returned(request, old, item), **self._capacity(request)}
+
+    def TransactWriteItems(self, request):
+        operations = {"Put": self.PutItem, "Delete": self.DeleteItem}
+        writes = []
+        reasons = []
+
+        for transact_item in request["TransactItems"]:
+            ((operation, write),) = transact_item.items()
+            key = write.get("Key", write.get("Item"))
+            old = self._get(key)
+            writes.append((operations.get(operation, self.UpdateItem), write))
+
+            try:
+                self._check(write, old)
+                reasons.append({"Code": "None"})
+            except ConditionalCheckFailed as e:
+                reason = {"Code": "ConditionalCheckFailed"}
+
+                if e.item:
+                    reason["Item"] = e.item
+
+                reasons.append(reason)
+
+        if any(it["Code"] != "None" for it in reasons):
+            raise TransactionCanceled(reasons)
+
+        for apply, write in writes:
+            apply({k: v for k, v in write.items() if k != "ConditionExpression"})
+
+        return {}
+
+    def Query(self, request):
+        # "pk = :value" or "pk = :value AND sk = :value"
+        values = request["ExpressionAttributeValues"]
+        conditions = dict(
+            [it.strip() for it in part.split("=")]
+            for part in request["KeyConditionExpression"].split(" AND ")
+        )
+        partition = self.items[values[conditions["pk"]]["S"]]
+        keys = sorted(partition)
+
+        if "sk" in conditions:
+            keys = [it for it in keys if it == values[conditions["sk"]]["S"]]
+
+        if "ExclusiveStartKey" in request:
+            keys = [it for it in keys if it > request["ExclusiveStartKey"]["sk"]["S"]]
+
+        limit = request.get("Limit")
+        page = keys[:limit] if limit else keys
+        response = {"Items": [partition[it] for it in page], "Count": len(page)}
+
+        if limit and len(keys) > limit:
+            response["LastEvaluatedKey"] = {
+                "pk": partition[page[-1]]["pk"],
+                "sk": partition[page[-1]]["sk"],
+            }
+
+        return {**response, **self._capacity(request, max(0.5, len(page) / 40))}
+
+    def BatchGetItem(self, request):
+        return {
+            "Responses": {
+                table: [it for it in map(self._get, keys["Keys"]) if it]
+                for table, keys in request["RequestItems"].items()
+            },
+            "UnprocessedKeys": {},
+        }
+
+    def BatchWriteItem(self, request):
+        for writes in request["RequestItems"].values():
+            for write in writes:
+                if "PutRequest" in write:
+                    self._put(write["PutRequest"]["Item"])
+                else:
+                    self._delete(write["DeleteRequest"]["Key"])
+
+        return {"UnprocessedItems": {}}
+
+
+class DynamoDbHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        operation = self.headers["X-Amz-Target"].split(".")[-1]
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        time.sleep(self.server.latency)
+
+        try:
+            self._send(self.server.call(operation, request))
+        except ConditionalCheckFailed as e:
+            self._send(
+                {
+                    "__type": "com.amazonaws.dynamodb.v20120810"
+                    "#ConditionalCheckFailedException",
+                    "message": "The conditional request failed",
+                    **({"Item": e.item} if e.item else {}),
+                },
+                400,
+            )
+        except TransactionCanceled as e:
+            self._send(
+                {
+                    "__type": "com.amazonaws.dynamodb.v20120810"
+                    "#TransactionCanceledException",
+                    "message": "Transaction cancelled",
+                    "CancellationReasons": e.reasons,
+                },
+                400,
+            )
+
+    _send = StubHandler._send
+
+    def log_message(self, *args):
+        pass
+
+
+def api_gateway_event(method, path, query=None, headers=None, body=None):
+    return {
+        "httpMethod": method,
+        "path": path,
+        "queryStringParameters": query,
+        "headers": headers or {},
+        "body": body,
+        "requestContext": {},
+    }
@@ -1,24 +1,106 @@
-from flask import Flask, jsonify, g, request, Response
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import Flask, jsonify, g, request, Response, json
 from flask_cors import CORS
 from auth import requires_auth
 from error import HttpException
 from giphy_client import GiphyClient
-from favorites_client import FavoritesClient, FavoriteNotFoundException
-from marshmallow import Schema, fields, validate, ValidationError
+from gif_cache import GifMetadataCache
+from compression import compress_response, configured_encodings
+from favorites_cache import FavoritesCache
+from favorites_client import (
+    FavoritesClient,
+    FavoriteNotFoundException,
+    InvalidCursorException,
+    TooManyTagsException,
+)
+from json_provider import JSON_PROVIDER_CLASS
+from lazy import Lazy
+from prefetch import Prefetcher
+from projection import parse_names, project_response
+from recent_terms import RecentTerms
+from response_cache import MemoryBackend, ResponseCache
 import config
+import contextvars
+import hashlib
+import metrics
+
+
+# Clients and caches are built on first use so that a cold start does not pay
+# for SSM lookups or boto3 clients that the request being served never needs.
+def create_giphy_client(client_class):
+    return client_class(
+        config.get("giphy_base_url"),
+        lambda: config.get("giphy_api_key"),
+        pool_size=int(config.get("giphy_pool_size")),
+        connect_timeout=float(config.get("giphy_connect_timeout")),
+        read_timeout=float(config.get("giphy_read_timeout")),
+        max_retries=int(config.get("giphy_max_retries")),
+        retry_backoff=float(config.get("giphy_retry_backoff")),
+    )
 
-GIPHY_CLIENT = GiphyClient(config.get("giphy_base_url"), config.get("giphy_api_key"))
-FAVORITES_CLIENT = FavoritesClient()
 
-APP = Flask(__name__)
-CORS(APP)
+def create_favorites_cache():
+    ttl = float(config.get("favorites_cache_ttl"))
+
+    if ttl <= 0:
+        return None
 
-MAX_TAG_LENGTH = 140
+    return FavoritesCache(ttl, int(config.get("favorites_cache_size")))
 
 
-class FavoriteSchema(Schema):
-    id = fields.String(required=True, validates=validate.Length(max=1024))
-    tags = fields.List(fields.String(validates=validate.Length(max=MAX_TAG_LENGTH)))
+GIPHY_CLIENT = Lazy(lambda: create_giphy_client(GiphyClient))
+
+FAVORITES_CLIENT = Lazy(lambda: FavoritesClient(cache=create_favorites_cache()))
+
+GIPHY_QUERY_EXECUTOR = Lazy(
+    lambda: ThreadPoolExecutor(max_workers=int(config.get("giphy_batch_workers")))
+)
+
+GIF_CACHE = Lazy(
+    lambda: GifMetadataCache(
+        GIPHY_CLIENT,
+        ttl=float(config.get("gif_cache_ttl")),
+        max_bytes=int(config.get("gif_cache_max_bytes")),
+        max_ids_per_request=int(config.get("giphy_max_ids_per_request")),
+        max_workers=int(config.get("giphy_fetch_workers")),
+    )
+)
+
+GIPHY_CACHE = Lazy(
+    lambda: ResponseCache(
+        MemoryBackend(int(config.get("giphy_cache_max_bytes"))),
+        ttls={
+            "trending": float(config.get("giphy_cache_trending_ttl")),
+            "query": float(config.get("giphy_cache_query_ttl")),
+        },
+        stale_ttl=float(config.get("giphy_cache_stale_ttl")),
+    )
+)
+
+PREFETCHER = Lazy(
+    lambda: Prefetcher(
+        max_in_flight=int(config.get("giphy_prefetch_workers")),
+        budget=int(config.get("giphy_prefetch_budget")),
+        ttl=float(config.get("giphy_cache_query_ttl")),
+        max_size=int(config.get("giphy_prefetch_terms")),
+    )
+)
+
+RECENT_TERMS = Lazy(lambda: RecentTerms(int(config.get("recent_terms_size"))))
+
+APP = Flask(__name__)
+APP.json = JSON_PROVIDER_CLASS(APP)
+CORS(APP, expose_headers=["ETag", "X-Next-Cursor"])
+
+DEFAULT_PAGE_SIZE = 100
+MAX_BULK_ITEMS = 100
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_QUERIES = 20
+# Giphy rejects search offsets above this.
+MAX_GIPHY_OFFSET = 4999
+DEFAULT_POPULAR_SIZE = 25
+# Each id costs a read per counter shard: 100 reads, one batch, with 10 shards.
+MAX_COUNTED_IDS = 10
 
 
 @APP.errorhandler(HttpException)
@@ -28,16 +110,163 @@ def handler_unauthenticated(e):
     return response
 
 
+@APP.before_request
+def start_metrics():
+    rule = request.url_rule
+    metrics.start(f"{request.method} {rule.rule}" if rule else "unmatched")
+
+
+# Registered before compress so that it runs after it, timing the whole request.
+@APP.after_request
+def finish_metrics(response):
+    return metrics.finish(response)
+
+
+@APP.after_request
+def compress(response):
+    encodings = configured_encodings()
+
+    if not encodings:
+        return response
+
+    return compress_response(
+        response, encodings, int(config.get("response_compression_min_size"))
+    )
+
+
+def _load_favorites(data, many=False):
+    from marshmallow import ValidationError
+    from schemas import FavoriteSchema
+
+    try:
+        return FavoriteSchema(many=many).load(data)
+    except ValidationError as err:
+        raise HttpException(err.messages, 400)
+
+
+def _validate_tag(tag):
+    from schemas import MAX_TAG_LENGTH
+
+    if len(tag) > MAX_TAG_LENGTH:
+        raise HttpException(f"maximum tag length is {MAX_TAG_LENGTH}", 400)
+
+
+def _int_arg(name, default=None, args=None):
+    value = (request.args if args is None else args).get(name)
+
+    if value is None or value == "":
+        return default
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HttpException(f'the "{name}" parameter must be an integer', 400)
+
+
+def _str_arg(name, default, args=None):
+    value = (request.args if args is None else args).get(name, default)
+
+    # Batch queries are read from a JSON body, where any type may be sent.
+    if not isinstance(value, str):
+        raise HttpException(f'the "{name}" parameter must be a string', 400)
+
+    return value
+
+
+def _lower_arg(name, default, args=None):
+    return _str_arg(name, default, args).strip().lower()
+
+
+def projection_args():
+    return {
+        "fields": parse_names(request.args.get("fields")),
+        "renditions": parse_names(request.args.get("renditions")),
+    }
+
+
+def _expand_gifs(favorites):
+    gifs = GIF_CACHE.get_many([it["id"] for it in favorites])
+    return [{**it, "gif": gifs.get(it["id"])} for it in favorites]
+
+
+def _list_favorites_page(user, tag, limit, cursor, expand):
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+
+    try:
+        if tag:
+            items, next_cursor = FAVORITES_CLIENT.find_page_by_user_and_tag(
+                user, tag, limit, cursor
+            )
+        else:
+            items, next_cursor = FAVORITES_CLIENT.find_page_by_user(user, limit, cursor)
+    except InvalidCursorException:
+        raise HttpException('the "cursor" parameter is invalid', 400)
+
+    if expand:
+        items = _expand_gifs(items)
+
+    response = jsonify(items)
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return response
+
+
+def _favorites_etag(user, version):
+    # The version changes with every write to the user's favorites, so it
+    # stands in for the list itself and a match needs no read of the partition.
+    return hashlib.sha256(
+        f"{user}\n{version}\n{request.full_path}".encode()
+    ).hexdigest()
+
+
+def _favorites_response(user, tag, limit, cursor, expand, version):
+    if limit is not None or cursor:
+        return _list_favorites_page(user, tag, limit, cursor, expand)
+
+    # Cached lists are only served if they were read at the version the ETag
+    # is made from, so that the body is never older than the ETag says.
+    if tag:
+        favorites = FAVORITES_CLIENT.find_by_user_and_tag(user, tag, version)
+    else:
+        favorites = FAVORITES_CLIENT.find_by_user(user, version)
+
+    return jsonify(_expand_gifs(favorites) if expand else favorites)
+
+
 @APP.route("/favorites", methods=["GET"])
 @requires_auth
 def list_favorites():
     tag = request.args.get("tag")
+    limit = _int_arg("limit")
+    cursor = request.args.get("cursor")
+    expand = request.args.get("expand")
     user = g.get("current_user")
 
-    if tag:
-        return jsonify(FAVORITES_CLIENT.find_by_user_and_tag(user, tag))
+    if expand not in (None, "gif"):
+        raise HttpException('the "expand" parameter only supports "gif"', 400)
+
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HttpException(
+            f'the "limit" parameter must be between 1 and {MAX_PAGE_SIZE}', 400
+        )
+
+    version = FAVORITES_CLIENT.get_version(user)
+    etag = _favorites_etag(user, version)
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = _favorites_response(user, tag, limit, cursor, expand, version)
 
-    return jsonify(FAVORITES_CLIENT.find_by_user(user))
+    response.set_etag(etag)
+    # Favorites are private to the caller and must be revalidated every time.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response
 
 
 @APP.route("/favorites", methods=["POST"])
@@ -46,14 +275,50 @@ def create_favorite():
     data = request.json
     user = g.get("current_user")
 
-    try:
-        data = FavoriteSchema().load(data)
-    except ValidationError as err:
-        raise HttpException(err.messages, 400)
+    data = _load_favorites(data)
 
     return FAVORITES_CLIENT.create_favorite(user, data), 201
 
 
+def _load_bulk_favorites():
+    favorites = _load_favorites(request.json, many=True)
+
+    if not favorites:
+        raise HttpException("at least one favorite is required", 400)
+
+    if len(favorites) > MAX_BULK_ITEMS:
+        raise HttpException(f"at most {MAX_BULK_ITEMS} favorites may be sent", 400)
+
+    return favorites
+
+
+@APP.route("/favorites/bulk", methods=["POST"])
+@requires_auth
+def create_favorites():
+    user = g.get("current_user")
+    favorites = _load_bulk_favorites()
+
+    return jsonify({"results": FAVORITES_CLIENT.create_favorites(user, favorites)})
+
+
+@APP.route("/favorites/bulk/get", methods=["POST"])
+@requires_auth
+def get_favorites():
+    user = g.get("current_user")
+    ids = [it["id"] for it in _load_bulk_favorites()]
+
+    return jsonify({"results": FAVORITES_CLIENT.find_by_ids_and_user(ids, user)})
+
+
+@APP.route("/favorites/bulk/delete", methods=["POST"])
+@requires_auth
+def delete_favorites():
+    user = g.get("current_user")
+    ids = [it["id"] for it in _load_bulk_favorites()]
+
+    return jsonify({"results": FAVORITES_CLIENT.delete_favorites(user, ids)})
+
+
 @APP.route("/favorites/<id>", methods=["GET"])
 @requires_auth
 def get_favorite(id):
@@ -80,13 +345,16 @@ def delete_favorite(id):
 def add_tag(id, tag):
     user = g.get("current_user")
 
-    if len(tag) > MAX_TAG_LENGTH:
-        raise HttpException(f"maximum tag length is {MAX_TAG_LENGTH}", 400)
+    _validate_tag(tag)
 
     try:
         return jsonify(FAVORITES_CLIENT.add_tag_to_favorite(id, user, tag))
     except FavoriteNotFoundException:
         raise HttpException(f"favorite with id {id} not found", 404)
+    except TooManyTagsException:
+        from schemas import MAX_TAGS
+
+        raise HttpException(f"maximum number of tags is {MAX_TAGS}", 400)
 
 
 @APP.route("/favorites/<id>/tags/<tag>", methods=["DELETE"])
@@ -94,8 +362,7 @@ def add_tag(id, tag):
 def delete_tag(id, tag):
     user = g.get("current_user")
 
-    if len(tag) > MAX_TAG_LENGTH:
-        raise HttpException(f"maximum tag length is {MAX_TAG_LENGTH}", 400)
+    _validate_tag(tag)
 
     try:
         return jsonify(FAVORITES_CLIENT.remove_tag_from_favorite(id, user, tag))
@@ -103,40 +370,222 @@ def delete_tag(id, tag):
         raise HttpException(f"favorite with id {id} not found", 404)
 
 
-@APP.route("/giphy/query", methods=["GET"])
-def query_giphy():
-    term = request.args.get("q")
+def _popularity_response(data):
+    # Popularity changes slowly and is the same for every caller, so it may be
+    # cached by anyone for a little while.
+    response = jsonify(data)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(float(config.get("popularity_cache_ttl")))
+
+    return response
+
+
+@APP.route("/popular", methods=["GET"])
+def get_most_favorited():
+    limit = _int_arg("limit", DEFAULT_POPULAR_SIZE)
+    size = int(config.get("leaderboard_size"))
+
+    if not 1 <= limit <= size:
+        raise HttpException(f'the "limit" parameter must be between 1 and {size}', 400)
+
+    return _popularity_response(FAVORITES_CLIENT.find_most_favorited(limit))
+
+
+@APP.route("/popular/counts", methods=["GET"])
+@requires_auth
+def get_favorite_counts():
+    ids = gif_ids_arg()
+
+    if len(ids) > MAX_COUNTED_IDS:
+        raise HttpException(f"at most {MAX_COUNTED_IDS} ids may be sent", 400)
+
+    response = jsonify(FAVORITES_CLIENT.count_favorites(ids))
+    # Only callers that are signed in may read the counts, so shared caches
+    # must not serve them.
+    response.cache_control.private = True
+    response.cache_control.max_age = int(float(config.get("popularity_cache_ttl")))
+
+    return response
+
+
+def remember_gifs(text):
+    GIF_CACHE.add_from_response(text)
+    return text
+
+
+def giphy_query_params(args=None):
+    term = " ".join(_str_arg("q", "", args).lower().split())
 
     if not term:
         raise HttpException('the "q" parameter is required', 400)
 
-    offset = request.args.get("offset", 0)
-    limit = request.args.get("limit", 25)
-    rating = request.args.get("rating", "G")
-    lang = request.args.get("lang", "en")
+    return {
+        "term": term,
+        "offset": _int_arg("offset", 0, args),
+        "limit": _int_arg("limit", 25, args),
+        "rating": _lower_arg("rating", "G", args),
+        "lang": _lower_arg("lang", "en", args),
+    }
+
+
+def giphy_trending_params():
+    return {"limit": _int_arg("limit"), "rating": _lower_arg("rating", "G")}
+
+
+def gif_ids_arg():
+    ids = [it.strip() for it in request.args.get("ids", "").split(",") if it.strip()]
+
+    if not ids:
+        raise HttpException('the "ids" query parameter is required', 400)
+
+    return ids
+
+
+def load_query(params, projection):
+    return project_response(remember_gifs(GIPHY_CLIENT.query(**params)), **projection)
+
+
+def _query_giphy(params, projection):
+    return GIPHY_CACHE.get_or_load(
+        "query", {**params, **projection}, lambda: load_query(params, projection)
+    )
+
+
+def prefetch_next_page(params, projection):
+    # Users paging through results nearly always ask for the next page, so it
+    # is loaded into the response cache while they look at this one. Loads run
+    # after the response is sent, which on Lambda is while the container is
+    # frozen, so this is meant for servers that keep running between requests.
+    if (
+        int(config.get("giphy_prefetch_workers")) <= 0
+        or float(config.get("giphy_cache_query_ttl")) <= 0
+    ):
+        return
+
+    key = GIPHY_CACHE.make_key("query", {**params, **projection})
+    PREFETCHER.served(key)
+
+    next_params = {**params, "offset": params["offset"] + params["limit"]}
+    cache_params = {**next_params, **projection}
+
+    if next_params["offset"] > MAX_GIPHY_OFFSET or GIPHY_CACHE.is_fresh(
+        "query", cache_params
+    ):
+        return
+
+    PREFETCHER.submit(
+        GIPHY_CACHE.make_key("query", cache_params),
+        params["term"],
+        lambda: GIPHY_CACHE.put(
+            "query", cache_params, load_query(next_params, projection)
+        ),
+    )
+
+
+def giphy_response(text, max_age):
+    response = Response(text, mimetype="application/json")
+    response.cache_control.public = True
+    response.cache_control.max_age = int(max_age)
+    response.add_etag()
+
+    return response.make_conditional(request)
+
+
+@APP.route("/giphy/query", methods=["GET"])
+def query_giphy():
+    params = giphy_query_params()
+    projection = projection_args()
+    text = _query_giphy(params, projection)
+    RECENT_TERMS.record(params["term"])
+    prefetch_next_page(params, projection)
+
+    return giphy_response(text, float(config.get("giphy_cache_query_ttl")))
+
+
+def _query_error(e):
+    status_code = getattr(getattr(e, "response", None), "status_code", None)
+    return {"error": "the Giphy search failed", "status": status_code or 502}
+
+
+@APP.route("/giphy/query/batch", methods=["POST"])
+def batch_query_giphy():
+    queries = (request.json or {}).get("queries")
 
+    if not isinstance(queries, list) or not queries:
+        raise HttpException('the "queries" list is required', 400)
+
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HttpException(f"at most {MAX_BATCH_QUERIES} queries may be sent", 400)
+
+    if not all(isinstance(it, dict) for it in queries):
+        raise HttpException("each query must be an object", 400)
+
+    params = [giphy_query_params(it) for it in queries]
+    terms = [it["q"] for it in queries]
+
+    if len(set(terms)) != len(terms):
+        raise HttpException("each term may only be queried once", 400)
+
+    projection = projection_args()
+
+    futures = {
+        # Running in a copy of the request's context lets the searches record
+        # their timings against it.
+        term: GIPHY_QUERY_EXECUTOR.submit(
+            contextvars.copy_context().run, _query_giphy, it, projection
+        )
+        for term, it in zip(terms, params)
+    }
+    done, _ = wait(futures.values(), timeout=float(config.get("giphy_batch_deadline")))
+
+    results = {}
+    errors = {}
+
+    for term, future in futures.items():
+        if future not in done:
+            future.cancel()
+            errors[term] = {"error": "the Giphy search timed out", "status": 504}
+        elif future.exception() is not None:
+            errors[term] = _query_error(future.exception())
+        else:
+            results[term] = future.result()
+
+    # Cached search results are already serialized, so they are spliced into
+    # the response rather than parsed and encoded again.
     return Response(
-        GIPHY_CLIENT.query(term, offset, limit, rating, lang),
+        '{"results":{%s},"errors":%s}'
+        % (
+            ",".join(f"{json.dumps(k)}:{v}" for k, v in results.items()),
+            json.dumps(errors),
+        ),
         mimetype="application/json",
     )
 
 
+def load_trending(params, projection):
+    return project_response(
+        remember_gifs(GIPHY_CLIENT.get_trending(**params)), **projection
+    )
+
+
 @APP.route("/giphy/trending", methods=["GET"])
 def get_trending_giphy():
-    limit = request.args.get("limit")
-    rating = request.args.get("rating", "G")
-
-    return Response(
-        GIPHY_CLIENT.get_trending(limit=limit, rating=rating),
-        mimetype="application/json",
+    params = giphy_trending_params()
+    projection = projection_args()
+
+    return giphy_response(
+        GIPHY_CACHE.get_or_load(
+            "trending",
+            {**params, **projection},
+            lambda: load_trending(params, projection),
+        ),
+        float(config.get("giphy_cache_trending_ttl")),
     )
 
 
 @APP.route("/giphy/gifs", methods=["GET"])
 def get_images_by_ids():
-    ids = request.args.get("ids")
-
-    if not ids:
-        raise HttpException('the "ids" query parameter is required', 400)
-
-    return Response(GIPHY_CLIENT.get_by_ids(ids), mimetype="application/json")
+    return giphy_response(
+        project_response(GIF_CACHE.get_response(gif_ids_arg()), **projection_args()),
+        float(config.get("gif_cache_ttl")),
+    )
@@ -0,0 +1,231 @@
+from app import (
+    APP,
+    GIF_CACHE,
+    GIPHY_CACHE,
+    RECENT_TERMS,
+    create_giphy_client,
+    gif_ids_arg,
+    giphy_query_params,
+    giphy_response,
+    giphy_trending_params,
+    prefetch_next_page,
+    projection_args,
+    remember_gifs,
+)
+from async_giphy_client import AsyncGiphyClient
+from concurrent.futures import ThreadPoolExecutor
+from lazy import Lazy
+from projection import project_response
+from werkzeug.exceptions import HTTPException as WerkzeugHttpException
+from werkzeug.test import EnvironBuilder
+import aiohttp
+import asyncio
+import config
+import contextvars
+import auth
+
+# The Giphy routes and the auth check run on the event loop. Every other route
+# (the favorites routes, whose DynamoDB calls block) is handed to the Flask app
+# on a thread pool, after the caller has been authenticated asynchronously.
+GIPHY_CLIENT = Lazy(lambda: create_giphy_client(AsyncGiphyClient))
+HTTP_CLIENT = Lazy(
+    lambda: aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(
+            sock_connect=float(config.get("giphy_connect_timeout")),
+            sock_read=float(config.get("giphy_read_timeout")),
+        )
+    )
+)
+SYNC_EXECUTOR = Lazy(
+    lambda: ThreadPoolExecutor(max_workers=int(config.get("asgi_sync_workers")))
+)
+
+
+async def query_giphy():
+    params = giphy_query_params()
+    projection = projection_args()
+
+    async def load():
+        text = await GIPHY_CLIENT.query(**params)
+        return project_response(remember_gifs(text), **projection)
+
+    text = await GIPHY_CACHE.get_or_load_async("query", {**params, **projection}, load)
+    RECENT_TERMS.record(params["term"])
+    # Prefetches run on their own threads, with the blocking client.
+    prefetch_next_page(params, projection)
+
+    return giphy_response(text, float(config.get("giphy_cache_query_ttl")))
+
+
+async def get_trending_giphy():
+    params = giphy_trending_params()
+    projection = projection_args()
+
+    async def load():
+        text = await GIPHY_CLIENT.get_trending(**params)
+        return project_response(remember_gifs(text), **projection)
+
+    text = await GIPHY_CACHE.get_or_load_async(
+        "trending", {**params, **projection}, load
+    )
+
+    return giphy_response(text, float(config.get("giphy_cache_trending_ttl")))
+
+
+async def get_images_by_ids():
+    ids = gif_ids_arg()
+    projection = projection_args()
+
+    # The per-GIF cache fetches missing GIFs with the blocking client, in a copy
+    # of the request's context so that the fetch is timed.
+    text = await asyncio.get_running_loop().run_in_executor(
+        SYNC_EXECUTOR, contextvars.copy_context().run, GIF_CACHE.get_response, ids
+    )
+
+    return giphy_response(
+        project_response(text, **projection), float(config.get("gif_cache_ttl"))
+    )
+
+
+ROUTES = {
+    ("GET", "/giphy/query"): query_giphy,
+    ("GET", "/giphy/trending"): get_trending_giphy,
+    ("GET", "/giphy/gifs"): get_images_by_ids,
+}
+
+
+def _environ(scope, body):
+    return EnvironBuilder(
+        path=scope["path"],
+        method=scope["method"],
+        query_string=scope["query_string"].decode("latin-1"),
+        headers=[
+            (k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]
+        ],
+        data=body,
+    ).get_environ()
+
+
+def _requires_auth(environ):
+    if environ["REQUEST_METHOD"] == "OPTIONS":
+        return False
+
+    try:
+        endpoint, _ = APP.url_map.bind_to_environ(environ).match()
+    except WerkzeugHttpException:
+        return False
+
+    return getattr(APP.view_functions.get(endpoint), "requires_auth", False)
+
+
+def _call_wsgi(environ):
+    response = APP.response_class.from_app(APP, environ, buffered=True)
+    return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+def _finish(rv):
+    response = APP.process_response(APP.make_response(rv))
+    return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+def _finish_error(e):
+    # Mirrors Flask's own dispatch: errors without a registered handler become
+    # a 500 that is logged and still goes through the after_request hooks.
+    try:
+        return _finish(APP.handle_user_exception(e))
+    except Exception as e:
+        response = APP.handle_exception(e)
+        return (
+            response.status_code,
+            response.headers.to_wsgi_list(),
+            response.get_data(),
+        )
+
+
+async def _respond(environ, route):
+    with APP.request_context(environ):
+        try:
+            rv = APP.preprocess_request()
+
+            if rv is None:
+                rv = await route()
+        except Exception as e:
+            return _finish_error(e)
+
+        return _finish(rv)
+
+
+async def _authenticate(environ):
+    with APP.request_context(environ):
+        try:
+            # Remembers the user in the token cache, so the Flask app's own
+            # check does not call Auth0 again from a worker thread.
+            await auth.auth_async(HTTP_CLIENT)
+        except Exception as e:
+            return _finish_error(e)
+
+    return None
+
+
+async def _handle(environ):
+    route = ROUTES.get((environ["REQUEST_METHOD"], environ["PATH_INFO"]))
+
+    if route is not None:
+        return await _respond(environ, route)
+
+    if _requires_auth(environ):
+        rejected = await _authenticate(environ)
+
+        if rejected is not None:
+            return rejected
+
+    return await asyncio.get_running_loop().run_in_executor(
+        SYNC_EXECUTOR, _call_wsgi, environ
+    )
+
+
+async def _read_body(receive):
+    body = b""
+
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+
+        if not message.get("more_body"):
+            return body
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if GIPHY_CLIENT.initialized:
+                await GIPHY_CLIENT.close()
+
+            if HTTP_CLIENT.initialized:
+                await HTTP_CLIENT.close()
+
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    environ = _environ(scope, await _read_body(receive))
+    status, headers, body = await _handle(environ)
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,4 @@
+from asgi import application
+import uvicorn
+
+uvicorn.run(application, port=8000)
@@ -0,0 +1,56 @@
+from giphy_client import GiphyClient, RETRY_STATUS_CODES
+from single_flight import AsyncSingleFlight
+import asyncio
+import aiohttp
+import metrics
+
+
+# Same API as GiphyClient, but every request method returns a coroutine and the
+# connection pool is shared by all requests on the event loop.
+class AsyncGiphyClient(GiphyClient):
+    def __init__(self, base_url, api_key, **kwargs):
+        super().__init__(base_url, api_key, **kwargs)
+        self._single_flight = AsyncSingleFlight()
+
+    def _create_session(self, pool_size, max_retries, retry_backoff):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # The session binds to the running event loop, so it is only created by
+        # the first request.
+        return None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.timeout[0], sock_read=self.timeout[1]
+                ),
+            )
+
+        return self.session
+
+    async def _fetch(self, path, params):
+        session = self._get_session()
+        params = {k: str(v) for k, v in params.items()}
+
+        for attempt in range(self.max_retries + 1):
+            async with session.get(f"{self.base_url}{path}", params=params) as response:
+                if response.status in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    await asyncio.sleep(self.retry_backoff * 2**attempt)
+                    continue
+
+                response.raise_for_status()
+                return await response.text()
+
+    async def _get(self, path, params):
+        key = (path, tuple(sorted((k, str(v)) for k, v in params.items())))
+
+        with metrics.timer(self._stage(path)):
+            return await self._single_flight.do(key, lambda: self._fetch(path, params))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
@@ -1,8 +1,58 @@
 from flask import request, g
 from functools import wraps
 from error import HttpException
+from jwks import JwksCache
+from ttl_cache import TtlCache
+import base64
 import config
+import hashlib
+import json
+import metrics
 import requests
+import time
+
+_MISSING = object()
+_REJECTED_STATUS_CODES = (401, 403)
+
+_TOKEN_CACHE = None
+_JWKS_CACHE = None
+_SESSION = None
+
+
+def _get_token_cache():
+    global _TOKEN_CACHE
+
+    if _TOKEN_CACHE is None:
+        _TOKEN_CACHE = TtlCache(
+            ttl=int(config.get("auth_cache_ttl")),
+            max_size=int(config.get("auth_cache_size")),
+        )
+
+    return _TOKEN_CACHE
+
+
+def _get_jwks_cache():
+    global _JWKS_CACHE
+
+    if _JWKS_CACHE is None:
+        _JWKS_CACHE = JwksCache(
+            f"https://{config.get('auth0_domain')}/.well-known/jwks.json",
+            ttl=float(config.get("jwks_ttl")),
+            min_refresh_interval=float(config.get("jwks_min_refresh_interval")),
+            refresh_wait=float(config.get("jwks_refresh_wait")),
+        )
+
+    return _JWKS_CACHE
+
+
+def _get_session():
+    global _SESSION
+
+    # Kept across invocations so that Auth0 lookups reuse an open connection.
+    if _SESSION is None:
+        _SESSION = requests.Session()
+
+    return _SESSION
 
 
 def _get_token_auth_header():
@@ -21,23 +71,188 @@ def _get_token_auth_header():
     return parts[1]
 
 
+def _hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _userinfo_url():
+    return f"https://{config.get('auth0_domain')}/userinfo"
+
+
+def _fetch_user_email(token):
+    response = _get_session().get(
+        _userinfo_url(), headers={"Authorization": f"Bearer {token}"}
+    )
+
+    # Only a definitive rejection from Auth0 is worth remembering; transient
+    # failures (timeouts, 5xx, rate limiting) must be retried on the next call.
+    if response.status_code in _REJECTED_STATUS_CODES:
+        return None
+
+    response.raise_for_status()
+
+    return response.json().get("email")
+
+
+async def _fetch_user_email_async(token, http_client):
+    async with http_client.get(
+        _userinfo_url(), headers={"Authorization": f"Bearer {token}"}
+    ) as response:
+        if response.status in _REJECTED_STATUS_CODES:
+            return None
+
+        response.raise_for_status()
+
+        return (await response.json()).get("email")
+
+
+def _verify_jwt(token):
+    from jose import jwt
+
+    header = jwt.get_unverified_header(token)
+    key = _get_jwks_cache().get_key(header.get("kid"))
+
+    if key is None:
+        return None
+
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=["RS256"],
+        audience=config.get("auth0_audience"),
+        issuer=f"https://{config.get('auth0_domain')}/",
+        options={"verify_at_hash": False},
+    )
+
+    return claims.get(config.get("auth0_email_claim"))
+
+
+def _token_expiry(token):
+    # Auth0 access tokens are usually JWTs. Their expiry is read without
+    # verifying them, as it is only used to cache the lookup for less time.
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _remember_user(key, email, token):
+    if email:
+        ttl = int(config.get("auth_cache_ttl"))
+        expiry = _token_expiry(token)
+
+        # A token must not keep authenticating once it has expired. An entry
+        # whose TTL is not positive is not stored at all.
+        if expiry is not None:
+            ttl = min(ttl, expiry - time.time())
+
+        _get_token_cache().set(key, email, ttl=ttl)
+    else:
+        _get_token_cache().set(
+            key, None, ttl=int(config.get("auth_cache_negative_ttl"))
+        )
+
+
+def _resolve_user(token):
+    key = _hash_token(token)
+    email = _get_token_cache().get(key, _MISSING)
+
+    if email is not _MISSING:
+        return email
+
+    email = _fetch_user_email(token)
+    _remember_user(key, email, token)
+
+    return email
+
+
+async def _resolve_user_async(token, http_client):
+    key = _hash_token(token)
+    email = _get_token_cache().get(key, _MISSING)
+
+    if email is not _MISSING:
+        return email
+
+    email = await _fetch_user_email_async(token, http_client)
+    _remember_user(key, email, token)
+
+    return email
+
+
+def _authenticate(token):
+    if config.get("auth_mode") == "jwt":
+        return _verify_jwt(token)
+
+    return _resolve_user(token)
+
+
+async def authenticate_async(token, http_client):
+    if config.get("auth_mode") == "jwt":
+        # Verification is local, but a JWKS refresh may block briefly. asyncio
+        # is only imported here, off the WSGI and Lambda import path.
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _verify_jwt, token)
+
+    return await _resolve_user_async(token, http_client)
+
+
+def warm():
+    # Loads the key set, or opens the connection that userinfo lookups reuse, so
+    # that the first authenticated request does not pay for it.
+    if config.get("auth_mode") == "jwt":
+        _get_jwks_cache().get_key(None)
+    else:
+        _get_session().head(_userinfo_url(), timeout=5)
+
+
+def cache_stats():
+    return _get_token_cache().stats()
+
+
+def clear_cache():
+    global _TOKEN_CACHE, _JWKS_CACHE
+
+    _TOKEN_CACHE = None
+    _JWKS_CACHE = None
+
+
+@metrics.timed("auth")
 def auth():
     token = _get_token_auth_header()
-    base_url = config.get("auth0_domain")
 
     try:
-        response = requests.get(
-            f"https://{base_url}/userinfo",
-            headers={"Authorization": f"Bearer {token}"},
-        )
+        email = _authenticate(token)
+    except Exception:
+        raise HttpException("Unauthorized", 401)
 
-        response.raise_for_status()
+    if not email:
+        raise HttpException("Unauthorized", 401)
+
+    g.current_user = email
+    g.auth_token = token
+
+
+@metrics.timed("auth")
+async def auth_async(http_client):
+    token = _get_token_auth_header()
 
-        g.current_user = response.json()["email"]
-        g.auth_token = token
+    try:
+        email = await authenticate_async(token, http_client)
     except Exception:
         raise HttpException("Unauthorized", 401)
 
+    if not email:
+        raise HttpException("Unauthorized", 401)
+
+    g.current_user = email
+    g.auth_token = token
+
 
 def requires_auth(f):
     @wraps(f)
@@ -45,4 +260,6 @@ def requires_auth(f):
         auth()
         return f(*args, **kwargs)
 
+    decorated.requires_auth = True
+
     return decorated
@@ -0,0 +1,111 @@
+from favorites_client import MAX_TRANSACTION_ITEMS, FavoritesClient, get_client
+import argparse
+import collections
+import config
+import json
+import sys
+
+# Writes are sent in groups of this many, so that a large table is not held in
+# memory while it is scanned.
+FLUSH_SIZE = 1000
+
+# Partition key prefixes of the items that are not favorites.
+_NOT_FAVORITES = ("tag#", "version#", "count#")
+
+
+def _scan():
+    paginator = get_client().get_paginator("scan")
+
+    for page in paginator.paginate(TableName=config.get("dynamodb_table")):
+        yield from page["Items"]
+
+
+def _is_favorite(item):
+    pk = item["pk"]["S"]
+    return pk != "leaderboard" and not pk.startswith(_NOT_FAVORITES)
+
+
+def backfill_tags(client):
+    # Writes the tag index items of every favorite. Writing an existing item
+    # again is harmless, so this may be run at any time.
+    written = 0
+    unprocessed = []
+    writes = []
+
+    for item in _scan():
+        if _is_favorite(item):
+            tags = item.get("tags", {}).get("SS", [])
+            writes.extend(
+                client._tag_index_writes(item["pk"]["S"], item["sk"]["S"], added=tags)
+            )
+
+        if len(writes) >= FLUSH_SIZE:
+            written += len(writes)
+            unprocessed.extend(client._batch_write(writes))
+            writes = []
+
+    written += len(writes)
+    unprocessed.extend(client._batch_write(writes))
+
+    return {"written": written, "unprocessed": len(unprocessed)}
+
+
+def backfill_counts(client):
+    # Recounts the favorites of every GIF, adds the difference to its counter
+    # shards and rebuilds the leaderboard from the recounted totals. Favorites
+    # added or removed while the table is scanned may be miscounted, so this is
+    # best run when few are.
+    counts = collections.Counter()
+
+    for item in _scan():
+        if item["pk"]["S"].startswith("count#"):
+            # Counted GIFs that are no longer anyone's favorite go back to zero.
+            counts[client._counted_id(item)] += 0
+        elif _is_favorite(item):
+            counts[item["sk"]["S"]] += 1
+
+    ids = list(counts)
+    written = 0
+    unprocessed = 0
+
+    for i in range(0, len(ids), MAX_TRANSACTION_ITEMS):
+        current = client.count_favorites(ids[i : i + MAX_TRANSACTION_ITEMS])
+        deltas = {
+            id: counts[id] - it
+            for id, it in current.items()
+            if it is not None and it != counts[id]
+        }
+        unprocessed += sum(1 for it in current.values() if it is None)
+
+        if not deltas:
+            continue
+
+        if client._write_counts(deltas):
+            written += len(deltas)
+        else:
+            unprocessed += len(deltas)
+
+    if not client._rebuild_leaderboard(counts):
+        unprocessed += 1
+
+    return {"written": written, "unprocessed": unprocessed}
+
+
+COMMANDS = {"tags": backfill_tags, "counts": backfill_counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the items derived from the favorites in the table."
+    )
+    parser.add_argument("command", choices=list(COMMANDS))
+    args = parser.parse_args()
+
+    result = COMMANDS[args.command](FavoritesClient())
+    print(json.dumps(result))
+
+    sys.exit(1 if result["unprocessed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from flask import request
+import config
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+GZIP_LEVEL = 6
+# Brotli's default quality (11) compresses slightly better but is far too slow
+# to run on every response.
+BROTLI_QUALITY = 5
+
+_ENCODERS = {"gzip": lambda body: gzip.compress(body, GZIP_LEVEL)}
+
+if brotli:
+    _ENCODERS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def configured_encodings():
+    return [
+        it.strip()
+        for it in config.get("response_compression").split(",")
+        if it.strip() in _ENCODERS
+    ]
+
+
+def _negotiate(encodings):
+    accepted = request.accept_encodings
+
+    for encoding in encodings:
+        if accepted.quality(encoding) > 0:
+            return encoding
+
+    return None
+
+
+def compress_response(response, encodings, min_size):
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    body = response.get_data()
+
+    if len(body) < min_size:
+        return response
+
+    encoding = _negotiate(encodings)
+
+    if encoding is None:
+        return response
+
+    response.set_data(_ENCODERS[encoding](body))
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+
+    if etag and not weak:
+        # The compressed body is no longer byte-for-byte the one the strong
+        # ETag was computed from. If-None-Match compares weakly, so clients
+        # still get their 304s.
+        response.set_etag(etag, weak=True)
+
+    return response
@@ -1,17 +1,74 @@
-import boto3
 import os
+import threading
+import time
 
 _STATIC_CONFIG = {
     "auth0_domain": os.environ.get("AUTH0_DOMAIN", "budb-hegiphy.auth0.com"),
     "dynamodb_table": os.environ.get("DYNAMODB_TABLE", "hegiphy"),
     "giphy_base_url": os.environ.get("GIPHY_BASE_URL", "https://api.giphy.com/v1"),
+    "giphy_api_key": os.environ.get("GIPHY_API_KEY"),
+    "ssm_refresh_interval": os.environ.get("SSM_REFRESH_INTERVAL", "300"),
+    "giphy_pool_size": os.environ.get("GIPHY_POOL_SIZE", "10"),
+    "giphy_connect_timeout": os.environ.get("GIPHY_CONNECT_TIMEOUT", "3.05"),
+    "giphy_read_timeout": os.environ.get("GIPHY_READ_TIMEOUT", "10"),
+    "giphy_max_retries": os.environ.get("GIPHY_MAX_RETRIES", "2"),
+    "giphy_retry_backoff": os.environ.get("GIPHY_RETRY_BACKOFF", "0.3"),
+    "giphy_cache_trending_ttl": os.environ.get("GIPHY_CACHE_TRENDING_TTL", "60"),
+    "giphy_cache_query_ttl": os.environ.get("GIPHY_CACHE_QUERY_TTL", "300"),
+    "giphy_cache_stale_ttl": os.environ.get("GIPHY_CACHE_STALE_TTL", "600"),
+    "giphy_cache_max_bytes": os.environ.get("GIPHY_CACHE_MAX_BYTES", "33554432"),
+    "giphy_max_ids_per_request": os.environ.get("GIPHY_MAX_IDS_PER_REQUEST", "100"),
+    "giphy_fetch_workers": os.environ.get("GIPHY_FETCH_WORKERS", "4"),
+    "giphy_batch_workers": os.environ.get("GIPHY_BATCH_WORKERS", "8"),
+    # Stays below the 28 second Lambda and API Gateway timeouts.
+    "giphy_batch_deadline": os.environ.get("GIPHY_BATCH_DEADLINE", "25"),
+    # Prefetching the next search page is off while there are no workers. It
+    # only helps long-lived WSGI or ASGI servers: Lambda freezes the container
+    # once the response is returned, so prefetches there rarely finish in time.
+    "giphy_prefetch_workers": os.environ.get("GIPHY_PREFETCH_WORKERS", "0"),
+    "giphy_prefetch_budget": os.environ.get("GIPHY_PREFETCH_BUDGET", "2"),
+    "giphy_prefetch_terms": os.environ.get("GIPHY_PREFETCH_TERMS", "1000"),
+    # Search terms warmed by scheduled pings, out of those recently searched.
+    "warm_search_terms": os.environ.get("WARM_SEARCH_TERMS", "10"),
+    "recent_terms_size": os.environ.get("RECENT_TERMS_SIZE", "1000"),
+    "gif_cache_ttl": os.environ.get("GIF_CACHE_TTL", "86400"),
+    "gif_cache_max_bytes": os.environ.get("GIF_CACHE_MAX_BYTES", "8388608"),
+    "auth_mode": os.environ.get("AUTH_MODE", "userinfo"),
+    "auth0_audience": os.environ.get("AUTH0_AUDIENCE"),
+    "auth0_email_claim": os.environ.get("AUTH0_EMAIL_CLAIM", "email"),
+    "jwks_ttl": os.environ.get("JWKS_TTL", "3600"),
+    "jwks_min_refresh_interval": os.environ.get("JWKS_MIN_REFRESH_INTERVAL", "30"),
+    "jwks_refresh_wait": os.environ.get("JWKS_REFRESH_WAIT", "2"),
+    "auth_cache_ttl": os.environ.get("AUTH_CACHE_TTL", "300"),
+    "auth_cache_negative_ttl": os.environ.get("AUTH_CACHE_NEGATIVE_TTL", "30"),
+    "auth_cache_size": os.environ.get("AUTH_CACHE_SIZE", "10000"),
+    "asgi_sync_workers": os.environ.get("ASGI_SYNC_WORKERS", "16"),
+    "favorites_cache_ttl": os.environ.get("FAVORITES_CACHE_TTL", "0"),
+    "favorites_cache_size": os.environ.get("FAVORITES_CACHE_SIZE", "1000"),
+    "popularity_counter_shards": os.environ.get("POPULARITY_COUNTER_SHARDS", "10"),
+    "leaderboard_size": os.environ.get("LEADERBOARD_SIZE", "100"),
+    # GIFs tracked on the leaderboard beyond those served, ready to move up when
+    # a leader loses favorites.
+    "leaderboard_candidates": os.environ.get("LEADERBOARD_CANDIDATES", "400"),
+    "popularity_cache_ttl": os.environ.get("POPULARITY_CACHE_TTL", "60"),
+    "response_compression": os.environ.get("RESPONSE_COMPRESSION", ""),
+    "response_compression_min_size": os.environ.get(
+        "RESPONSE_COMPRESSION_MIN_SIZE", "1024"
+    ),
+    # Comma separated: "server-timing" and/or "emf". Empty turns timing off.
+    "metrics": os.environ.get("METRICS", ""),
+    "metrics_namespace": os.environ.get("METRICS_NAMESPACE", "hegiphy"),
 }
 
-_SSM_CONFIG = None
 _COMPILED_CONFIG = None
+_LOADED_AT = 0
+_REFRESH_THREAD = None
+_LOCK = threading.Lock()
 
 
 def _get_ssm_client():
+    import boto3
+
     return boto3.client("ssm")
 
 
@@ -20,35 +77,74 @@ def _get_base_path():
 
 
 def _load_ssm_secrets():
-    global _SSM_CONFIG
-
     secrets = {}
     path = _get_base_path()
 
     if not path:
-        _SSM_CONFIG = {}
-        return
+        return secrets
 
     ssm_client = _get_ssm_client()
-    params = ssm_client.get_parameters_by_path(
-        Path=path, Recursive=True, WithDecryption=True
-    )["Parameters"]
+    params = {"Path": path, "Recursive": True, "WithDecryption": True}
 
-    for param in params:
-        name = param["Name"].replace(path, "")
-        secrets[name] = param["Value"]
+    while True:
+        response = ssm_client.get_parameters_by_path(**params)
 
-    _SSM_CONFIG = secrets
+        for param in response["Parameters"]:
+            name = param["Name"].replace(path, "")
+            secrets[name] = param["Value"]
 
+        if not response.get("NextToken"):
+            return secrets
 
-def _init():
-    global _STATIC_CONFIG, _SSM_CONFIG, _COMPILED_CONFIG
+        params["NextToken"] = response["NextToken"]
+
+
+def _load():
+    global _COMPILED_CONFIG, _LOADED_AT
+
+    secrets = _load_ssm_secrets()
+
+    _COMPILED_CONFIG = {**_STATIC_CONFIG, **secrets}
+    _LOADED_AT = time.monotonic()
+
+
+def _refresh():
+    global _LOADED_AT, _REFRESH_THREAD
 
-    _load_ssm_secrets()
-    _COMPILED_CONFIG = {**_STATIC_CONFIG, **_SSM_CONFIG}
+    try:
+        _load()
+    except Exception:
+        # Keep serving the last known good values and try again once the
+        # refresh interval has elapsed.
+        _LOADED_AT = time.monotonic()
+    finally:
+        _REFRESH_THREAD = None
+
+
+def _start_refresh():
+    global _REFRESH_THREAD
+
+    with _LOCK:
+        if _REFRESH_THREAD is not None:
+            return
+
+        _REFRESH_THREAD = threading.Thread(target=_refresh, daemon=True)
+        _REFRESH_THREAD.start()
+
+
+def _init():
+    with _LOCK:
+        if _COMPILED_CONFIG is None:
+            _load()
 
 
 def get(name, default=None):
-    if not _COMPILED_CONFIG:
+    if _COMPILED_CONFIG is None:
         _init()
+    else:
+        interval = float(_STATIC_CONFIG["ssm_refresh_interval"])
+
+        if interval > 0 and time.monotonic() - _LOADED_AT > interval:
+            _start_refresh()
+
     return _COMPILED_CONFIG.get(name, default)
@@ -0,0 +1,124 @@
+from collections import namedtuple
+from ttl_cache import TtlCache
+import threading
+
+CachedList = namedtuple("CachedList", ["favorites", "read_units", "table_version"])
+CachedItem = namedtuple("CachedItem", ["favorite", "read_units"])
+
+# An eventually consistent query for a single small item, the cheapest read.
+ITEM_READ_UNITS = 0.5
+
+
+# Per-user cache of favorites. A user's full list and single favorites are
+# cached separately; writes made through this process update the list and drop
+# the single entry, so a process always reads its own writes. Lists remember the
+# user's version item they were read at, so that a list served along with an
+# ETag can be checked against writes made by other processes. Entries read from
+# DynamoDB remember the read units they cost to report what the cache saved.
+class FavoritesCache:
+    def __init__(self, ttl, max_size):
+        self.hits = 0
+        self.misses = 0
+        self.read_units_saved = 0
+        self._cache = TtlCache(ttl, max_size)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        # Taken before reading from DynamoDB. A result is only cached if no write
+        # happened in the meantime, as it might predate that write.
+        return self._writes
+
+    def _record(self, entry):
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.read_units_saved += entry.read_units
+
+    def get_list(self, user, table_version=None):
+        entry = self._cache.get(("list", user))
+
+        if (
+            entry is not None
+            and table_version is not None
+            and entry.table_version != table_version
+        ):
+            entry = None
+
+        self._record(entry)
+
+        return None if entry is None else list(entry.favorites.values())
+
+    def get(self, user, id, default=None):
+        entry = self._cache.get(("list", user))
+
+        if entry is not None:
+            self._record(CachedItem(None, ITEM_READ_UNITS))
+            return entry.favorites.get(id)
+
+        entry = self._cache.get(("item", user, id))
+        self._record(entry)
+
+        return default if entry is None else entry.favorite
+
+    def set_list(self, user, favorites, read_units, version, table_version=None):
+        with self._lock:
+            if version == self._writes:
+                favorites = {it["id"]: it for it in favorites}
+                self._cache.set(
+                    ("list", user), CachedList(favorites, read_units, table_version)
+                )
+
+    def set(self, user, id, favorite, read_units, version):
+        with self._lock:
+            if version == self._writes:
+                self._cache.set(("item", user, id), CachedItem(favorite, read_units))
+
+    def _write(self, user, id, favorite):
+        with self._lock:
+            self._writes += 1
+            self._cache.delete(("item", user, id))
+            entry = self._cache.get(("list", user))
+
+            if entry is None:
+                return
+
+            favorites = {k: v for k, v in entry.favorites.items() if k != id}
+
+            if favorite is not None:
+                favorites[id] = favorite
+
+            # Kept in sort key order, the order DynamoDB lists them in. The
+            # version item is bumped by the write, to a value not known here.
+            favorites = dict(sorted(favorites.items()))
+            self._cache.set(
+                ("list", user),
+                entry._replace(favorites=favorites, table_version=None),
+            )
+
+    def put(self, user, favorite):
+        self._write(user, favorite["id"], favorite)
+
+    def remove(self, user, id):
+        self._write(user, id, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.read_units_saved = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "read_units_saved": self.read_units_saved,
+            }
@@ -1,14 +1,64 @@
-import boto3
+import base64
 import config
+import json
+import logging
+import metrics
+import random
+import threading
+import time
 
-client = boto3.client("dynamodb")
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+_LOGGER = logging.getLogger(__name__)
+
+MAX_BATCH_WRITE_ITEMS = 25
+MAX_BATCH_GET_KEYS = 100
+MAX_BATCH_ATTEMPTS = 5
+BATCH_BACKOFF_BASE = 0.05
+BATCH_BACKOFF_MAX = 1
+MAX_LEADERBOARD_ATTEMPTS = 5
+MAX_TRANSACTION_ATTEMPTS = 5
+MAX_TRANSACTION_ITEMS = 100
+
+# Sort keys double as partition keys of the hegiphy_id index, so the items that
+# are not favorites use their partition key as their sort key too.
+LEADERBOARD_KEY = {"pk": {"S": "leaderboard"}, "sk": {"S": "leaderboard"}}
+
+_MISSING = object()
+
+
+def get_client():
+    global _CLIENT
+
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                import boto3
+
+                client = boto3.client("dynamodb")
+                metrics.instrument_dynamodb(client)
+                _CLIENT = client
+
+    return _CLIENT
 
 
 class FavoriteNotFoundException(Exception):
     pass
 
 
+class InvalidCursorException(Exception):
+    pass
+
+
+class TooManyTagsException(Exception):
+    pass
+
+
+@metrics.instrumented("dynamodb")
 class FavoritesClient:
+    def __init__(self, cache=None):
+        self.cache = cache
+
     def _format(self, record):
         return {
             "id": record["sk"]["S"],
@@ -16,105 +66,792 @@ class FavoritesClient:
             "tags": record.get("tags", {}).get("SS", []),
         }
 
-    def find_by_id_and_user(self, id, user):
-        response = client.query(
-            TableName=config.get("dynamodb_table"),
-            KeyConditionExpression="pk = :user AND sk = :id",
-            ExpressionAttributeValues={":user": {"S": user}, ":id": {"S": id}},
+    def _tag_key(self, user, tag):
+        # Tag membership items live in their own partition per user and tag so
+        # that a tag lookup only reads the favorites carrying that tag.
+        return f"tag#{user}#{tag}"
+
+    def _tag_index_key(self, user, tag, id):
+        # Sort keys double as partition keys of the hegiphy_id index, so they
+        # are prefixed to keep tag index items apart from the favorites there.
+        return {"pk": {"S": self._tag_key(user, tag)}, "sk": {"S": f"tag#{id}"}}
+
+    def _indexed_id(self, key):
+        return key["sk"]["S"][len("tag#") :]
+
+    def _version_key(self, user):
+        # The hegiphy_id index is keyed on sk, so a sort key shared by every
+        # user's version item would make one hot index partition.
+        key = f"version#{user}"
+        return {"pk": {"S": key}, "sk": {"S": key}}
+
+    def _favorite_item(self, user, id, tags=None):
+        item = {"pk": {"S": user}, "sk": {"S": id}}
+
+        if tags:
+            item["tags"] = {"SS": tags}
+
+        return item
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries of throttled batches from synchronizing.
+        delay = min(BATCH_BACKOFF_MAX, BATCH_BACKOFF_BASE * 2**attempt)
+        time.sleep(random.uniform(0, delay))  # nosec
+
+    def _batch_write(self, writes):
+        table = config.get("dynamodb_table")
+        unprocessed = []
+
+        for i in range(0, len(writes), MAX_BATCH_WRITE_ITEMS):
+            pending = {table: writes[i : i + MAX_BATCH_WRITE_ITEMS]}
+
+            for attempt in range(MAX_BATCH_ATTEMPTS):
+                if attempt:
+                    self._backoff(attempt)
+
+                pending = (
+                    get_client()
+                    .batch_write_item(RequestItems=pending)
+                    .get("UnprocessedItems")
+                )
+
+                if not pending:
+                    break
+
+            if pending:
+                unprocessed.extend(pending.get(table, []))
+
+        return unprocessed
+
+    def _batch_get(self, keys):
+        table = config.get("dynamodb_table")
+        items = []
+        unprocessed = []
+
+        for i in range(0, len(keys), MAX_BATCH_GET_KEYS):
+            pending = {table: {"Keys": keys[i : i + MAX_BATCH_GET_KEYS]}}
+
+            for attempt in range(MAX_BATCH_ATTEMPTS):
+                if attempt:
+                    self._backoff(attempt)
+
+                response = get_client().batch_get_item(RequestItems=pending)
+                items.extend(response["Responses"].get(table, []))
+                pending = response.get("UnprocessedKeys")
+
+                if not pending:
+                    break
+
+            if pending:
+                unprocessed.extend(pending.get(table, {}).get("Keys", []))
+
+        return items, unprocessed
+
+    def _tag_index_writes(self, user, id, added=(), removed=()):
+        return [
+            {"PutRequest": {"Item": self._tag_index_key(user, tag, id)}}
+            for tag in added
+        ] + [
+            {"DeleteRequest": {"Key": self._tag_index_key(user, tag, id)}}
+            for tag in removed
+        ]
+
+    def _transact_writes(self, writes):
+        table = config.get("dynamodb_table")
+
+        return [
+            (
+                {"Put": {"TableName": table, **it["PutRequest"]}}
+                if "PutRequest" in it
+                else {"Delete": {"TableName": table, **it["DeleteRequest"]}}
+            )
+            for it in writes
+        ]
+
+    def _unchanged_condition(self, record):
+        # The tag index writes are worked out from the tags the favorite had
+        # when it was read, so the transaction fails if they changed since.
+        if record is None:
+            return {"ConditionExpression": "attribute_not_exists(pk)"}
+
+        condition = {"ExpressionAttributeNames": {"#tags": "tags"}}
+
+        if "tags" not in record:
+            condition["ConditionExpression"] = (
+                "attribute_exists(pk) AND attribute_not_exists(#tags)"
+            )
+        else:
+            condition["ConditionExpression"] = "#tags = :tags"
+            condition["ExpressionAttributeValues"] = {":tags": record["tags"]}
+
+        return condition
+
+    def _get_record(self, user, id):
+        return (
+            get_client()
+            .get_item(
+                TableName=config.get("dynamodb_table"),
+                Key={"pk": {"S": user}, "sk": {"S": id}},
+                ConsistentRead=True,
+            )
+            .get("Item")
+        )
+
+    def _write_favorite(self, user, id, transaction):
+        # Writes a favorite, its tag index items and the version bump in one
+        # transaction, built by `transaction` from the favorite's current
+        # record. Returns that record.
+        for attempt in range(MAX_TRANSACTION_ATTEMPTS):
+            if attempt:
+                self._backoff(attempt)
+
+            record = self._get_record(user, id)
+            items = transaction(record)
+
+            if not items:
+                return record
+
+            try:
+                get_client().transact_write_items(TransactItems=items)
+                return record
+            except get_client().exceptions.TransactionCanceledException:
+                # The favorite changed since it was read, or another
+                # transaction was writing the same items.
+                if attempt == MAX_TRANSACTION_ATTEMPTS - 1:
+                    raise
+
+    def _find_records(self, user, ids):
+        records, unprocessed = self._batch_get(
+            [{"pk": {"S": user}, "sk": {"S": id}} for id in dict.fromkeys(ids)]
+        )
+
+        return (
+            {it["sk"]["S"]: it for it in records},
+            {it["sk"]["S"] for it in unprocessed},
+        )
+
+    def _read_params(self, params):
+        if self.cache is not None:
+            params["ReturnConsumedCapacity"] = "TOTAL"
+
+        return params
+
+    def _read_units(self, response):
+        return response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+
+    def get_version(self, user):
+        # Read consistently: an out of date version could wrongly tell a client
+        # that its copy of the list is still current.
+        item = (
+            get_client()
+            .get_item(
+                TableName=config.get("dynamodb_table"),
+                Key=self._version_key(user),
+                ConsistentRead=True,
+            )
+            .get("Item")
         )
 
-        if len(response["Items"]) == 0:
-            return None
+        return int(item["version"]["N"]) if item else 0
+
+    def _version_update(self, user):
+        # Every change to a user's favorites bumps a counter kept in its own
+        # item, so that clients can check whether their copy is current without
+        # the whole partition being read.
+        return {
+            "TableName": config.get("dynamodb_table"),
+            "Key": self._version_key(user),
+            "UpdateExpression": "ADD #version :one",
+            "ExpressionAttributeNames": {"#version": "version"},
+            "ExpressionAttributeValues": {":one": {"N": "1"}},
+        }
+
+    def _bump_version(self, user):
+        get_client().update_item(**self._version_update(user))
+
+    def _counter_key(self, id, shard):
+        # Each GIF's count is spread over several items so that a GIF being
+        # favorited by many users at once does not make a hot partition.
+        key = f"count#{id}#{shard}"
+        return {"pk": {"S": key}, "sk": {"S": key}}
+
+    def _counted_id(self, key):
+        return key["pk"]["S"][len("count#") :].rsplit("#", 1)[0]
+
+    def _counter_keys(self, ids):
+        # The number of shards may be raised later on, but never lowered, as
+        # the counts held by the dropped shards would no longer be read.
+        shards = int(config.get("popularity_counter_shards"))
+        return [self._counter_key(id, shard) for id in ids for shard in range(shards)]
+
+    def _counter_updates(self, deltas):
+        # A fresh shard is picked for every attempt, which also steers retries
+        # away from the shards another transaction was writing.
+        shards = int(config.get("popularity_counter_shards"))
+
+        return [
+            {
+                "Update": {
+                    "TableName": config.get("dynamodb_table"),
+                    "Key": self._counter_key(id, random.randrange(shards)),  # nosec
+                    "UpdateExpression": "ADD #count :delta",
+                    "ExpressionAttributeNames": {"#count": "count"},
+                    "ExpressionAttributeValues": {":delta": {"N": str(delta)}},
+                }
+            }
+            for id, delta in deltas.items()
+        ]
+
+    def _write_counts(self, deltas):
+        # A single count is updated on its own, as a transaction costs twice
+        # the write units. Several are grouped into one transaction per
+        # hundred rather than updated one by one.
+        if len(deltas) == 1:
+            get_client().update_item(**self._counter_updates(deltas)[0]["Update"])
+            return True
+
+        for attempt in range(MAX_TRANSACTION_ATTEMPTS):
+            if attempt:
+                self._backoff(attempt)
+
+            try:
+                get_client().transact_write_items(
+                    TransactItems=self._counter_updates(deltas)
+                )
+                return True
+            except get_client().exceptions.TransactionCanceledException:
+                # Another transaction was writing one of the same shards.
+                continue
+
+        _LOGGER.warning("giving up on updating the counts of %s", list(deltas))
+
+        return False
+
+    def _update_counts(self, deltas):
+        # Only the counters are written here. The leaderboard is updated from
+        # the table's stream of counter changes, off the request path.
+        ids = list(deltas)
+
+        for i in range(0, len(ids), MAX_TRANSACTION_ITEMS):
+            self._write_counts(
+                {id: deltas[id] for id in ids[i : i + MAX_TRANSACTION_ITEMS]}
+            )
+
+    def _read_leaderboard(self, consistent=False):
+        item = (
+            get_client()
+            .get_item(
+                TableName=config.get("dynamodb_table"),
+                Key=LEADERBOARD_KEY,
+                ConsistentRead=consistent,
+            )
+            .get("Item")
+        )
+
+        if not item:
+            return {}, None
+
+        entries = item.get("entries", {}).get("M", {})
+
+        return (
+            {id: int(it["N"]) for id, it in entries.items()},
+            int(item["revision"]["N"]),
+        )
+
+    def _write_leaderboard(self, merge):
+        # The leaderboard keeps more GIFs than it serves, so that one losing
+        # favorites is replaced by the next candidate rather than by whichever
+        # GIF happens to be favorited next.
+        candidates = max(
+            int(config.get("leaderboard_size")),
+            int(config.get("leaderboard_candidates")),
+        )
+
+        for _ in range(MAX_LEADERBOARD_ATTEMPTS):
+            entries, revision = self._read_leaderboard(consistent=True)
+            updated = merge(entries)
+            updated = dict(
+                sorted(
+                    [it for it in updated.items() if it[1] > 0],
+                    key=lambda it: (-it[1], it[0]),
+                )[:candidates]
+            )
+
+            if updated == entries:
+                return True
+
+            if revision is None:
+                condition = {"ConditionExpression": "attribute_not_exists(pk)"}
+            else:
+                condition = {
+                    "ConditionExpression": "revision = :revision",
+                    "ExpressionAttributeValues": {":revision": {"N": str(revision)}},
+                }
+
+            try:
+                get_client().put_item(
+                    TableName=config.get("dynamodb_table"),
+                    Item={
+                        **LEADERBOARD_KEY,
+                        "entries": {
+                            "M": {id: {"N": str(it)} for id, it in updated.items()}
+                        },
+                        "revision": {"N": str((revision or 0) + 1)},
+                    },
+                    **condition,
+                )
+                return True
+            except get_client().exceptions.ConditionalCheckFailedException:
+                # Someone else changed the leaderboard since it was read.
+                continue
+
+        _LOGGER.warning("giving up on updating the leaderboard")
+
+        return False
 
-        return self._format(response["Items"][0])
+    def update_leaderboard(self, ids):
+        def merge(entries):
+            # The counts are read after the leaderboard, so that a write based
+            # on older counts fails the revision check.
+            counts = self.count_favorites(ids)
+            return {
+                **entries,
+                **{id: it for id, it in counts.items() if it is not None},
+            }
 
-    def find_by_user(self, user):
-        response = client.query(
-            TableName=config.get("dynamodb_table"),
-            KeyConditionExpression="pk = :user",
-            ExpressionAttributeValues={":user": {"S": user}},
+        return self._write_leaderboard(merge)
+
+    def _rebuild_leaderboard(self, counts):
+        return self._write_leaderboard(lambda entries: dict(counts))
+
+    def find_by_id_and_user(self, id, user):
+        if self.cache is not None:
+            favorite = self.cache.get(user, id, _MISSING)
+
+            if favorite is not _MISSING:
+                return favorite
+
+            version = self.cache.version
+
+        response = get_client().query(
+            **self._read_params(
+                {
+                    "TableName": config.get("dynamodb_table"),
+                    "KeyConditionExpression": "pk = :user AND sk = :id",
+                    "ExpressionAttributeValues": {
+                        ":user": {"S": user},
+                        ":id": {"S": id},
+                    },
+                }
+            )
         )
 
-        return [self._format(it) for it in response["Items"]]
+        favorite = self._format(response["Items"][0]) if response["Items"] else None
+
+        if self.cache is not None:
+            self.cache.set(user, id, favorite, self._read_units(response), version)
+
+        return favorite
+
+    def _query(self, name, value, limit=None, start_key=None):
+        params = {
+            "TableName": config.get("dynamodb_table"),
+            "KeyConditionExpression": f"pk = :{name}",
+            "ExpressionAttributeValues": {f":{name}": {"S": value}},
+        }
+
+        if limit:
+            params["Limit"] = limit
+
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+
+        return get_client().query(**self._read_params(params))
+
+    def _iter_pages(self, name, value):
+        start_key = None
+
+        while True:
+            response = self._query(name, value, start_key=start_key)
+            yield response
+
+            start_key = response.get("LastEvaluatedKey")
+
+            if not start_key:
+                return
+
+    def _iter_query(self, name, value):
+        for response in self._iter_pages(name, value):
+            yield from response["Items"]
+
+    def _encode_cursor(self, key):
+        data = json.dumps(key, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii")
+
+    def _decode_cursor(self, cursor, pk):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            valid = (
+                set(key) == {"pk", "sk"}
+                and key["pk"] == {"S": pk}
+                and isinstance(key["sk"].get("S"), str)
+            )
+        except Exception:
+            valid = False
+
+        # Cursors are handed to clients, so never trust one that points outside
+        # of the partition being listed.
+        if not valid:
+            raise InvalidCursorException()
+
+        return key
+
+    def _query_page(self, name, value, limit, cursor):
+        start_key = self._decode_cursor(cursor, value) if cursor else None
+        response = self._query(name, value, limit, start_key)
+        next_key = response.get("LastEvaluatedKey")
+
+        return response["Items"], self._encode_cursor(next_key) if next_key else None
 
-    def find_by_user_and_tag(self, user, tag):
-        tag = tag.lower()
-        favorites = self.find_by_user(user)
+    def _find_by_ids(self, user, ids):
+        if not ids:
+            return []
+
+        records, _ = self._find_records(user, ids)
+
+        return [self._format(records[id]) for id in ids if id in records]
+
+    def iter_by_user(self, user, table_version=None):
+        # `table_version`, when given, is the user's version read beforehand; a
+        # cached list read at another version is not used.
+        if self.cache is None:
+            for item in self._iter_query("user", user):
+                yield self._format(item)
+            return
+
+        favorites = self.cache.get_list(user, table_version)
+
+        if favorites is not None:
+            yield from favorites
+            return
+
+        version = self.cache.version
+        favorites = []
+        read_units = 0
+
+        for response in self._iter_pages("user", user):
+            read_units += self._read_units(response)
+
+            for item in response["Items"]:
+                favorite = self._format(item)
+                favorites.append(favorite)
+                yield favorite
+
+        self.cache.set_list(user, favorites, read_units, version, table_version)
+
+    def find_by_user(self, user, table_version=None):
+        return list(self.iter_by_user(user, table_version))
+
+    def find_page_by_user(self, user, limit, cursor=None):
+        items, next_cursor = self._query_page("user", user, limit, cursor)
+        return [self._format(it) for it in items], next_cursor
+
+    def _find_by_ids_and_tag(self, user, tag, items):
+        favorites = self._find_by_ids(user, [self._indexed_id(it) for it in items])
+
+        # Index items left behind by a bulk write that failed half way point
+        # at favorites that no longer carry the tag.
         return [it for it in favorites if tag in it["tags"]]
 
+    def find_by_user_and_tag(self, user, tag, table_version=None):
+        favorites = (
+            self.cache.get_list(user, table_version) if self.cache is not None else None
+        )
+
+        if favorites is not None:
+            return [it for it in favorites if tag in it["tags"]]
+
+        items = self._iter_query("tag", self._tag_key(user, tag))
+        return self._find_by_ids_and_tag(user, tag, list(items))
+
+    def find_page_by_user_and_tag(self, user, tag, limit, cursor=None):
+        items, next_cursor = self._query_page(
+            "tag", self._tag_key(user, tag), limit, cursor
+        )
+        return self._find_by_ids_and_tag(user, tag, items), next_cursor
+
     def create_favorite(self, user, favorite):
         id = favorite["id"]
         tags = favorite.get("tags", [])
 
-        item = {"pk": {"S": user}, "sk": {"S": id}}
+        def transaction(record):
+            old_tags = (record or {}).get("tags", {}).get("SS", [])
+            put = {
+                "TableName": config.get("dynamodb_table"),
+                "Item": self._favorite_item(user, id, tags),
+                **self._unchanged_condition(record),
+            }
+            writes = self._tag_index_writes(
+                user,
+                id,
+                added=[it for it in tags if it not in old_tags],
+                removed=[it for it in old_tags if it not in tags],
+            )
 
-        if tags:
-            item["tags"] = {"SS": tags}
+            return [
+                {"Put": put},
+                *self._transact_writes(writes),
+                {"Update": self._version_update(user)},
+            ]
 
-        client.put_item(TableName=config.get("dynamodb_table"), Item=item)
+        record = self._write_favorite(user, id, transaction)
+        favorite = {"id": id, "user": user, "tags": tags}
 
-        return {"id": id, "user": user, "tags": tags}
+        if self.cache is not None:
+            self.cache.put(user, favorite)
+
+        if record is None:
+            self._update_counts({id: 1})
+
+        return favorite
 
     def delete_favorite(self, user, id):
-        client.delete_item(
-            TableName=config.get("dynamodb_table"),
-            Key={"pk": {"S": user}, "sk": {"S": id}},
-            ReturnValues="NONE",
-        )
+        def transaction(record):
+            if record is None:
+                return []
 
-    def add_tag_to_favorite(self, id, user, tag):
-        record = self.find_by_id_and_user(id, user)
+            delete = {
+                "TableName": config.get("dynamodb_table"),
+                "Key": {"pk": {"S": user}, "sk": {"S": id}},
+                **self._unchanged_condition(record),
+            }
+            writes = self._tag_index_writes(
+                user, id, removed=record.get("tags", {}).get("SS", [])
+            )
+
+            return [
+                {"Delete": delete},
+                *self._transact_writes(writes),
+                {"Update": self._version_update(user)},
+            ]
+
+        record = self._write_favorite(user, id, transaction)
+
+        if self.cache is not None:
+            self.cache.remove(user, id)
+
+        if record is not None:
+            self._update_counts({id: -1})
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def _not_processed(self, id):
+        return {"id": id, "status": 503, "error": "not processed"}
+
+    def _failed_writes(self, writes):
+        failed = set()
+
+        for request in self._batch_write(writes):
+            if "PutRequest" in request:
+                key = request["PutRequest"]["Item"]
+            else:
+                key = request["DeleteRequest"]["Key"]
+
+            if key["pk"]["S"].startswith("tag#"):
+                failed.add(self._indexed_id(key))
+            else:
+                failed.add(key["sk"]["S"])
+
+        return failed
+
+    def find_by_ids_and_user(self, ids, user):
+        records, unprocessed = self._find_records(user, ids)
+        results = []
 
-        if not record:
-            raise FavoriteNotFoundException()
+        for id in ids:
+            if id in unprocessed:
+                results.append(self._not_processed(id))
+            elif id in records:
+                favorite = self._format(records[id])
+                results.append({"id": id, "status": 200, "favorite": favorite})
+            else:
+                results.append({"id": id, "status": 404, "error": "not found"})
 
-        tags = record.get("tags", [])
+        return results
 
-        if tag in tags:
-            return record
+    def create_favorites(self, user, favorites):
+        tags_by_id = {it["id"]: it.get("tags", []) for it in favorites}
+        records, unprocessed = self._find_records(user, list(tags_by_id))
+        writes = []
 
-        tags.append(tag)
+        for id, tags in tags_by_id.items():
+            if id in unprocessed:
+                continue
 
-        result = client.update_item(
-            TableName=config.get("dynamodb_table"),
-            Key={"pk": {"S": user}, "sk": {"S": id}},
-            UpdateExpression="SET #tags = :tags",
-            ExpressionAttributeValues={":tags": {"SS": tags}},
-            ExpressionAttributeNames={"#tags": "tags"},
-            ReturnValues="ALL_NEW",
+            old_tags = records.get(id, {}).get("tags", {}).get("SS", [])
+
+            writes.append({"PutRequest": {"Item": self._favorite_item(user, id, tags)}})
+            # Every tag's index item is written, not only those of added tags,
+            # so that retrying a favorite reported as not processed repairs
+            # index items that were lost along the way.
+            writes.extend(
+                self._tag_index_writes(
+                    user,
+                    id,
+                    added=tags,
+                    removed=[it for it in old_tags if it not in tags],
+                )
+            )
+
+        failed = unprocessed | self._failed_writes(writes)
+        results = []
+
+        for id, tags in tags_by_id.items():
+            if id in failed:
+                results.append(self._not_processed(id))
+            else:
+                favorite = {"id": id, "user": user, "tags": tags}
+                results.append({"id": id, "status": 201, "favorite": favorite})
+
+                if self.cache is not None:
+                    self.cache.put(user, favorite)
+
+        self._update_counts(
+            {id: 1 for id in tags_by_id if id not in failed and id not in records}
         )
 
-        return self._format(result["Attributes"])
+        if len(failed) < len(tags_by_id):
+            self._bump_version(user)
 
-    def remove_tag_from_favorite(self, id, user, tag):
-        record = self.find_by_id_and_user(id, user)
+        return results
 
-        if not record:
-            raise FavoriteNotFoundException()
+    def delete_favorites(self, user, ids):
+        ids = list(dict.fromkeys(ids))
+        records, unprocessed = self._find_records(user, ids)
+        writes = []
 
-        tags = record.get("tags", [])
+        for id, record in records.items():
+            writes.append(
+                {"DeleteRequest": {"Key": {"pk": {"S": user}, "sk": {"S": id}}}}
+            )
+            writes.extend(
+                self._tag_index_writes(
+                    user, id, removed=record.get("tags", {}).get("SS", [])
+                )
+            )
 
-        if tag not in tags:
-            return record
+        failed = unprocessed | self._failed_writes(writes)
+        results = []
 
-        tags.remove(tag)
+        for id in ids:
+            if id in failed:
+                results.append(self._not_processed(id))
+            elif id in records:
+                results.append({"id": id, "status": 204})
 
-        if len(tags) > 0:
-            result = client.update_item(
-                TableName=config.get("dynamodb_table"),
-                Key={"pk": {"S": user}, "sk": {"S": id}},
-                UpdateExpression="SET #tags = :tags",
-                ExpressionAttributeValues={":tags": {"SS": tags}},
-                ExpressionAttributeNames={"#tags": "tags"},
-                ReturnValues="ALL_NEW",
+                if self.cache is not None:
+                    self.cache.remove(user, id)
+            else:
+                results.append({"id": id, "status": 404, "error": "not found"})
+
+        deleted = [it["id"] for it in results if it["status"] == 204]
+
+        if deleted:
+            self._update_counts({id: -1 for id in deleted})
+            self._bump_version(user)
+
+        return results
+
+    def _update_tags(self, id, user, action, tag):
+        from schemas import MAX_TAGS
+
+        table = config.get("dynamodb_table")
+        index_key = self._tag_index_key(user, tag, id)
+
+        # The set update only applies if the favorite exists and the tag changes
+        # anything. A single ADD/DELETE on the string set cannot lose
+        # concurrent edits, and DynamoDB drops the attribute itself once a
+        # DELETE leaves the set empty.
+        if action == "ADD":
+            condition = (
+                "attribute_exists(pk) AND NOT contains(#tags, :tag)"
+                " AND (attribute_not_exists(#tags) OR size(#tags) < :max)"
             )
+            values = {":max": {"N": str(MAX_TAGS)}}
         else:
-            result = client.update_item(
-                TableName=config.get("dynamodb_table"),
+            condition = "contains(#tags, :tag)"
+            values = {}
+
+        try:
+            record = get_client().update_item(
+                TableName=table,
                 Key={"pk": {"S": user}, "sk": {"S": id}},
-                UpdateExpression="REMOVE #tags",
+                UpdateExpression=f"{action} #tags :tags",
+                ConditionExpression=condition,
                 ExpressionAttributeNames={"#tags": "tags"},
+                ExpressionAttributeValues={
+                    ":tags": {"SS": [tag]},
+                    ":tag": {"S": tag},
+                    **values,
+                },
                 ReturnValues="ALL_NEW",
-            )
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )["Attributes"]
+        except get_client().exceptions.ConditionalCheckFailedException as e:
+            # Nothing was written: the favorite is missing, the tag would
+            # change nothing, or there is no room left for it.
+            record = e.response.get("Item")
+            tags = (record or {}).get("tags", {}).get("SS", [])
+
+            if record is None:
+                raise FavoriteNotFoundException()
+
+            if action == "ADD" and tag not in tags:
+                raise TooManyTagsException()
+        else:
+            # The index item and the version bump follow the update rather than
+            # sharing a transaction with it, which would cost twice the write
+            # units. Both writes are idempotent; an index item left behind is
+            # skipped by tag lookups, and a missing one is restored by
+            # `backfill.py tags`.
+            if action == "ADD":
+                get_client().put_item(TableName=table, Item=index_key)
+            else:
+                get_client().delete_item(TableName=table, Key=index_key)
+
+            self._bump_version(user)
+
+        favorite = self._format(record)
+
+        if self.cache is not None:
+            self.cache.put(user, favorite)
+
+        return favorite
+
+    def add_tag_to_favorite(self, id, user, tag):
+        return self._update_tags(id, user, "ADD", tag)
+
+    def remove_tag_from_favorite(self, id, user, tag):
+        return self._update_tags(id, user, "DELETE", tag)
+
+    def count_favorites(self, ids):
+        ids = list(dict.fromkeys(ids))
+        counts = dict.fromkeys(ids, 0)
+        items, unprocessed = self._batch_get(self._counter_keys(ids))
+
+        for item in items:
+            counts[self._counted_id(item)] += int(item["count"]["N"])
+
+        # A partial sum would be wrong, so counts that could not be read in
+        # full are reported as unknown.
+        for key in unprocessed:
+            counts[self._counted_id(key)] = None
+
+        return counts
+
+    def find_most_favorited(self, limit):
+        entries, _ = self._read_leaderboard()
+        ranked = sorted(entries.items(), key=lambda it: (-it[1], it[0]))
 
-        return self._format(result["Attributes"])
+        return [{"id": id, "count": count} for id, count in ranked[:limit]]
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from ttl_cache import TtlCache
+import json
+
+
+# GIFs are kept serialized and the cache is bounded by their total size: a
+# parsed Giphy GIF object takes several times the memory of its JSON.
+class GifMetadataCache:
+    def __init__(self, giphy_client, ttl, max_bytes, max_ids_per_request, max_workers):
+        self.giphy_client = giphy_client
+        self.max_ids_per_request = max_ids_per_request
+        self._cache = TtlCache(ttl, max_bytes, sizeof=len)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def add(self, gifs):
+        for gif in gifs:
+            if gif.get("id"):
+                self._cache.set(
+                    gif["id"], json.dumps(gif, separators=(",", ":")).encode()
+                )
+
+    def _get(self, id):
+        data = self._cache.get(id)
+        return json.loads(data) if data is not None else None
+
+    def add_from_response(self, text):
+        try:
+            gifs = json.loads(text).get("data")
+        except Exception:
+            return
+
+        if isinstance(gifs, list):
+            self.add(gifs)
+
+    def _fetch(self, ids):
+        try:
+            response = json.loads(self.giphy_client.get_by_ids(",".join(ids)))
+        except Exception:
+            # Metadata is an enrichment; callers render without it rather than
+            # failing the whole request.
+            return []
+
+        return response.get("data") or []
+
+    def get_response(self, ids):
+        ids = list(dict.fromkeys(ids))
+        cached = {}
+
+        for id in ids:
+            gif = self._get(id)
+
+            if gif is not None:
+                cached[id] = gif
+
+        missing = [id for id in ids if id not in cached]
+
+        if not cached:
+            # Nothing to merge, so Giphy's response is passed through untouched.
+            text = self.giphy_client.get_by_ids(",".join(missing))
+            self.add_from_response(text)
+            return text
+
+        envelope = {"meta": {"status": 200, "msg": "OK", "response_id": ""}}
+
+        if missing:
+            envelope = json.loads(self.giphy_client.get_by_ids(",".join(missing)))
+            gifs = envelope.get("data") or []
+            self.add(gifs)
+            cached.update({it["id"]: it for it in gifs if it.get("id")})
+
+        data = [cached[id] for id in ids if id in cached]
+
+        return json.dumps(
+            {
+                **envelope,
+                "data": data,
+                "pagination": {
+                    "total_count": len(data),
+                    "count": len(data),
+                    "offset": 0,
+                },
+            }
+        )
+
+    def get_many(self, ids):
+        found = {}
+        missing = []
+
+        for id in dict.fromkeys(ids):
+            gif = self._get(id)
+
+            if gif is None:
+                missing.append(id)
+            else:
+                found[id] = gif
+
+        chunks = [
+            missing[i : i + self.max_ids_per_request]
+            for i in range(0, len(missing), self.max_ids_per_request)
+        ]
+
+        if len(chunks) > 1:
+            results = self._executor.map(self._fetch, chunks)
+        else:
+            results = [self._fetch(chunk) for chunk in chunks]
+
+        for gifs in results:
+            self.add(gifs)
+            found.update({it["id"]: it for it in gifs if it.get("id") in missing})
+
+        return found
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
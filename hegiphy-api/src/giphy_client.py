@@ -1,10 +1,74 @@
+from requests.adapters import HTTPAdapter
+from single_flight import SingleFlight
+from urllib3.util.retry import Retry
+import metrics
 import requests
 
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
 
 class GiphyClient:
-    def __init__(self, base_url, api_key):
+    def __init__(
+        self,
+        base_url,
+        api_key,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+        max_retries=2,
+        retry_backoff=0.3,
+    ):
         self.base_url = base_url.rstrip("/")
-        self.api_key = api_key
+        self._api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._create_session(pool_size, max_retries, retry_backoff)
+        self._single_flight = SingleFlight()
+
+    @property
+    def api_key(self):
+        # A callable lets the key rotate (e.g. through config refreshes) without
+        # rebuilding the client and its connection pool.
+        if callable(self._api_key):
+            return self._api_key()
+
+        return self._api_key
+
+    @property
+    def coalesced(self):
+        return self._single_flight.coalesced
+
+    def _create_session(self, pool_size, max_retries, retry_backoff):
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
+
+    def _fetch(self, path, params):
+        response = self.session.get(
+            f"{self.base_url}{path}", params=params, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.text
+
+    def _get(self, path, params):
+        key = (path, tuple(sorted((k, str(v)) for k, v in params.items())))
+
+        with metrics.timer(self._stage(path)):
+            return self._single_flight.do(key, lambda: self._fetch(path, params))
+
+    def _stage(self, path):
+        return "giphy" + path.replace("/", ".")
 
     def get_trending(self, limit=None, rating=None):
         params = {"api_key": self.api_key}
@@ -15,20 +79,12 @@ class GiphyClient:
         if rating:
             params["rating"] = rating
 
-        url = f"{self.base_url}/gifs/trending"
-
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.text
+        return self._get("/gifs/trending", params)
 
     def get_by_ids(self, ids):
         params = {"api_key": self.api_key, "ids": ids}
 
-        url = f"{self.base_url}/gifs"
-
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.text
+        return self._get("/gifs", params)
 
     def query(self, term, offset=None, limit=None, rating=None, lang=None):
         params = {"api_key": self.api_key, "q": term}
@@ -45,8 +101,4 @@ class GiphyClient:
         if lang:
             params["lang"] = lang
 
-        url = f"{self.base_url}/gifs/search"
-
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.text
+        return self._get("/gifs/search", params)
@@ -0,0 +1,54 @@
+from flask.json.provider import DefaultJSONProvider
+import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# Serializes with orjson, which is several times faster than the standard
+# library encoder and produces bytes that can be handed straight to the
+# response. Anything orjson cannot encode the same way (custom encoder
+# arguments, integers wider than 64 bits) goes through the standard encoder.
+class OrjsonProvider(DefaultJSONProvider):
+    def _dumpb(self, obj, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        if indent:
+            option |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {"indent", "separators"}:
+            return super().dumps(obj, **kwargs)
+
+        try:
+            return self._dumpb(obj, kwargs.get("indent")).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+
+        return orjson.loads(s)
+
+    @metrics.timed("serialize")
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+
+        try:
+            body = self._dumpb(obj, indent) + b"\n"
+        except orjson.JSONEncodeError:
+            return super().response(obj)
+
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+JSON_PROVIDER_CLASS = OrjsonProvider if orjson else DefaultJSONProvider
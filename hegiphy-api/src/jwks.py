@@ -0,0 +1,81 @@
+import requests
+import threading
+import time
+
+
+class JwksCache:
+    def __init__(self, url, ttl, min_refresh_interval, refresh_wait, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.refresh_wait = refresh_wait
+        self.timeout = timeout
+        self._keys = None
+        self._fetched_at = 0
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+
+        return {
+            key["kid"]: key
+            for key in response.json().get("keys", [])
+            if key.get("kty") == "RSA" and key.get("use", "sig") == "sig"
+        }
+
+    def _refresh(self):
+        try:
+            keys = self._fetch()
+        except Exception:
+            # Keep serving the previous key set; a new refresh may be attempted
+            # once the minimum refresh interval has elapsed.
+            keys = None
+
+        with self._lock:
+            if keys is not None:
+                self._keys = keys
+            self._fetched_at = time.monotonic()
+            self._refresh_thread = None
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refresh_thread is not None:
+                return self._refresh_thread
+
+            if time.monotonic() - self._fetched_at < self.min_refresh_interval:
+                return None
+
+            self._refresh_thread = threading.Thread(target=self._refresh, daemon=True)
+            self._refresh_thread.start()
+
+            return self._refresh_thread
+
+    def _load(self):
+        with self._lock:
+            if self._keys is not None:
+                return
+
+            self._keys = self._fetch()
+            self._fetched_at = time.monotonic()
+
+    def get_key(self, kid):
+        if self._keys is None:
+            self._load()
+        elif time.monotonic() - self._fetched_at > self.ttl:
+            self._start_refresh()
+
+        key = self._keys.get(kid)
+
+        if key is None:
+            # An unknown kid usually means the signing key rotated; wait briefly
+            # for a (rate limited) refresh that other requests may share.
+            refresh = self._start_refresh()
+
+            if refresh is not None:
+                refresh.join(self.refresh_wait)
+
+            key = self._keys.get(kid)
+
+        return key
@@ -0,0 +1,159 @@
+from base64 import b64decode, b64encode
+from io import BytesIO
+from urllib.parse import urlencode
+import sys
+
+# Translates API Gateway proxy events to WSGI calls and back, in place of awsgi.
+# The environ is built from cached header keys in one pass and the response is
+# joined once, without awsgi's intermediate copies.
+
+# Environ keys of the header names seen so far. Browsers and API Gateway send
+# the same few dozen names on every invocation; the bound keeps arbitrary names
+# sent by clients from growing it forever.
+_HEADER_KEYS = {}
+MAX_HEADER_KEYS = 512
+
+
+def _header_key(name):
+    key = _HEADER_KEYS.get(name)
+
+    if key is None:
+        key = "HTTP_" + name.upper().replace("-", "_")
+
+        if len(_HEADER_KEYS) < MAX_HEADER_KEYS:
+            _HEADER_KEYS[name] = key
+
+    return key
+
+
+def _headers(event):
+    # API Gateway sends both maps; "headers" only keeps the last value of a
+    # repeated header, so the multi-value map is used when one is repeated.
+    headers = event.get("headers") or {}
+    multi = event.get("multiValueHeaders")
+
+    if not multi or max(map(len, multi.values())) < 2:
+        return headers or {k: v[0] for k, v in (multi or {}).items() if v}
+
+    return {
+        name: ("; " if name.lower() == "cookie" else ",").join(values)
+        for name, values in multi.items()
+        if values
+    }
+
+
+def _query_string(event):
+    multi = event.get("multiValueQueryStringParameters")
+
+    if multi and max(map(len, multi.values())) > 1:
+        return urlencode(multi, doseq=True)
+
+    params = event.get("queryStringParameters")
+
+    return urlencode(params) if params else ""
+
+
+def _body(event):
+    body = event.get("body")
+
+    if not body:
+        return b""
+
+    if event.get("isBase64Encoded"):
+        return b64decode(body)
+
+    return body.encode("utf-8") if isinstance(body, str) else body
+
+
+def environ(event, context):
+    body = _body(event)
+    headers = _headers(event)
+    identity = (event.get("requestContext") or {}).get("identity") or {}
+
+    try:
+        environ = {_HEADER_KEYS[k]: v for k, v in headers.items()}
+    except KeyError:
+        environ = {_header_key(k): v for k, v in headers.items()}
+
+    environ.pop("HTTP_CONTENT_LENGTH", None)
+
+    if "HTTP_CONTENT_TYPE" in environ:
+        environ["CONTENT_TYPE"] = environ.pop("HTTP_CONTENT_TYPE")
+
+    environ.update(
+        {
+            "REQUEST_METHOD": event["httpMethod"],
+            "SCRIPT_NAME": "",
+            "PATH_INFO": event["path"],
+            "QUERY_STRING": _query_string(event),
+            "SERVER_NAME": environ.get("HTTP_HOST", ""),
+            "SERVER_PORT": environ.get("HTTP_X_FORWARDED_PORT", ""),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": identity.get("sourceIp") or "127.0.0.1",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": environ.get("HTTP_X_FORWARDED_PROTO", "https"),
+            "wsgi.input": BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "lambda.event": event,
+            "lambda.context": context,
+        }
+    )
+
+    return environ
+
+
+def _is_binary(headers):
+    # Compressed bodies are the only binary ones the app sends; the rest are
+    # returned as text when they are valid UTF-8.
+    return "Content-Encoding" in headers
+
+
+def response(app, event, context):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+
+    output = app(environ(event, context), start_response)
+
+    try:
+        body = b"".join(output)
+    finally:
+        if hasattr(output, "close"):
+            output.close()
+
+    headers = {}
+    multi_value_headers = {}
+
+    for name, value in started["headers"]:
+        if name in multi_value_headers:
+            multi_value_headers[name].append(value)
+        elif name in headers:
+            # Repeated headers (several Set-Cookie, for instance) would be
+            # collapsed in "headers", so they are sent as multiple values.
+            multi_value_headers[name] = [headers.pop(name), value]
+        else:
+            headers[name] = value
+
+    rv = {"statusCode": started["status"], "headers": headers}
+
+    if multi_value_headers:
+        rv["multiValueHeaders"] = multi_value_headers
+
+    if not _is_binary(headers):
+        try:
+            rv["body"] = body.decode("utf-8")
+            rv["isBase64Encoded"] = False
+            return rv
+        except UnicodeDecodeError:
+            pass
+
+    rv["body"] = b64encode(body).decode("ascii")
+    rv["isBase64Encoded"] = True
+
+    return rv
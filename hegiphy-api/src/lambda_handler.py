@@ -1,6 +1,16 @@
 from app import APP
-import awsgi
+import lambda_adapter
+import leaderboard
+import warmer
 
 
 def handler(event, context):
-    return awsgi.response(APP, event, context)
+    # Scheduled pings keep containers and their caches warm, bypassing Flask.
+    if warmer.is_ping(event):
+        return warmer.warm(event)
+
+    # Counter changes from the table's stream refresh the leaderboard.
+    if leaderboard.is_counter_stream(event):
+        return leaderboard.update(event)
+
+    return lambda_adapter.response(APP, event, context)
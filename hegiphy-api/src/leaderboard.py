@@ -0,0 +1,29 @@
+from app import FAVORITES_CLIENT
+
+
+def is_counter_stream(event):
+    # DynamoDB stream batches; the event source mapping only passes on the
+    # records of the popularity counters.
+    records = event.get("Records") if isinstance(event, dict) else None
+
+    return bool(records) and all(
+        it.get("eventSource") == "aws:dynamodb" for it in records
+    )
+
+
+def update(event):
+    keys = [it["dynamodb"]["Keys"] for it in event["Records"]]
+    ids = sorted(
+        {
+            FAVORITES_CLIENT._counted_id(it)
+            for it in keys
+            if it["pk"]["S"].startswith("count#")
+        }
+    )
+
+    # Failing the batch has Lambda retry it, rather than leaving the
+    # leaderboard behind the counters.
+    if ids and not FAVORITES_CLIENT.update_leaderboard(ids):
+        raise RuntimeError("the leaderboard could not be updated")
+
+    return {"updated": ids}
@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import config
+import inspect
+import json
+import threading
+import time
+
+OUTPUTS = ("server-timing", "emf")
+
+# Holds the metrics of the request being served, or None when instrumentation
+# is off, in which case every timer reduces to this lookup.
+_CURRENT = ContextVar("metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self, route, outputs):
+        self.route = route
+        self.outputs = outputs
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.capacity = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, stage, duration):
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + duration, count + 1)
+
+    def add_capacity(self, units):
+        with self._lock:
+            self.capacity += units
+
+    def durations(self):
+        # Milliseconds spent in each stage, a stage that ran more than once
+        # counting all of its runs.
+        return {name: total * 1000 for name, (total, _) in self.stages.items()}
+
+    def server_timing(self, total):
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.durations().items()]
+        entries.append(f'dynamodb.capacity;desc="{self.capacity:g}"')
+        entries.append(f"total;dur={total:.1f}")
+
+        return ", ".join(entries)
+
+    def emf(self, total):
+        values = {**self.durations(), "total": total}
+
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": config.get("metrics_namespace"),
+                        "Dimensions": [["Route"]],
+                        "Metrics": [
+                            *({"Name": it, "Unit": "Milliseconds"} for it in values),
+                            {"Name": "dynamodb.capacity", "Unit": "Count"},
+                        ],
+                    }
+                ],
+            },
+            "Route": self.route,
+            **values,
+            "dynamodb.capacity": self.capacity,
+        }
+
+
+def configured_outputs():
+    return [
+        it.strip() for it in config.get("metrics").split(",") if it.strip() in OUTPUTS
+    ]
+
+
+def start(route):
+    outputs = configured_outputs()
+    _CURRENT.set(RequestMetrics(route, outputs) if outputs else None)
+
+
+def finish(response):
+    metrics = _CURRENT.get()
+
+    if metrics is None:
+        return response
+
+    _CURRENT.set(None)
+    total = (time.perf_counter() - metrics.started_at) * 1000
+
+    if "server-timing" in metrics.outputs:
+        response.headers["Server-Timing"] = metrics.server_timing(total)
+
+    if "emf" in metrics.outputs:
+        # Lambda sends stdout to CloudWatch Logs, which extracts the metrics
+        # from lines in the embedded metric format. Each line is one sample of
+        # the route's latency distributions.
+        print(json.dumps(metrics.emf(total)), flush=True)
+
+    return response
+
+
+@contextmanager
+def timer(stage):
+    metrics = _CURRENT.get()
+
+    if metrics is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        metrics.add(stage, time.perf_counter() - started_at)
+
+
+def timed(stage):
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+
+            @wraps(f)
+            async def wrapper(*args, **kwargs):
+                with timer(stage):
+                    return await f(*args, **kwargs)
+
+        elif inspect.isgeneratorfunction(f):
+
+            # Only the time spent producing items counts, not the time the
+            # consumer spends between them.
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                items = f(*args, **kwargs)
+
+                while True:
+                    with timer(stage):
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            return
+
+                    yield item
+
+        else:
+
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                metrics = _CURRENT.get()
+
+                if metrics is None:
+                    return f(*args, **kwargs)
+
+                started_at = time.perf_counter()
+
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    metrics.add(stage, time.perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+def instrumented(prefix):
+    # Times every public method of the decorated class as "<prefix>.<method>".
+    def decorator(cls):
+        for name, value in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.isfunction(value):
+                setattr(cls, name, timed(f"{prefix}.{name}")(value))
+
+        return cls
+
+    return decorator
+
+
+def _record_capacity(parsed, **kwargs):
+    metrics = _CURRENT.get()
+
+    if metrics is None:
+        return
+
+    consumed = parsed.get("ConsumedCapacity") or []
+
+    # Batch operations report a list, one entry per table.
+    for it in [consumed] if isinstance(consumed, dict) else consumed:
+        metrics.add_capacity(it.get("CapacityUnits", 0))
+
+
+def _request_capacity(params, model, **kwargs):
+    if (
+        _CURRENT.get() is not None
+        and "ReturnConsumedCapacity" in model.input_shape.members
+    ):
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def instrument_dynamodb(client):
+    client.meta.events.register("provide-client-params.dynamodb", _request_capacity)
+    client.meta.events.register("after-call.dynamodb", _record_capacity)
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from ttl_cache import TtlCache
+import threading
+
+
+# Loads pages that are likely to be asked for next in the background. At most
+# `max_in_flight` prefetches run at once and further ones are dropped rather
+# than queued. Each term may have at most `budget` prefetched pages nobody has
+# asked for yet, so a term nobody pages through costs at most that many extra
+# upstream calls until its pages expire after `ttl`.
+class Prefetcher:
+    def __init__(self, max_in_flight, budget, ttl, max_size):
+        self.max_in_flight = max_in_flight
+        self.budget = budget
+        self.prefetched = 0
+        self.used = 0
+        self.skipped = 0
+        self.failed = 0
+        self._in_flight = 0
+        self._pages = TtlCache(ttl, max_size)
+        self._unused = TtlCache(ttl, max_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._lock = threading.Lock()
+
+    def _release(self, group):
+        unused = self._unused.get(group, 0)
+
+        if unused > 1:
+            self._unused.set(group, unused - 1)
+        else:
+            self._unused.delete(group)
+
+    def submit(self, key, group, load):
+        with self._lock:
+            unused = self._unused.get(group, 0)
+
+            if (
+                self._in_flight >= self.max_in_flight
+                or unused >= self.budget
+                or self._pages.get(key) is not None
+            ):
+                self.skipped += 1
+                return False
+
+            self._in_flight += 1
+            self._unused.set(group, unused + 1)
+            # Marked before it is loaded: a request arriving in the meantime
+            # joins the upstream call in flight and so still uses the page.
+            self._pages.set(key, group)
+
+        self._executor.submit(self._load, key, group, load)
+
+        return True
+
+    def _load(self, key, group, load):
+        try:
+            load()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+
+                if self._pages.get(key) is not None:
+                    self._pages.delete(key)
+                    self._release(group)
+        else:
+            with self._lock:
+                self.prefetched += 1
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def served(self, key):
+        with self._lock:
+            group = self._pages.get(key)
+
+            if group is None:
+                return False
+
+            self._pages.delete(key)
+            self._release(group)
+            self.used += 1
+
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._unused.clear()
+            self.prefetched = 0
+            self.used = 0
+            self.skipped = 0
+            self.failed = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefetched": self.prefetched,
+                "used": self.used,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "in_flight": self._in_flight,
+                "used_ratio": self.used / self.prefetched if self.prefetched else 0.0,
+            }
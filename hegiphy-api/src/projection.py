@@ -0,0 +1,46 @@
+from flask import json
+import metrics
+
+# The GIF id is always returned so that projected results can still be matched
+# against favorites.
+ALWAYS_INCLUDED_FIELDS = {"id"}
+
+
+def parse_names(value):
+    names = {it.strip().lower() for it in (value or "").split(",") if it.strip()}
+    return ",".join(sorted(names)) or None
+
+
+def project_gif(gif, fields=None, renditions=None):
+    if not isinstance(gif, dict):
+        return gif
+
+    if fields:
+        keep = set(fields.split(",")) | ALWAYS_INCLUDED_FIELDS
+
+        if renditions:
+            keep.add("images")
+
+        gif = {k: v for k, v in gif.items() if k in keep}
+
+    if renditions and isinstance(gif.get("images"), dict):
+        keep = set(renditions.split(","))
+        gif = {**gif, "images": {k: v for k, v in gif["images"].items() if k in keep}}
+
+    return gif
+
+
+def project_response(text, fields=None, renditions=None):
+    if not fields and not renditions:
+        return text
+
+    with metrics.timer("project"):
+        response = json.loads(text)
+        data = response.get("data")
+
+        if isinstance(data, list):
+            response["data"] = [project_gif(it, fields, renditions) for it in data]
+        elif isinstance(data, dict):
+            response["data"] = project_gif(data, fields, renditions)
+
+        return json.dumps(response)
@@ -0,0 +1,33 @@
+from collections import Counter
+import threading
+
+
+# Counts the search terms served. Counts are halved at every decay, so that the
+# top terms follow recent traffic, and the least searched terms are dropped once
+# twice `max_size` terms are tracked.
+class RecentTerms:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, term):
+        with self._lock:
+            self._counts[term] += 1
+
+            if len(self._counts) > self.max_size * 2:
+                self._counts = Counter(dict(self._counts.most_common(self.max_size)))
+
+    def top(self, n):
+        with self._lock:
+            return [term for term, _ in self._counts.most_common(n)]
+
+    def decay(self):
+        with self._lock:
+            self._counts = Counter(
+                {term: count // 2 for term, count in self._counts.items() if count > 1}
+            )
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
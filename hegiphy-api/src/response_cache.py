@@ -0,0 +1,198 @@
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+CacheEntry = namedtuple("CacheEntry", ["value", "stored_at"])
+
+
+# Process-local LRU backend bounded by the total size of the cached values. Any
+# object exposing the same get/set/delete/clear methods (for example a client
+# for a shared store) may be passed to ResponseCache in its place.
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+
+            if entry is not None:
+                self._items.move_to_end(key)
+
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry.value)
+
+        with self._lock:
+            self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            self._items[key] = entry
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._items)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._items.pop(key, None)
+
+        if entry is not None:
+            self.size -= len(entry.value)
+
+
+class ResponseCache:
+    def __init__(self, backend, ttls, stale_ttl=0):
+        self.backend = backend
+        self.ttls = ttls
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        params = {k: v for k, v in params.items() if v is not None}
+        return f"{endpoint}?{urlencode(sorted(params.items()))}"
+
+    def _lookup(self, endpoint, params):
+        key = self.make_key(endpoint, params)
+        entry = self.backend.get(key)
+
+        if entry is not None:
+            ttl = self.ttls[endpoint]
+            age = time.time() - entry.stored_at
+
+            if age < ttl:
+                self.hits += 1
+                return key, entry, False
+
+            if age < ttl + self.stale_ttl:
+                self.stale_hits += 1
+                return key, entry, True
+
+        self.misses += 1
+        return key, None, False
+
+    def is_fresh(self, endpoint, params):
+        entry = self.backend.get(self.make_key(endpoint, params))
+
+        if entry is None:
+            return False
+
+        return time.time() - entry.stored_at < self.ttls.get(endpoint, 0)
+
+    def put(self, endpoint, params, value):
+        if self.ttls.get(endpoint, 0) > 0:
+            self._store(self.make_key(endpoint, params), value)
+
+        return value
+
+    def get_or_load(self, endpoint, params, loader):
+        if self.ttls.get(endpoint, 0) <= 0:
+            return loader()
+
+        key, entry, stale = self._lookup(endpoint, params)
+
+        if entry is None:
+            return self._load(key, loader)
+
+        if stale:
+            self._refresh_in_background(key, loader)
+
+        return entry.value
+
+    async def get_or_load_async(self, endpoint, params, loader):
+        # Imported here so that the WSGI and Lambda entry points, which never
+        # get here, do not load asyncio on a cold start.
+        import asyncio
+
+        if self.ttls.get(endpoint, 0) <= 0:
+            return await loader()
+
+        key, entry, stale = self._lookup(endpoint, params)
+
+        if entry is None:
+            return self._store(key, await loader())
+
+        if stale and self._start_refresh(key):
+            asyncio.ensure_future(self._refresh_async(key, loader))
+
+        return entry.value
+
+    def _store(self, key, value):
+        self.backend.set(key, CacheEntry(value, time.time()))
+        return value
+
+    def _load(self, key, loader):
+        return self._store(key, loader())
+
+    def _start_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        return True
+
+    def _end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, loader):
+        if not self._start_refresh(key):
+            return
+
+        def refresh():
+            try:
+                self._load(key, loader)
+            except Exception:
+                # The stale entry keeps being served until it expires entirely,
+                # but failures (a revoked API key, say) must not go unnoticed.
+                _LOGGER.warning("refreshing %s failed", key, exc_info=True)
+            finally:
+                self._end_refresh(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    async def _refresh_async(self, key, loader):
+        try:
+            self._store(key, await loader())
+        except Exception:
+            _LOGGER.warning("refreshing %s failed", key, exc_info=True)
+        finally:
+            self._end_refresh(key)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing),
+        }
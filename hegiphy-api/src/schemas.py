@@ -0,0 +1,14 @@
+from marshmallow import Schema, fields, validate
+
+MAX_TAG_LENGTH = 140
+# A favorite is written in one transaction along with an index item per added
+# and removed tag, and transactions hold at most 100 items.
+MAX_TAGS = 40
+
+
+class FavoriteSchema(Schema):
+    id = fields.String(required=True, validates=validate.Length(max=1024))
+    tags = fields.List(
+        fields.String(validates=validate.Length(max=MAX_TAG_LENGTH)),
+        validate=validate.Length(max=MAX_TAGS),
+    )
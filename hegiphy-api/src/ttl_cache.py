@@ -0,0 +1,83 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+# `max_size` bounds the number of entries, or their total size as measured by
+# `sizeof` when one is given.
+class TtlCache:
+    def __init__(self, ttl, max_size, sizeof=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        entry = self._items.pop(key, None)
+
+        if entry is not None:
+            self.size -= self.sizeof(entry[0])
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._items.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        size = self.sizeof(value)
+
+        if ttl <= 0 or size > self.max_size:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (value, time.monotonic() + ttl)
+            self.size += size
+
+            while self.size > self.max_size:
+                self._remove(next(iter(self._items)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._items),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._items)
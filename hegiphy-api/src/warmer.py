@@ -0,0 +1,78 @@
+from app import (
+    FAVORITES_CLIENT,
+    GIPHY_CACHE,
+    GIPHY_QUERY_EXECUTOR,
+    RECENT_TERMS,
+    load_query,
+    load_trending,
+)
+from concurrent.futures import wait
+import config
+import auth
+import time
+
+# The parameters requests get when they leave them out, so that the warmed pages
+# are the ones most requests look up.
+TRENDING_PARAMS = {"limit": None, "rating": "g"}
+QUERY_PARAMS = {"offset": 0, "limit": 25, "rating": "g", "lang": "en"}
+PROJECTION = {"fields": None, "renditions": None}
+
+
+def is_ping(event):
+    # Scheduled EventBridge rules send "aws.events" events, unless the rule has
+    # a constant input, which may be {"warmer": {"terms": [...]}}.
+    return isinstance(event, dict) and (
+        "warmer" in event or event.get("source") == "aws.events"
+    )
+
+
+def _warm_trending():
+    GIPHY_CACHE.put(
+        "trending",
+        {**TRENDING_PARAMS, **PROJECTION},
+        load_trending(TRENDING_PARAMS, PROJECTION),
+    )
+
+
+def _warm_query(term):
+    params = {"term": term, **QUERY_PARAMS}
+    GIPHY_CACHE.put("query", {**params, **PROJECTION}, load_query(params, PROJECTION))
+
+
+def _terms(event):
+    options = event.get("warmer")
+    requested = options.get("terms", []) if isinstance(options, dict) else []
+    count = int(config.get("warm_search_terms"))
+
+    # Normalized like the "q" parameter of /giphy/query.
+    terms = [" ".join(str(it).lower().split()) for it in requested]
+    terms = [it for it in terms if it] + RECENT_TERMS.top(count)
+
+    return list(dict.fromkeys(terms))[:count]
+
+
+def warm(event):
+    started_at = time.perf_counter()
+    terms = _terms(event)
+    RECENT_TERMS.decay()
+
+    # Opens the Auth0, DynamoDB and Giphy connections (loading config from SSM
+    # on the way) and refreshes the pages most requests ask for.
+    tasks = {
+        "auth": auth.warm,
+        "dynamodb": lambda: FAVORITES_CLIENT.find_most_favorited(1),
+        "trending": _warm_trending,
+        **{f"query {it}": lambda it=it: _warm_query(it) for it in terms},
+    }
+    futures = {name: GIPHY_QUERY_EXECUTOR.submit(it) for name, it in tasks.items()}
+    wait(futures.values(), timeout=float(config.get("giphy_batch_deadline")))
+
+    warmed = [
+        name for name, it in futures.items() if it.done() and it.exception() is None
+    ]
+
+    return {
+        "warmed": warmed,
+        "failed": [name for name in futures if name not in warmed],
+        "duration_ms": round((time.perf_counter() - started_at) * 1000, 1),
+    }
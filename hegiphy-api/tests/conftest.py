@@ -4,6 +4,9 @@ import pytest
 import json
 import mock
 import boto3
+import sys
+import config
+import auth
 
 
 class MockResponse:
@@ -41,6 +44,30 @@ def mock_ssm_config(monkeypatch):
     stubber.activate()
 
 
+@pytest.fixture
+def override_config(monkeypatch):
+    def _override_config(**values):
+        config.get("auth0_domain")
+
+        for name, value in values.items():
+            monkeypatch.setitem(config._COMPILED_CONFIG, name, value)
+
+    return _override_config
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    yield
+    auth.clear_cache()
+
+    app = sys.modules.get("app")
+
+    if app:
+        for cache in (app.GIPHY_CACHE, app.GIF_CACHE, app.PREFETCHER, app.RECENT_TERMS):
+            if cache.initialized:
+                cache.clear()
+
+
 @pytest.fixture
 def call_handler():
     def _call_handler(handler, method, url, headers=None, data=None, authorizer=None):
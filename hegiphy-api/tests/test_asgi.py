@@ -0,0 +1,203 @@
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from async_giphy_client import AsyncGiphyClient
+from botocore.stub import Stubber
+from collections import namedtuple
+import favorites_client
+import requests_mock
+import aiohttp
+import asyncio
+import pytest
+import json
+import asgi
+
+Response = namedtuple("Response", ["status", "headers", "json"])
+
+
+class Upstream:
+    def __init__(self, monkeypatch):
+        self.monkeypatch = monkeypatch
+        self.requests = []
+        self.responses = {}
+
+    async def handle(self, request):
+        self.requests.append(request.rel_url)
+        responses = self.responses.get(request.path, [(404, {})])
+        status, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        return web.json_response(body, status=status)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.giphy_client = AsyncGiphyClient(
+            str(self.server.make_url("/v1")), "mock_giphy_api_key", retry_backoff=0
+        )
+        self.http_client = aiohttp.ClientSession()
+
+        self.monkeypatch.setattr("asgi.GIPHY_CLIENT", self.giphy_client)
+        self.monkeypatch.setattr("asgi.HTTP_CLIENT", self.http_client)
+        self.monkeypatch.setattr(
+            "auth._userinfo_url", lambda: str(self.server.make_url("/userinfo"))
+        )
+
+        return self
+
+    async def __aexit__(self, *args):
+        await self.giphy_client.close()
+        await self.http_client.close()
+        await self.server.close()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    return Upstream(monkeypatch)
+
+
+async def _get(path, headers=None):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode("latin-1"),
+        "headers": [
+            (k.lower().encode(), v.encode()) for k, v in (headers or {}).items()
+        ],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope, receive, send)
+    start, body = messages
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+
+    if headers["content-type"] == "application/json":
+        return Response(start["status"], headers, json.loads(body["body"]))
+
+    return Response(start["status"], headers, None)
+
+
+def test_query_is_served_asynchronously(upstream):
+    upstream.responses["/v1/gifs/search"] = [(200, {"data": [{"id": "a"}]})]
+
+    async def scenario():
+        async with upstream:
+            return await asyncio.gather(
+                _get("/giphy/query?q=Foo", {"Origin": "http://ui"}),
+                _get("/giphy/query?q=foo", {"Origin": "http://ui"}),
+            )
+
+    for response in asyncio.run(scenario()):
+        assert response.status == 200
+        assert response.json == {"data": [{"id": "a"}]}
+        assert response.headers["content-type"] == "application/json"
+        assert response.headers["access-control-allow-origin"] == "http://ui"
+
+    assert len(upstream.requests) == 1
+    assert upstream.requests[0].query["q"] == "foo"
+
+
+def test_trending_retries_server_errors(upstream):
+    upstream.responses["/v1/gifs/trending"] = [(503, {}), (200, {"data": []})]
+
+    async def scenario():
+        async with upstream:
+            return await _get("/giphy/trending")
+
+    response = asyncio.run(scenario())
+
+    assert response.status == 200
+    assert response.json == {"data": []}
+    assert len(upstream.requests) == 2
+
+
+def test_http_exceptions_are_rendered_like_the_flask_app(upstream):
+    async def scenario():
+        async with upstream:
+            return await _get("/giphy/query")
+
+    response = asyncio.run(scenario())
+
+    assert response.status == 400
+    assert response.json == {"error": 'the "q" parameter is required'}
+
+
+def test_unexpected_errors_go_through_the_flask_error_handling(upstream):
+    async def fail(**kwargs):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        async with upstream:
+            upstream.monkeypatch.setattr(upstream.giphy_client, "get_trending", fail)
+            return await _get("/giphy/trending", {"Origin": "http://ui"})
+
+    response = asyncio.run(scenario())
+
+    assert response.status == 500
+    assert response.headers["access-control-allow-origin"] == "http://ui"
+
+
+def test_unauthenticated_requests_are_rejected_without_flask(upstream):
+    upstream.responses["/userinfo"] = [(401, {})]
+
+    async def scenario():
+        async with upstream:
+            return (
+                await _get("/favorites/1"),
+                await _get("/favorites", {"Authorization": "Bearer bad"}),
+            )
+
+    with requests_mock.mock():
+        missing, rejected = asyncio.run(scenario())
+
+    assert missing.status == 401
+    assert rejected.status == 401
+    assert rejected.json == {"error": "Unauthorized"}
+    assert [it.path for it in upstream.requests] == ["/userinfo"]
+
+
+def test_favorites_are_delegated_to_flask_after_async_auth(upstream):
+    upstream.responses["/userinfo"] = [(200, {"email": "foo@bar.com"})]
+
+    async def scenario():
+        async with upstream:
+            return await _get("/favorites", {"Authorization": "Bearer t"})
+
+    with Stubber(favorites_client.get_client()) as dynamodb_mock:
+        dynamodb_mock.add_response("get_item", {})
+        dynamodb_mock.add_response(
+            "query",
+            {"Items": [{"pk": {"S": "foo@bar.com"}, "sk": {"S": "1"}}]},
+            {
+                "TableName": "hegiphy",
+                "KeyConditionExpression": "pk = :user",
+                "ExpressionAttributeValues": {":user": {"S": "foo@bar.com"}},
+            },
+        )
+
+        # Any blocking call to Auth0 from the Flask app would fail here.
+        with requests_mock.mock():
+            response = asyncio.run(scenario())
+
+    assert response.status == 200
+    assert response.json == [{"id": "1", "user": "foo@bar.com", "tags": []}]
+
+
+def test_unknown_routes_are_delegated_to_flask(upstream):
+    async def scenario():
+        async with upstream:
+            return await _get("/nothing-here")
+
+    response = asyncio.run(scenario())
+
+    assert response.status == 404
+    assert upstream.requests == []
@@ -0,0 +1,207 @@
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from error import HttpException
+from flask import g
+from jose import jwk, jwt
+import requests_mock
+import pytest
+import time
+import auth
+
+USERINFO_URL = "https://budb-hegiphy.auth0.com/userinfo"
+
+
+@pytest.fixture
+def app():
+    from app import APP
+
+    return APP
+
+
+def _authenticate(app, token):
+    with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+        auth.auth()
+        return g.current_user
+
+
+def test_token_is_cached(app):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(USERINFO_URL, json={"email": "foo@bar.com"})
+
+        assert _authenticate(app, "foo-token") == "foo@bar.com"
+        assert _authenticate(app, "foo-token") == "foo@bar.com"
+
+        assert req_mock.call_count == 1
+
+    stats = auth.cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_distinct_tokens_are_cached_separately(app):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(
+            USERINFO_URL,
+            [{"json": {"email": "foo@bar.com"}}, {"json": {"email": "baz@bar.com"}}],
+        )
+
+        assert _authenticate(app, "foo-token") == "foo@bar.com"
+        assert _authenticate(app, "baz-token") == "baz@bar.com"
+        assert _authenticate(app, "foo-token") == "foo@bar.com"
+
+        assert req_mock.call_count == 2
+
+
+def test_rejected_token_is_negatively_cached(app):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(USERINFO_URL, status_code=401)
+
+        for _ in range(2):
+            with pytest.raises(HttpException) as e:
+                _authenticate(app, "bad-token")
+            assert e.value.status_code == 401
+
+        assert req_mock.call_count == 1
+
+
+def test_transient_failure_is_not_cached(app):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(
+            USERINFO_URL,
+            [{"status_code": 503}, {"json": {"email": "foo@bar.com"}}],
+        )
+
+        with pytest.raises(HttpException) as e:
+            _authenticate(app, "foo-token")
+        assert e.value.status_code == 401
+
+        assert _authenticate(app, "foo-token") == "foo@bar.com"
+        assert req_mock.call_count == 2
+
+
+def test_cached_tokens_expire_with_the_token(app, monkeypatch):
+    now = time.time()
+    short_lived = jwt.encode({"exp": now + 10}, "secret", algorithm="HS256")
+    expired = jwt.encode({"exp": now - 10}, "secret", algorithm="HS256")
+
+    with requests_mock.mock() as req_mock:
+        req_mock.get(USERINFO_URL, json={"email": "foo@bar.com"})
+
+        for token in (short_lived, short_lived, expired, expired):
+            assert _authenticate(app, token) == "foo@bar.com"
+
+        assert req_mock.call_count == 3
+
+        later = time.monotonic() + 11
+        monkeypatch.setattr("time.monotonic", lambda: later)
+
+        assert _authenticate(app, short_lived) == "foo@bar.com"
+        assert req_mock.call_count == 4
+
+
+JWKS_URL = "https://budb-hegiphy.auth0.com/.well-known/jwks.json"
+AUDIENCE = "https://api.hegiphy.budjb.com"
+ISSUER = "https://budb-hegiphy.auth0.com/"
+
+
+def _generate_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    public_jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": kid}
+
+    return private_pem, public_jwk
+
+
+def _sign(private_pem, kid, **claims):
+    now = int(time.time())
+    payload = {
+        "iss": ISSUER,
+        "aud": AUDIENCE,
+        "iat": now,
+        "exp": now + 3600,
+        "email": "foo@bar.com",
+        **claims,
+    }
+    return jwt.encode(payload, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def jwt_mode(override_config):
+    override_config(
+        auth_mode="jwt", auth0_audience=AUDIENCE, jwks_min_refresh_interval="0"
+    )
+
+
+def test_jwt_is_verified_locally(app, jwt_mode):
+    private_pem, public_jwk = _generate_key("key-1")
+
+    with requests_mock.mock() as req_mock:
+        req_mock.get(JWKS_URL, json={"keys": [public_jwk]})
+
+        token = _sign(private_pem, "key-1")
+
+        assert _authenticate(app, token) == "foo@bar.com"
+        assert _authenticate(app, token) == "foo@bar.com"
+
+        assert req_mock.call_count == 1
+        assert req_mock.request_history[0].url == JWKS_URL
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"exp": int(time.time()) - 60},
+        {"aud": "https://some-other-api"},
+        {"iss": "https://evil.auth0.com/"},
+        {"email": None},
+    ],
+)
+def test_jwt_with_invalid_claims_is_rejected(app, jwt_mode, claims):
+    private_pem, public_jwk = _generate_key("key-1")
+
+    with requests_mock.mock() as req_mock:
+        req_mock.get(JWKS_URL, json={"keys": [public_jwk]})
+
+        with pytest.raises(HttpException) as e:
+            _authenticate(app, _sign(private_pem, "key-1", **claims))
+        assert e.value.status_code == 401
+
+
+def test_jwt_with_wrong_signature_is_rejected(app, jwt_mode):
+    _, public_jwk = _generate_key("key-1")
+    other_private_pem, _ = _generate_key("key-1")
+
+    with requests_mock.mock() as req_mock:
+        req_mock.get(JWKS_URL, json={"keys": [public_jwk]})
+
+        with pytest.raises(HttpException) as e:
+            _authenticate(app, _sign(other_private_pem, "key-1"))
+        assert e.value.status_code == 401
+
+
+def test_jwks_is_refreshed_when_kid_rotates(app, jwt_mode):
+    old_private_pem, old_public_jwk = _generate_key("key-1")
+    new_private_pem, new_public_jwk = _generate_key("key-2")
+
+    with requests_mock.mock() as req_mock:
+        req_mock.get(
+            JWKS_URL,
+            [
+                {"json": {"keys": [old_public_jwk]}},
+                {"json": {"keys": [old_public_jwk, new_public_jwk]}},
+            ],
+        )
+
+        assert _authenticate(app, _sign(old_private_pem, "key-1")) == "foo@bar.com"
+        assert _authenticate(app, _sign(new_private_pem, "key-2")) == "foo@bar.com"
+        assert _authenticate(app, _sign(old_private_pem, "key-1")) == "foo@bar.com"
+
+        assert req_mock.call_count == 2
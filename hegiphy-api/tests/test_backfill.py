@@ -0,0 +1,120 @@
+from botocore.stub import ANY, Stubber
+from favorites_client import FavoritesClient, LEADERBOARD_KEY
+import backfill
+import favorites_client
+import pytest
+
+
+@pytest.fixture
+def dynamodb_mock():
+    with Stubber(favorites_client.get_client()) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def _item(pk, sk, **attributes):
+    return {"pk": {"S": pk}, "sk": {"S": sk}, **attributes}
+
+
+def test_backfill_tags(dynamodb_mock):
+    dynamodb_mock.add_response(
+        "scan",
+        {
+            "Items": [
+                _item("foo@bar.com", "1", tags={"SS": ["a", "b"]}),
+                _item("foo@bar.com", "2"),
+                _item("tag#foo@bar.com#a", "tag#1"),
+                _item("version#foo@bar.com", "version#foo@bar.com"),
+                _item("leaderboard", "leaderboard"),
+            ]
+        },
+        {"TableName": "hegiphy"},
+    )
+    dynamodb_mock.add_response(
+        "batch_write_item",
+        {},
+        {
+            "RequestItems": {
+                "hegiphy": [
+                    {"PutRequest": {"Item": _item("tag#foo@bar.com#a", "tag#1")}},
+                    {"PutRequest": {"Item": _item("tag#foo@bar.com#b", "tag#1")}},
+                ]
+            }
+        },
+    )
+
+    assert backfill.backfill_tags(FavoritesClient()) == {
+        "written": 2,
+        "unprocessed": 0,
+    }
+
+
+def test_backfill_counts(dynamodb_mock, override_config):
+    override_config(popularity_counter_shards="1", leaderboard_candidates="2")
+
+    dynamodb_mock.add_response(
+        "scan",
+        {
+            "Items": [
+                _item("foo@bar.com", "a"),
+                _item("count#c#0", "count#c#0", count={"N": "1"}),
+                _item("foo@bar.com", "b"),
+                _item("bar@foo.com", "a"),
+            ]
+        },
+        {"TableName": "hegiphy"},
+    )
+    keys = [_item(f"count#{it}#0", f"count#{it}#0") for it in ("a", "c", "b")]
+    dynamodb_mock.add_response(
+        "batch_get_item",
+        {
+            "Responses": {
+                "hegiphy": [
+                    {**keys[0], "count": {"N": "1"}},
+                    {**keys[1], "count": {"N": "1"}},
+                ]
+            }
+        },
+        {"RequestItems": {"hegiphy": {"Keys": keys}}},
+    )
+    dynamodb_mock.add_response(
+        "transact_write_items",
+        {},
+        {
+            "TransactItems": [
+                {
+                    "Update": {
+                        "TableName": "hegiphy",
+                        "Key": key,
+                        "UpdateExpression": "ADD #count :delta",
+                        "ExpressionAttributeNames": {"#count": "count"},
+                        "ExpressionAttributeValues": {":delta": {"N": delta}},
+                    }
+                }
+                for key, delta in zip(keys, ["1", "-1", "1"])
+            ]
+        },
+    )
+    dynamodb_mock.add_response(
+        "get_item",
+        {},
+        {"TableName": "hegiphy", "Key": LEADERBOARD_KEY, "ConsistentRead": True},
+    )
+    dynamodb_mock.add_response(
+        "put_item",
+        {},
+        {
+            "TableName": "hegiphy",
+            "Item": {
+                **LEADERBOARD_KEY,
+                "entries": {"M": {"a": {"N": "2"}, "b": {"N": "1"}}},
+                "revision": {"N": "1"},
+            },
+            "ConditionExpression": ANY,
+        },
+    )
+
+    assert backfill.backfill_counts(FavoritesClient()) == {
+        "written": 3,
+        "unprocessed": 0,
+    }
@@ -0,0 +1,90 @@
+from base64 import b64decode
+import requests_mock
+import brotli
+import config
+import gzip
+import json
+
+PAGE = {"data": [{"id": str(i), "title": "funny cat"} for i in range(100)]}
+
+
+def _query(handler, call_handler, accept_encoding):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(
+            f"{config.get('giphy_base_url')}/gifs/search", text=json.dumps(PAGE)
+        )
+
+        return call_handler(
+            handler,
+            "GET",
+            "/giphy/query?q=cats",
+            headers={"Accept-Encoding": accept_encoding},
+        )
+
+
+def test_responses_are_not_compressed_by_default(handler, call_handler):
+    response = _query(handler, call_handler, "gzip, br")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.json == PAGE
+
+
+def test_gzip_compression(handler, call_handler, override_config):
+    override_config(response_compression="gzip")
+
+    response = _query(handler, call_handler, "gzip, deflate")
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(b64decode(response.body))) == PAGE
+
+
+def test_brotli_is_preferred_in_configured_order(
+    handler, call_handler, override_config
+):
+    override_config(response_compression="br,gzip")
+
+    response = _query(handler, call_handler, "gzip, br")
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(b64decode(response.body))) == PAGE
+
+
+def test_unaccepted_encodings_are_not_used(handler, call_handler, override_config):
+    override_config(response_compression="br")
+
+    response = _query(handler, call_handler, "gzip")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.json == PAGE
+
+
+def test_small_responses_are_not_compressed(handler, call_handler, override_config):
+    override_config(response_compression="gzip")
+
+    response = call_handler(
+        handler, "GET", "/giphy/query", headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert response.status_code == 400
+    assert "Content-Encoding" not in response.headers
+    assert response.json == {"error": 'the "q" parameter is required'}
+
+
+def test_compressed_responses_have_weak_etags(handler, call_handler, override_config):
+    override_config(response_compression="gzip")
+
+    response = _query(handler, call_handler, "gzip")
+    etag = response.headers["ETag"]
+
+    assert etag.startswith('W/"')
+
+    with requests_mock.mock():
+        response = call_handler(
+            handler,
+            "GET",
+            "/giphy/query?q=cats",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+        )
+
+    assert response.status_code == 304
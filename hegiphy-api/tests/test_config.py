@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import pytest
+import config
+import time
+
+
+class FakeSsmClient:
+    def __init__(self, pages, delay=0):
+        self.pages = pages
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_parameters_by_path(self, **kwargs):
+        with self._lock:
+            self.calls.append(kwargs)
+
+        time.sleep(self.delay)
+
+        page = self.pages[kwargs.get("NextToken", 0)]
+
+        if isinstance(page, Exception):
+            raise page
+
+        return page
+
+
+def _params(**values):
+    return [{"Name": f"/hegiphy/{k}", "Value": v} for k, v in values.items()]
+
+
+@pytest.fixture
+def ssm_client(monkeypatch):
+    def _ssm_client(pages, delay=0):
+        client = FakeSsmClient(pages, delay)
+        monkeypatch.setattr("config._get_ssm_client", lambda: client)
+        return client
+
+    monkeypatch.setattr("config._COMPILED_CONFIG", None)
+    monkeypatch.setattr("config._LOADED_AT", 0)
+    yield _ssm_client
+
+
+def _wait_for_refresh():
+    thread = config._REFRESH_THREAD
+
+    if thread is not None:
+        thread.join(5)
+
+
+def test_all_parameter_pages_are_loaded(ssm_client):
+    client = ssm_client(
+        {
+            0: {"Parameters": _params(a="1"), "NextToken": "second"},
+            "second": {"Parameters": _params(b="2"), "NextToken": "third"},
+            "third": {"Parameters": _params(c="3")},
+        }
+    )
+
+    assert [config.get(it) for it in "abc"] == ["1", "2", "3"]
+    assert [it.get("NextToken") for it in client.calls] == [None, "second", "third"]
+
+
+def test_concurrent_first_access_loads_once(ssm_client):
+    client = ssm_client({0: {"Parameters": _params(a="1")}}, delay=0.1)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        values = list(executor.map(lambda _: config.get("a"), range(8)))
+
+    assert values == ["1"] * 8
+    assert len(client.calls) == 1
+
+
+def test_values_are_refreshed_in_background(ssm_client, monkeypatch):
+    client = ssm_client({0: {"Parameters": _params(a="1")}})
+    assert config.get("a") == "1"
+
+    client.pages[0] = {"Parameters": _params(a="2")}
+    monkeypatch.setattr("config._LOADED_AT", time.monotonic() - 3600)
+
+    assert config.get("a") == "1"
+    _wait_for_refresh()
+    assert config.get("a") == "2"
+
+
+def test_failed_refresh_keeps_last_known_good_values(ssm_client, monkeypatch):
+    client = ssm_client({0: {"Parameters": _params(a="1")}})
+    assert config.get("a") == "1"
+
+    client.pages[0] = Exception("SSM is unavailable")
+    monkeypatch.setattr("config._LOADED_AT", time.monotonic() - 3600)
+
+    config.get("a")
+    _wait_for_refresh()
+
+    assert config.get("a") == "1"
+    assert len(client.calls) == 2
@@ -0,0 +1,184 @@
+from botocore.stub import Stubber
+from favorites_cache import FavoritesCache
+from favorites_client import FavoritesClient
+import favorites_client
+import pytest
+
+USER = "foo@bar.com"
+
+
+@pytest.fixture
+def dynamodb_mock():
+    with Stubber(favorites_client.get_client()) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture
+def client():
+    return FavoritesClient(cache=FavoritesCache(ttl=60, max_size=100))
+
+
+def _item(id, tags=None):
+    item = {"pk": {"S": USER}, "sk": {"S": id}}
+
+    if tags:
+        item["tags"] = {"SS": tags}
+
+    return item
+
+
+def _add_list_query(dynamodb_mock, items, read_units=2.5):
+    dynamodb_mock.add_response(
+        "query",
+        {"Items": items, "ConsumedCapacity": {"CapacityUnits": read_units}},
+        {
+            "TableName": "hegiphy",
+            "KeyConditionExpression": "pk = :user",
+            "ExpressionAttributeValues": {":user": {"S": USER}},
+            "ReturnConsumedCapacity": "TOTAL",
+        },
+    )
+
+
+def _add_item_query(dynamodb_mock, id, items):
+    dynamodb_mock.add_response(
+        "query",
+        {"Items": items, "ConsumedCapacity": {"CapacityUnits": 0.5}},
+        {
+            "TableName": "hegiphy",
+            "KeyConditionExpression": "pk = :user AND sk = :id",
+            "ExpressionAttributeValues": {":user": {"S": USER}, ":id": {"S": id}},
+            "ReturnConsumedCapacity": "TOTAL",
+        },
+    )
+
+
+def test_list_is_read_once(client, dynamodb_mock):
+    _add_list_query(dynamodb_mock, [_item("1", ["a"]), _item("2")])
+
+    expected = [
+        {"id": "1", "user": USER, "tags": ["a"]},
+        {"id": "2", "user": USER, "tags": []},
+    ]
+
+    assert client.find_by_user(USER) == expected
+    assert client.find_by_user(USER) == expected
+    assert client.find_by_id_and_user("2", USER) == expected[1]
+    assert client.find_by_id_and_user("3", USER) is None
+    assert client.find_by_user_and_tag(USER, "a") == expected[:1]
+
+    assert client.cache_stats() == {
+        "hits": 4,
+        "misses": 1,
+        "size": 1,
+        "hit_ratio": 0.8,
+        "read_units_saved": 6.0,
+    }
+
+
+def test_lists_read_at_another_version_are_not_served(client, dynamodb_mock):
+    _add_list_query(dynamodb_mock, [_item("1")])
+    _add_list_query(dynamodb_mock, [_item("1"), _item("2")])
+    dynamodb_mock.add_response("get_item", {})
+    dynamodb_mock.add_response("transact_write_items", {})
+    _add_count_update(dynamodb_mock)
+    _add_list_query(dynamodb_mock, [_item("1"), _item("2"), _item("3")])
+
+    assert len(client.find_by_user(USER, table_version=3)) == 1
+    assert len(client.find_by_user(USER, table_version=3)) == 1
+    # Another process wrote in the meantime.
+    assert len(client.find_by_user(USER, table_version=4)) == 2
+    assert len(client.find_by_user_and_tag(USER, "a", table_version=4)) == 0
+
+    # The version a write made through this process bumps to is not known.
+    client.create_favorite(USER, {"id": "3"})
+    assert len(client.find_by_user(USER)) == 3
+    assert len(client.find_by_user(USER, table_version=5)) == 3
+
+    assert client.cache_stats()["misses"] == 3
+
+
+def test_single_favorites_are_cached_including_misses(client, dynamodb_mock):
+    _add_item_query(dynamodb_mock, "1", [_item("1")])
+    _add_item_query(dynamodb_mock, "2", [])
+
+    for _ in range(2):
+        assert client.find_by_id_and_user("1", USER) == {
+            "id": "1",
+            "user": USER,
+            "tags": [],
+        }
+        assert client.find_by_id_and_user("2", USER) is None
+
+    assert client.cache_stats()["read_units_saved"] == 1
+
+
+def _add_count_update(dynamodb_mock):
+    dynamodb_mock.add_response("update_item", {})
+
+
+def test_writes_update_the_cached_list(client, dynamodb_mock):
+    _add_list_query(dynamodb_mock, [_item("1"), _item("3")])
+    dynamodb_mock.add_response("get_item", {})
+    dynamodb_mock.add_response("transact_write_items", {})
+    _add_count_update(dynamodb_mock)
+    dynamodb_mock.add_response("get_item", {"Item": _item("3")})
+    dynamodb_mock.add_response("transact_write_items", {})
+    _add_count_update(dynamodb_mock)
+
+    client.find_by_user(USER)
+    client.create_favorite(USER, {"id": "2"})
+    client.delete_favorite(USER, "3")
+
+    assert client.find_by_user(USER) == [
+        {"id": "1", "user": USER, "tags": []},
+        {"id": "2", "user": USER, "tags": []},
+    ]
+    assert client.find_by_id_and_user("3", USER) is None
+
+
+def test_single_favorite_is_reread_after_a_write(client, dynamodb_mock):
+    _add_item_query(dynamodb_mock, "1", [_item("1")])
+    dynamodb_mock.add_response("update_item", {"Attributes": _item("1", ["a"])})
+    dynamodb_mock.add_response("put_item", {})
+    dynamodb_mock.add_response("update_item", {})
+    _add_item_query(dynamodb_mock, "1", [_item("1", ["a"])])
+
+    client.find_by_id_and_user("1", USER)
+    client.add_tag_to_favorite("1", USER, "a")
+
+    assert client.find_by_id_and_user("1", USER)["tags"] == ["a"]
+
+
+def test_reads_racing_a_write_are_not_cached(client, dynamodb_mock):
+    _add_list_query(dynamodb_mock, [_item("1")])
+    dynamodb_mock.add_response("get_item", {"Item": _item("1")})
+    dynamodb_mock.add_response("transact_write_items", {})
+    _add_count_update(dynamodb_mock)
+    _add_list_query(dynamodb_mock, [])
+
+    favorites = client.iter_by_user(USER)
+    next(favorites)
+    client.delete_favorite(USER, "1")
+    list(favorites)
+
+    assert client.find_by_user(USER) == []
+
+
+def test_cache_is_optional(dynamodb_mock):
+    client = FavoritesClient()
+
+    for _ in range(2):
+        dynamodb_mock.add_response(
+            "query",
+            {"Items": []},
+            {
+                "TableName": "hegiphy",
+                "KeyConditionExpression": "pk = :user",
+                "ExpressionAttributeValues": {":user": {"S": USER}},
+            },
+        )
+        assert client.find_by_user(USER) == []
+
+    assert client.cache_stats() is None
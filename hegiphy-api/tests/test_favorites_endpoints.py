@@ -1,12 +1,17 @@
+from botocore.stub import ANY
 import pytest
 import requests_mock
 import favorites_client
 import botocore
+import base64
+import json
+
+VERSION_KEY = {"pk": {"S": "version#foo@bar.com"}, "sk": {"S": "version#foo@bar.com"}}
 
 
 @pytest.fixture
 def dynamodb_mock(monkeypatch):
-    stubber = botocore.stub.Stubber(favorites_client.client)
+    stubber = botocore.stub.Stubber(favorites_client.get_client())
     yield stubber
     stubber.deactivate()
 
@@ -23,7 +28,77 @@ def auth_mock(monkeypatch):
         yield apply
 
 
+def _add_version_get(dynamodb_mock, version=None):
+    dynamodb_request = {
+        "TableName": "hegiphy",
+        "Key": VERSION_KEY,
+        "ConsistentRead": True,
+    }
+    dynamodb_response = {}
+
+    if version is not None:
+        dynamodb_response["Item"] = {**VERSION_KEY, "version": {"N": str(version)}}
+
+    dynamodb_mock.add_response("get_item", dynamodb_response, dynamodb_request)
+
+
+def _add_version_bump(dynamodb_mock):
+    dynamodb_request = {
+        "TableName": "hegiphy",
+        "Key": VERSION_KEY,
+        "UpdateExpression": "ADD #version :one",
+        "ExpressionAttributeNames": {"#version": "version"},
+        "ExpressionAttributeValues": {":one": {"N": "1"}},
+    }
+    dynamodb_mock.add_response("update_item", {}, dynamodb_request)
+
+
+VERSION_UPDATE = {
+    "Update": {
+        "TableName": "hegiphy",
+        "Key": VERSION_KEY,
+        "UpdateExpression": "ADD #version :one",
+        "ExpressionAttributeNames": {"#version": "version"},
+        "ExpressionAttributeValues": {":one": {"N": "1"}},
+    }
+}
+
+
+def _tag_index_key(tag, id="12345"):
+    return {"pk": {"S": f"tag#foo@bar.com#{tag}"}, "sk": {"S": f"tag#{id}"}}
+
+
+def _add_record_get(dynamodb_mock, record=None):
+    dynamodb_request = {
+        "TableName": "hegiphy",
+        "Key": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
+        "ConsistentRead": True,
+    }
+    dynamodb_response = {"Item": record} if record else {}
+    dynamodb_mock.add_response("get_item", dynamodb_response, dynamodb_request)
+
+
+def _add_transaction(dynamodb_mock, items):
+    dynamodb_mock.add_response(
+        "transact_write_items", {}, {"TransactItems": [*items, VERSION_UPDATE]}
+    )
+
+
+def _add_count_updates(dynamodb_mock, deltas):
+    for delta in deltas.values():
+        dynamodb_request = {
+            "TableName": "hegiphy",
+            "Key": ANY,
+            "UpdateExpression": "ADD #count :delta",
+            "ExpressionAttributeNames": {"#count": "count"},
+            "ExpressionAttributeValues": {":delta": {"N": str(delta)}},
+        }
+        dynamodb_mock.add_response("update_item", {}, dynamodb_request)
+
+
 def test_get_favorites(handler, call_handler, auth_mock, dynamodb_mock):
+    _add_version_get(dynamodb_mock)
+
     dynamodb_request = {
         "TableName": "hegiphy",
         "KeyConditionExpression": "pk = :user",
@@ -55,27 +130,95 @@ def test_get_favorites(handler, call_handler, auth_mock, dynamodb_mock):
     dynamodb_mock.assert_no_pending_responses()
 
 
-def test_get_favorites_by_tag(handler, call_handler, auth_mock, dynamodb_mock):
+def test_get_favorites_is_conditional(handler, call_handler, auth_mock, dynamodb_mock):
     dynamodb_request = {
         "TableName": "hegiphy",
         "KeyConditionExpression": "pk = :user",
         "ExpressionAttributeValues": {":user": {"S": "foo@bar.com"}},
     }
+    dynamodb_response = {"Items": [_favorite_item("1")]}
+
+    _add_version_get(dynamodb_mock, 3)
+    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    # A match is answered from the version alone.
+    _add_version_get(dynamodb_mock, 3)
+    _add_version_get(dynamodb_mock, 4)
+    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    dynamodb_mock.activate()
+
+    auth_mock()
+
+    headers = {"Authorization": "Bearer foo-token"}
+
+    response = call_handler(handler, "GET", "/favorites", headers)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    etag = response.headers["ETag"]
+
+    response = call_handler(
+        handler, "GET", "/favorites", {**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.body == ""
+
+    response = call_handler(
+        handler, "GET", "/favorites", {**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_get_favorites_by_tag(handler, call_handler, auth_mock, dynamodb_mock):
+    _add_version_get(dynamodb_mock)
+
+    dynamodb_request = {
+        "TableName": "hegiphy",
+        "KeyConditionExpression": "pk = :tag",
+        "ExpressionAttributeValues": {":tag": {"S": "tag#foo@bar.com#bar"}},
+    }
     dynamodb_response = {
         "Items": [
-            {
-                "pk": {"S": "foo@bar.com"},
-                "sk": {"S": "12345"},
-                "tags": {"SS": ["foo"]},
-            },
-            {
-                "pk": {"S": "foo@bar.com"},
-                "sk": {"S": "67890"},
-                "tags": {"SS": ["bar"]},
-            },
+            _tag_index_key("bar", "67890"),
+            _tag_index_key("bar", "99999"),
+            # Left behind by a write that failed half way.
+            _tag_index_key("bar", "55555"),
         ]
     }
     dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+
+    dynamodb_request = {
+        "RequestItems": {
+            "hegiphy": {
+                "Keys": [
+                    {"pk": {"S": "foo@bar.com"}, "sk": {"S": "67890"}},
+                    {"pk": {"S": "foo@bar.com"}, "sk": {"S": "99999"}},
+                    {"pk": {"S": "foo@bar.com"}, "sk": {"S": "55555"}},
+                ]
+            }
+        }
+    }
+    dynamodb_response = {
+        "Responses": {
+            "hegiphy": [
+                {
+                    "pk": {"S": "foo@bar.com"},
+                    "sk": {"S": "99999"},
+                    "tags": {"SS": ["bar", "Foo"]},
+                },
+                {
+                    "pk": {"S": "foo@bar.com"},
+                    "sk": {"S": "67890"},
+                    "tags": {"SS": ["bar"]},
+                },
+                {"pk": {"S": "foo@bar.com"}, "sk": {"S": "55555"}},
+            ]
+        }
+    }
+    dynamodb_mock.add_response("batch_get_item", dynamodb_response, dynamodb_request)
     dynamodb_mock.activate()
 
     auth_mock()
@@ -84,18 +227,48 @@ def test_get_favorites_by_tag(handler, call_handler, auth_mock, dynamodb_mock):
         handler, "GET", "/favorites?tag=bar", {"Authorization": "Bearer foo-token"}
     )
     assert response.status_code == 200
-    assert response.json == [{"id": "67890", "user": "foo@bar.com", "tags": ["bar"]}]
+    assert response.json == [
+        {"id": "67890", "user": "foo@bar.com", "tags": ["bar"]},
+        {"id": "99999", "user": "foo@bar.com", "tags": ["bar", "Foo"]},
+    ]
     assert response.headers["Content-Type"] == "application/json"
 
     dynamodb_mock.assert_no_pending_responses()
 
 
-def test_add_favorite_no_tags(handler, call_handler, auth_mock, dynamodb_mock):
+def test_get_favorites_by_unknown_tag(handler, call_handler, auth_mock, dynamodb_mock):
+    _add_version_get(dynamodb_mock)
+
     dynamodb_request = {
         "TableName": "hegiphy",
-        "Item": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
+        "KeyConditionExpression": "pk = :tag",
+        "ExpressionAttributeValues": {":tag": {"S": "tag#foo@bar.com#baz"}},
     }
-    dynamodb_mock.add_response("put_item", {"Attributes": {}}, dynamodb_request)
+    dynamodb_mock.add_response("query", {"Items": []}, dynamodb_request)
+    dynamodb_mock.activate()
+
+    auth_mock()
+
+    response = call_handler(
+        handler, "GET", "/favorites?tag=baz", {"Authorization": "Bearer foo-token"}
+    )
+    assert response.status_code == 200
+    assert response.json == []
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_add_favorite_no_tags(handler, call_handler, auth_mock, dynamodb_mock):
+    put = {
+        "Put": {
+            "TableName": "hegiphy",
+            "Item": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
+            "ConditionExpression": "attribute_not_exists(pk)",
+        }
+    }
+    _add_record_get(dynamodb_mock)
+    _add_transaction(dynamodb_mock, [put])
+    _add_count_updates(dynamodb_mock, {"12345": 1})
     dynamodb_mock.activate()
 
     auth_mock()
@@ -115,15 +288,33 @@ def test_add_favorite_no_tags(handler, call_handler, auth_mock, dynamodb_mock):
 
 
 def test_add_favorite_with_tags(handler, call_handler, auth_mock, dynamodb_mock):
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "Item": {
-            "pk": {"S": "foo@bar.com"},
-            "sk": {"S": "12345"},
-            "tags": {"SS": ["foo", "bar"]},
-        },
+    record = {
+        "pk": {"S": "foo@bar.com"},
+        "sk": {"S": "12345"},
+        "tags": {"SS": ["foo", "baz"]},
+    }
+    put = {
+        "Put": {
+            "TableName": "hegiphy",
+            "Item": {
+                "pk": {"S": "foo@bar.com"},
+                "sk": {"S": "12345"},
+                "tags": {"SS": ["foo", "bar"]},
+            },
+            "ConditionExpression": "#tags = :tags",
+            "ExpressionAttributeNames": {"#tags": "tags"},
+            "ExpressionAttributeValues": {":tags": {"SS": ["foo", "baz"]}},
+        }
     }
-    dynamodb_mock.add_response("put_item", {"Attributes": {}}, dynamodb_request)
+    _add_record_get(dynamodb_mock, record)
+    _add_transaction(
+        dynamodb_mock,
+        [
+            put,
+            {"Put": {"TableName": "hegiphy", "Item": _tag_index_key("bar")}},
+            {"Delete": {"TableName": "hegiphy", "Key": _tag_index_key("baz")}},
+        ],
+    )
     dynamodb_mock.activate()
 
     auth_mock()
@@ -146,6 +337,41 @@ def test_add_favorite_with_tags(handler, call_handler, auth_mock, dynamodb_mock)
     dynamodb_mock.assert_no_pending_responses()
 
 
+def test_add_favorite_retries_when_it_changed(
+    handler, call_handler, auth_mock, dynamodb_mock
+):
+    put = {
+        "Put": {
+            "TableName": "hegiphy",
+            "Item": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
+            "ExpressionAttributeNames": {"#tags": "tags"},
+            "ConditionExpression": (
+                "attribute_exists(pk) AND attribute_not_exists(#tags)"
+            ),
+        }
+    }
+    _add_record_get(dynamodb_mock)
+    dynamodb_mock.add_client_error(
+        "transact_write_items", service_error_code="TransactionCanceledException"
+    )
+    _add_record_get(dynamodb_mock, {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}})
+    _add_transaction(dynamodb_mock, [put])
+    dynamodb_mock.activate()
+
+    auth_mock()
+
+    response = call_handler(
+        handler,
+        "POST",
+        "/favorites",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+        {"id": "12345"},
+    )
+    assert response.status_code == 201
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
 def test_invalid_add_favorite(handler, call_handler, auth_mock):
     auth_mock()
 
@@ -160,6 +386,20 @@ def test_invalid_add_favorite(handler, call_handler, auth_mock):
     assert response.status_code == 400
 
 
+def test_add_favorite_with_too_many_tags(handler, call_handler, auth_mock):
+    auth_mock()
+
+    response = call_handler(
+        handler,
+        "POST",
+        "/favorites",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+        {"id": "12345", "tags": [str(it) for it in range(41)]},
+    )
+
+    assert response.status_code == 400
+
+
 def test_get_favorite(handler, call_handler, auth_mock, dynamodb_mock):
     auth_mock()
 
@@ -227,13 +467,26 @@ def test_get_favorite_not_found(handler, call_handler, auth_mock, dynamodb_mock)
 def test_delete_favorite(handler, call_handler, auth_mock, dynamodb_mock):
     auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "Key": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
-        "ReturnValues": "NONE",
+    record = {
+        "pk": {"S": "foo@bar.com"},
+        "sk": {"S": "12345"},
+        "tags": {"SS": ["foo"]},
     }
-    dynamodb_response = {}
-    dynamodb_mock.add_response("delete_item", dynamodb_response, dynamodb_request)
+    delete = {
+        "Delete": {
+            "TableName": "hegiphy",
+            "Key": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
+            "ConditionExpression": "#tags = :tags",
+            "ExpressionAttributeNames": {"#tags": "tags"},
+            "ExpressionAttributeValues": {":tags": {"SS": ["foo"]}},
+        }
+    }
+    _add_record_get(dynamodb_mock, record)
+    _add_transaction(
+        dynamodb_mock,
+        [delete, {"Delete": {"TableName": "hegiphy", "Key": _tag_index_key("foo")}}],
+    )
+    _add_count_updates(dynamodb_mock, {"12345": -1})
     dynamodb_mock.activate()
 
     response = call_handler(
@@ -246,45 +499,69 @@ def test_delete_favorite(handler, call_handler, auth_mock, dynamodb_mock):
     assert response.status_code == 204
     assert response.body == ""
 
+    dynamodb_mock.assert_no_pending_responses()
 
-def test_add_tag_to_favorite(handler, call_handler, auth_mock, dynamodb_mock):
-    auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
-    }
-    dynamodb_response = {
-        "Items": [
-            {
-                "sk": {"S": "12345"},
-                "pk": {"S": "foo@bar.com"},
-                "tags": {"SS": ["foo", "bar"]},
-            }
-        ]
-    }
-    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+def _add_tag_update(dynamodb_mock, action, tag, tags):
+    if action == "ADD":
+        condition = (
+            "attribute_exists(pk) AND NOT contains(#tags, :tag)"
+            " AND (attribute_not_exists(#tags) OR size(#tags) < :max)"
+        )
+        values = {":max": {"N": "40"}}
+    else:
+        condition = "contains(#tags, :tag)"
+        values = {}
 
     dynamodb_request = {
         "TableName": "hegiphy",
         "Key": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
-        "UpdateExpression": "SET #tags = :tags",
-        "ExpressionAttributeValues": {":tags": {"SS": ["foo", "bar", "baz"]}},
+        "UpdateExpression": f"{action} #tags :tags",
+        "ConditionExpression": condition,
         "ExpressionAttributeNames": {"#tags": "tags"},
+        "ExpressionAttributeValues": {
+            ":tags": {"SS": [tag]},
+            ":tag": {"S": tag},
+            **values,
+        },
         "ReturnValues": "ALL_NEW",
+        "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
     }
-    dynamodb_response = {
-        "Attributes": {
-            "sk": {"S": "12345"},
-            "pk": {"S": "foo@bar.com"},
-            "tags": {"SS": ["foo", "bar", "baz"]},
-        }
-    }
+    dynamodb_response = {"Attributes": _favorite_item("12345", tags)}
     dynamodb_mock.add_response("update_item", dynamodb_response, dynamodb_request)
+
+    if action == "ADD":
+        dynamodb_mock.add_response(
+            "put_item", {}, {"TableName": "hegiphy", "Item": _tag_index_key(tag)}
+        )
+    else:
+        dynamodb_mock.add_response(
+            "delete_item", {}, {"TableName": "hegiphy", "Key": _tag_index_key(tag)}
+        )
+
+    _add_version_bump(dynamodb_mock)
+
+
+def _add_failed_tag_update(dynamodb_mock, record=None):
+    dynamodb_mock.add_client_error(
+        "update_item",
+        service_error_code="ConditionalCheckFailedException",
+        modeled_fields={"Item": record} if record is not None else None,
+    )
+
+
+def _add_unchanged_tags(dynamodb_mock, tags):
+    _add_failed_tag_update(dynamodb_mock, _favorite_item("12345", tags))
+
+
+def _add_missing_favorite(dynamodb_mock):
+    _add_failed_tag_update(dynamodb_mock)
+
+
+def test_add_tag_to_favorite(handler, call_handler, auth_mock, dynamodb_mock):
+    auth_mock()
+
+    _add_tag_update(dynamodb_mock, "ADD", "baz", ["foo", "bar", "baz"])
     dynamodb_mock.activate()
 
     response = call_handler(
@@ -301,29 +578,13 @@ def test_add_tag_to_favorite(handler, call_handler, auth_mock, dynamodb_mock):
         "tags": ["foo", "bar", "baz"],
     }
 
+    dynamodb_mock.assert_no_pending_responses()
+
 
 def test_add_existing_tag_to_favorite(handler, call_handler, auth_mock, dynamodb_mock):
     auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
-    }
-    dynamodb_response = {
-        "Items": [
-            {
-                "sk": {"S": "12345"},
-                "pk": {"S": "foo@bar.com"},
-                "tags": {"SS": ["foo", "bar"]},
-            }
-        ]
-    }
-    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
-
+    _add_unchanged_tags(dynamodb_mock, ["foo", "bar"])
     dynamodb_mock.activate()
 
     response = call_handler(
@@ -340,23 +601,15 @@ def test_add_existing_tag_to_favorite(handler, call_handler, auth_mock, dynamodb
         "tags": ["foo", "bar"],
     }
 
+    dynamodb_mock.assert_no_pending_responses()
+
 
 def test_add_existing_tag_to_missing_favorite(
     handler, call_handler, auth_mock, dynamodb_mock
 ):
     auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
-    }
-    dynamodb_response = {"Items": []}
-    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
-
+    _add_missing_favorite(dynamodb_mock)
     dynamodb_mock.activate()
 
     response = call_handler(
@@ -369,51 +622,40 @@ def test_add_existing_tag_to_missing_favorite(
     assert response.status_code == 404
     assert response.json == {"error": "favorite with id 12345 not found"}
 
+    dynamodb_mock.assert_no_pending_responses()
 
-def test_delete_tag_from_favorite(handler, call_handler, auth_mock, dynamodb_mock):
-    auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
-    }
-    dynamodb_response = {
-        "Items": [
-            {
-                "sk": {"S": "12345"},
-                "pk": {"S": "foo@bar.com"},
-                "tags": {"SS": ["foo", "bar"]},
-            }
-        ]
-    }
-    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+def test_add_tag_to_favorite_with_too_many_tags(
+    handler, call_handler, auth_mock, dynamodb_mock
+):
+    auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "Key": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
-        "UpdateExpression": "SET #tags = :tags",
-        "ExpressionAttributeValues": {":tags": {"SS": ["foo"]}},
-        "ExpressionAttributeNames": {"#tags": "tags"},
-        "ReturnValues": "ALL_NEW",
-    }
-    dynamodb_response = {
-        "Attributes": {
-            "sk": {"S": "12345"},
-            "pk": {"S": "foo@bar.com"},
-            "tags": {"SS": ["foo"]},
-        }
-    }
-    dynamodb_mock.add_response("update_item", dynamodb_response, dynamodb_request)
+    _add_unchanged_tags(dynamodb_mock, [str(it) for it in range(40)])
     dynamodb_mock.activate()
 
     response = call_handler(
         handler,
-        "DELETE",
-        "/favorites/12345/tags/bar",
+        "POST",
+        "/favorites/12345/tags/foo",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+    )
+
+    assert response.status_code == 400
+    assert response.json == {"error": "maximum number of tags is 40"}
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_delete_tag_from_favorite(handler, call_handler, auth_mock, dynamodb_mock):
+    auth_mock()
+
+    _add_tag_update(dynamodb_mock, "DELETE", "bar", ["foo"])
+    dynamodb_mock.activate()
+
+    response = call_handler(
+        handler,
+        "DELETE",
+        "/favorites/12345/tags/bar",
         {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
     )
 
@@ -424,30 +666,15 @@ def test_delete_tag_from_favorite(handler, call_handler, auth_mock, dynamodb_moc
         "tags": ["foo"],
     }
 
+    dynamodb_mock.assert_no_pending_responses()
+
 
 def test_delete_missing_tag_from_favorite(
     handler, call_handler, auth_mock, dynamodb_mock
 ):
     auth_mock()
 
-    dynamodb_request = {
-        "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
-    }
-    dynamodb_response = {
-        "Items": [
-            {
-                "sk": {"S": "12345"},
-                "pk": {"S": "foo@bar.com"},
-                "tags": {"SS": ["foo", "bar"]},
-            }
-        ]
-    }
-    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    _add_unchanged_tags(dynamodb_mock, ["foo", "bar"])
     dynamodb_mock.activate()
 
     response = call_handler(
@@ -464,77 +691,439 @@ def test_delete_missing_tag_from_favorite(
         "tags": ["foo", "bar"],
     }
 
+    dynamodb_mock.assert_no_pending_responses()
+
 
 def test_delete_last_tag_from_favorite(handler, call_handler, auth_mock, dynamodb_mock):
     auth_mock()
 
+    _add_tag_update(dynamodb_mock, "DELETE", "foo", [])
+    dynamodb_mock.activate()
+
+    response = call_handler(
+        handler,
+        "DELETE",
+        "/favorites/12345/tags/foo",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+    )
+
+    assert response.status_code == 200
+    assert response.json == {
+        "id": "12345",
+        "user": "foo@bar.com",
+        "tags": [],
+    }
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_delete_tag_from_missing_favorite(
+    handler, call_handler, auth_mock, dynamodb_mock
+):
+    auth_mock()
+
+    _add_missing_favorite(dynamodb_mock)
+    dynamodb_mock.activate()
+
+    response = call_handler(
+        handler,
+        "DELETE",
+        "/favorites/12345/tags/foo",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+    )
+
+    assert response.status_code == 404
+    assert response.json == {"error": "favorite with id 12345 not found"}
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def _favorite_item(id, tags=None):
+    item = {"pk": {"S": "foo@bar.com"}, "sk": {"S": id}}
+
+    if tags:
+        item["tags"] = {"SS": tags}
+
+    return item
+
+
+def test_get_favorites_follows_pages(handler, call_handler, auth_mock, dynamodb_mock):
+    _add_version_get(dynamodb_mock)
+
     dynamodb_request = {
         "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
+        "KeyConditionExpression": "pk = :user",
+        "ExpressionAttributeValues": {":user": {"S": "foo@bar.com"}},
     }
     dynamodb_response = {
-        "Items": [
-            {"sk": {"S": "12345"}, "pk": {"S": "foo@bar.com"}, "tags": {"SS": ["foo"]}}
-        ]
+        "Items": [_favorite_item("1"), _favorite_item("2")],
+        "LastEvaluatedKey": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "2"}},
     }
     dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
 
+    dynamodb_request = {
+        **dynamodb_request,
+        "ExclusiveStartKey": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "2"}},
+    }
+    dynamodb_response = {"Items": [_favorite_item("3", ["foo"])]}
+    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    dynamodb_mock.activate()
+
+    auth_mock()
+
+    response = call_handler(
+        handler, "GET", "/favorites", {"Authorization": "Bearer foo-token"}
+    )
+    assert response.status_code == 200
+    assert response.json == [
+        {"id": "1", "user": "foo@bar.com", "tags": []},
+        {"id": "2", "user": "foo@bar.com", "tags": []},
+        {"id": "3", "user": "foo@bar.com", "tags": ["foo"]},
+    ]
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_get_favorites_fails_on_a_later_page(
+    handler, call_handler, auth_mock, dynamodb_mock
+):
+    _add_version_get(dynamodb_mock)
+
     dynamodb_request = {
         "TableName": "hegiphy",
-        "Key": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "12345"}},
-        "UpdateExpression": "REMOVE #tags",
-        "ExpressionAttributeNames": {"#tags": "tags"},
-        "ReturnValues": "ALL_NEW",
+        "KeyConditionExpression": "pk = :user",
+        "ExpressionAttributeValues": {":user": {"S": "foo@bar.com"}},
     }
     dynamodb_response = {
-        "Attributes": {"sk": {"S": "12345"}, "pk": {"S": "foo@bar.com"}}
+        "Items": [_favorite_item("1"), _favorite_item("2")],
+        "LastEvaluatedKey": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "2"}},
     }
-    dynamodb_mock.add_response("update_item", dynamodb_response, dynamodb_request)
+    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    dynamodb_mock.add_client_error(
+        "query", service_error_code="ProvisionedThroughputExceededException"
+    )
+    dynamodb_mock.activate()
+
+    auth_mock()
+
+    # The list is read before the response starts, so a failure part way
+    # through is an error response rather than a truncated 200.
+    response = call_handler(
+        handler, "GET", "/favorites", {"Authorization": "Bearer foo-token"}
+    )
+    assert response.status_code == 500
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_get_favorites_page(handler, call_handler, auth_mock, dynamodb_mock):
+    dynamodb_request = {
+        "TableName": "hegiphy",
+        "KeyConditionExpression": "pk = :user",
+        "ExpressionAttributeValues": {":user": {"S": "foo@bar.com"}},
+        "Limit": 2,
+    }
+    dynamodb_response = {
+        "Items": [_favorite_item("1"), _favorite_item("2")],
+        "LastEvaluatedKey": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "2"}},
+    }
+    _add_version_get(dynamodb_mock)
+    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+
+    _add_version_get(dynamodb_mock)
+    dynamodb_request = {
+        **dynamodb_request,
+        "ExclusiveStartKey": {"pk": {"S": "foo@bar.com"}, "sk": {"S": "2"}},
+    }
+    dynamodb_response = {"Items": [_favorite_item("3")]}
+    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
     dynamodb_mock.activate()
 
+    auth_mock()
+
+    response = call_handler(
+        handler, "GET", "/favorites?limit=2", {"Authorization": "Bearer foo-token"}
+    )
+    assert response.status_code == 200
+    assert [it["id"] for it in response.json] == ["1", "2"]
+
+    cursor = response.headers["X-Next-Cursor"]
+
     response = call_handler(
         handler,
-        "DELETE",
-        "/favorites/12345/tags/foo",
+        "GET",
+        f"/favorites?limit=2&cursor={cursor}",
+        {"Authorization": "Bearer foo-token"},
+    )
+    assert response.status_code == 200
+    assert [it["id"] for it in response.json] == ["3"]
+    assert "X-Next-Cursor" not in response.headers
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        base64.urlsafe_b64encode(
+            json.dumps({"pk": {"S": "someone@else.com"}, "sk": {"S": "2"}}).encode(
+                "utf-8"
+            )
+        ).decode("ascii"),
+    ],
+)
+def test_get_favorites_invalid_cursor(
+    handler, call_handler, auth_mock, dynamodb_mock, cursor
+):
+    auth_mock()
+    _add_version_get(dynamodb_mock)
+    dynamodb_mock.activate()
+
+    response = call_handler(
+        handler,
+        "GET",
+        f"/favorites?cursor={cursor}",
+        {"Authorization": "Bearer foo-token"},
+    )
+    assert response.status_code == 400
+    assert response.json == {"error": 'the "cursor" parameter is invalid'}
+
+
+def test_get_favorites_invalid_limit(handler, call_handler, auth_mock):
+    auth_mock()
+
+    response = call_handler(
+        handler, "GET", "/favorites?limit=0", {"Authorization": "Bearer foo-token"}
+    )
+    assert response.status_code == 400
+
+
+def _favorite_key(id):
+    return {"pk": {"S": "foo@bar.com"}, "sk": {"S": id}}
+
+
+def test_bulk_create_favorites(handler, call_handler, auth_mock, dynamodb_mock):
+    auth_mock()
+
+    dynamodb_request = {
+        "RequestItems": {"hegiphy": {"Keys": [_favorite_key("1"), _favorite_key("2")]}}
+    }
+    dynamodb_response = {"Responses": {"hegiphy": [_favorite_item("2", ["old"])]}}
+    dynamodb_mock.add_response("batch_get_item", dynamodb_response, dynamodb_request)
+
+    tag_put = {"PutRequest": {"Item": _tag_index_key("foo", "1")}}
+    tag_delete = {"DeleteRequest": {"Key": _tag_index_key("old", "2")}}
+    writes = [
+        {"PutRequest": {"Item": _favorite_item("1", ["foo"])}},
+        tag_put,
+        {"PutRequest": {"Item": _favorite_item("2")}},
+        tag_delete,
+    ]
+    dynamodb_mock.add_response(
+        "batch_write_item",
+        {"UnprocessedItems": {"hegiphy": [tag_delete]}},
+        {"RequestItems": {"hegiphy": writes}},
+    )
+    dynamodb_mock.add_response(
+        "batch_write_item", {}, {"RequestItems": {"hegiphy": [tag_delete]}}
+    )
+    _add_count_updates(dynamodb_mock, {"1": 1})
+    _add_version_bump(dynamodb_mock)
+    dynamodb_mock.activate()
+
+    response = call_handler(
+        handler,
+        "POST",
+        "/favorites/bulk",
         {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+        [{"id": "1", "tags": ["foo"]}, {"id": "2"}],
     )
 
     assert response.status_code == 200
     assert response.json == {
-        "id": "12345",
-        "user": "foo@bar.com",
-        "tags": [],
+        "results": [
+            {
+                "id": "1",
+                "status": 201,
+                "favorite": {"id": "1", "user": "foo@bar.com", "tags": ["foo"]},
+            },
+            {
+                "id": "2",
+                "status": 201,
+                "favorite": {"id": "2", "user": "foo@bar.com", "tags": []},
+            },
+        ]
     }
 
+    dynamodb_mock.assert_no_pending_responses()
 
-def test_delete_tag_from_missing_favorite(
-    handler, call_handler, auth_mock, dynamodb_mock
-):
+
+def test_bulk_delete_favorites(handler, call_handler, auth_mock, dynamodb_mock):
     auth_mock()
 
     dynamodb_request = {
-        "TableName": "hegiphy",
-        "KeyConditionExpression": "pk = :user AND sk = :id",
-        "ExpressionAttributeValues": {
-            ":user": {"S": "foo@bar.com"},
-            ":id": {"S": "12345"},
-        },
+        "RequestItems": {"hegiphy": {"Keys": [_favorite_key("1"), _favorite_key("2")]}}
     }
-    dynamodb_response = {"Items": []}
-    dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    dynamodb_response = {"Responses": {"hegiphy": [_favorite_item("1", ["foo"])]}}
+    dynamodb_mock.add_response("batch_get_item", dynamodb_response, dynamodb_request)
 
+    writes = [
+        {"DeleteRequest": {"Key": _favorite_key("1")}},
+        {"DeleteRequest": {"Key": _tag_index_key("foo", "1")}},
+    ]
+    dynamodb_mock.add_response(
+        "batch_write_item", {}, {"RequestItems": {"hegiphy": writes}}
+    )
+    _add_count_updates(dynamodb_mock, {"1": -1})
+    _add_version_bump(dynamodb_mock)
     dynamodb_mock.activate()
 
     response = call_handler(
         handler,
-        "DELETE",
-        "/favorites/12345/tags/foo",
+        "POST",
+        "/favorites/bulk/delete",
         {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+        [{"id": "1"}, {"id": "2"}, {"id": "1"}],
     )
 
-    assert response.status_code == 404
-    assert response.json == {"error": "favorite with id 12345 not found"}
+    assert response.status_code == 200
+    assert response.json == {
+        "results": [
+            {"id": "1", "status": 204},
+            {"id": "2", "status": 404, "error": "not found"},
+        ]
+    }
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+def test_bulk_get_favorites(handler, call_handler, auth_mock, dynamodb_mock):
+    auth_mock()
+
+    dynamodb_request = {
+        "RequestItems": {
+            "hegiphy": {
+                "Keys": [_favorite_key("1"), _favorite_key("2"), _favorite_key("3")]
+            }
+        }
+    }
+    dynamodb_response = {
+        "Responses": {"hegiphy": [_favorite_item("1", ["foo"])]},
+        "UnprocessedKeys": {"hegiphy": {"Keys": [_favorite_key("3")]}},
+    }
+    dynamodb_mock.add_response("batch_get_item", dynamodb_response, dynamodb_request)
+
+    for _ in range(favorites_client.MAX_BATCH_ATTEMPTS - 1):
+        dynamodb_mock.add_response(
+            "batch_get_item",
+            {
+                "Responses": {},
+                "UnprocessedKeys": {"hegiphy": {"Keys": [_favorite_key("3")]}},
+            },
+            {"RequestItems": {"hegiphy": {"Keys": [_favorite_key("3")]}}},
+        )
+    dynamodb_mock.activate()
+
+    response = call_handler(
+        handler,
+        "POST",
+        "/favorites/bulk/get",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+        [{"id": "1"}, {"id": "2"}, {"id": "3"}],
+    )
+
+    assert response.status_code == 200
+    assert response.json == {
+        "results": [
+            {
+                "id": "1",
+                "status": 200,
+                "favorite": {"id": "1", "user": "foo@bar.com", "tags": ["foo"]},
+            },
+            {"id": "2", "status": 404, "error": "not found"},
+            {"id": "3", "status": 503, "error": "not processed"},
+        ]
+    }
+
+    dynamodb_mock.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize(
+    "data", [{"id": "1"}, [{"tags": ["foo"]}], [{"id": str(i)} for i in range(101)]]
+)
+def test_bulk_invalid_favorites(handler, call_handler, auth_mock, data):
+    auth_mock()
+
+    response = call_handler(
+        handler,
+        "POST",
+        "/favorites/bulk",
+        {"Authorization": "Bearer foo-token", "Content-Type": "application/json"},
+        data,
+    )
+
+    assert response.status_code == 400
+
+
+def test_get_favorites_expanded_with_gifs(
+    handler, call_handler, auth_mock, dynamodb_mock, monkeypatch
+):
+    from app import GIF_CACHE
+    import config
+
+    monkeypatch.setattr(GIF_CACHE, "max_ids_per_request", 2)
+
+    dynamodb_request = {
+        "TableName": "hegiphy",
+        "KeyConditionExpression": "pk = :user",
+        "ExpressionAttributeValues": {":user": {"S": "foo@bar.com"}},
+    }
+    dynamodb_response = {
+        "Items": [_favorite_item("1"), _favorite_item("2"), _favorite_item("3")]
+    }
+    for _ in range(2):
+        _add_version_get(dynamodb_mock)
+        dynamodb_mock.add_response("query", dynamodb_response, dynamodb_request)
+    dynamodb_mock.activate()
+
+    auth_mock()
+
+    base_url = config.get("giphy_base_url")
+
+    with requests_mock.mock(real_http=True) as giphy_mock:
+        giphy_mock.get(
+            f"{base_url}/gifs?ids=1,2",
+            json={"data": [{"id": "2", "title": "two"}, {"id": "1", "title": "one"}]},
+        )
+        giphy_mock.get(f"{base_url}/gifs?ids=3", json={"data": []})
+
+        for _ in range(2):
+            response = call_handler(
+                handler,
+                "GET",
+                "/favorites?expand=gif",
+                {"Authorization": "Bearer foo-token"},
+            )
+
+            assert response.status_code == 200
+            assert response.json == [
+                {
+                    "id": "1",
+                    "user": "foo@bar.com",
+                    "tags": [],
+                    "gif": {"id": "1", "title": "one"},
+                },
+                {
+                    "id": "2",
+                    "user": "foo@bar.com",
+                    "tags": [],
+                    "gif": {"id": "2", "title": "two"},
+                },
+                {"id": "3", "user": "foo@bar.com", "tags": [], "gif": None},
+            ]
+
+        giphy_requests = [it for it in giphy_mock.request_history if "ids" in it.qs]
+        assert sorted(it.qs["ids"][0] for it in giphy_requests) == ["1,2", "3", "3"]
+
+    dynamodb_mock.assert_no_pending_responses()
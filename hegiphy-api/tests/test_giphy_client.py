@@ -0,0 +1,134 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from giphy_client import GiphyClient
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import requests
+import time
+import pytest
+import json
+
+
+class StubGiphyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, responses=None, delay=0):
+        super().__init__(("127.0.0.1", 0), StubGiphyHandler)
+        self.connections = 0
+        self.requests = []
+        self.responses = list(responses or [])
+        self.delay = delay
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StubGiphyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        time.sleep(self.server.delay)
+
+        status = self.server.responses.pop(0) if self.server.responses else 200
+        body = json.dumps({"data": [], "meta": {"status": status}}).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    def _stub_server(responses=None, delay=0):
+        server = StubGiphyServer(responses, delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    servers = []
+    yield _stub_server
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_connections_are_reused(stub_server):
+    server = stub_server()
+    client = GiphyClient(server.base_url, "key")
+
+    for i in range(10):
+        client.query("cats", offset=i * 25)
+
+    assert len(server.requests) == 10
+    assert server.connections == 1
+
+
+def test_retries_server_errors(stub_server):
+    server = stub_server([503, 429])
+    client = GiphyClient(server.base_url, "key", retry_backoff=0)
+
+    assert json.loads(client.get_trending())["meta"]["status"] == 200
+    assert len(server.requests) == 3
+
+
+def test_gives_up_after_max_retries(stub_server):
+    server = stub_server([503, 503, 503])
+    client = GiphyClient(server.base_url, "key", max_retries=1, retry_backoff=0)
+
+    with pytest.raises(requests.HTTPError):
+        client.get_trending()
+
+    assert len(server.requests) == 2
+
+
+def test_concurrent_identical_requests_are_coalesced(stub_server):
+    server = stub_server(delay=0.2)
+    client = GiphyClient(server.base_url, "key")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: client.query("cats"), range(8)))
+        other = executor.submit(client.query, "dogs").result()
+
+    assert len(set(results)) == 1
+    assert other
+    assert len(server.requests) == 2
+    assert client.coalesced == 7
+
+
+def test_coalesced_callers_share_errors(stub_server):
+    server = stub_server([404], delay=0.2)
+    client = GiphyClient(server.base_url, "key")
+
+    def query(_):
+        try:
+            client.get_by_ids("foo")
+        except requests.HTTPError as e:
+            return e.response.status_code
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(query, range(4))) == [404] * 4
+
+    assert len(server.requests) == 1
+
+
+def test_api_key_is_resolved_per_request(stub_server):
+    server = stub_server()
+    keys = iter(["old-key", "new-key"])
+    client = GiphyClient(server.base_url, lambda: next(keys))
+
+    client.get_trending()
+    client.get_trending()
+
+    assert "api_key=old-key" in server.requests[0]
+    assert "api_key=new-key" in server.requests[1]
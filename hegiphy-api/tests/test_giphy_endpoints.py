@@ -1,6 +1,10 @@
+from gif_cache import GifMetadataCache
+import pytest
 import requests_mock
+import mock
 import config
 import json
+import time
 
 
 def test_query_defaults(handler, call_handler):
@@ -100,3 +104,357 @@ def test_get_by_ids(handler, call_handler):
         assert response.status_code == 200
         assert response.json == mock_json
         assert response.headers["Content-Type"] == "application/json"
+
+
+def test_query_is_cached_on_normalized_parameters(handler, call_handler):
+    mock_json = {"foo": "bar"}
+
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/search?api_key=mock_giphy_api_key&q=foo+bar&limit=25",
+            text=json.dumps(mock_json),
+            status_code=200,
+        )
+
+        for url in [
+            "/giphy/query?q=foo%20bar",
+            "/giphy/query?q=Foo++Bar&offset=0&limit=25",
+            "/giphy/query?q=foo%20bar&rating=g&lang=EN",
+        ]:
+            response = call_handler(handler, "GET", url)
+            assert response.status_code == 200
+            assert response.json == mock_json
+
+        assert req_mock.call_count == 1
+
+
+def test_query_is_conditional(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(
+            f"{config.get('giphy_base_url')}/gifs/search", text=json.dumps({"a": 1})
+        )
+
+        response = call_handler(handler, "GET", "/giphy/query?q=foo")
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "public, max-age=300"
+
+        etag = response.headers["ETag"]
+
+        response = call_handler(
+            handler, "GET", "/giphy/query?q=foo", {"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.body == ""
+
+        response = call_handler(
+            handler, "GET", "/giphy/query?q=foo", {"If-None-Match": '"other"'}
+        )
+        assert response.status_code == 200
+        assert response.json == {"a": 1}
+
+
+def test_query_invalid_offset(handler, call_handler):
+    response = call_handler(handler, "GET", "/giphy/query?q=foo&offset=abc")
+    assert response.status_code == 400
+    assert response.json == {"error": 'the "offset" parameter must be an integer'}
+
+
+def test_query_prefetches_the_next_page(handler, call_handler, override_config):
+    from app import PREFETCHER
+
+    override_config(giphy_prefetch_workers="1")
+
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/search?q=foo&limit=2",
+            json=lambda request, context: {
+                "offset": int(request.qs.get("offset", ["0"])[0])
+            },
+        )
+
+        response = call_handler(handler, "GET", "/giphy/query?q=foo&limit=2")
+        assert response.json == {"offset": 0}
+
+        PREFETCHER._executor.submit(lambda: None).result()
+        assert req_mock.call_count == 2
+
+        response = call_handler(handler, "GET", "/giphy/query?q=foo&limit=2&offset=2")
+        assert response.json == {"offset": 2}
+
+        PREFETCHER._executor.submit(lambda: None).result()
+        assert req_mock.call_count == 3
+
+    assert PREFETCHER.stats()["used"] == 1
+
+
+def test_trending_serves_stale_while_revalidating(handler, call_handler, monkeypatch):
+    from app import GIPHY_CACHE
+
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/trending?api_key=mock_giphy_api_key&rating=g",
+            [{"json": {"page": 1}}, {"json": {"page": 2}}],
+        )
+
+        response = call_handler(handler, "GET", "/giphy/trending")
+        assert response.json == {"page": 1}
+
+        ttl = GIPHY_CACHE.ttls["trending"]
+        monkeypatch.setattr("time.time", lambda now=time.time(): now + ttl + 1)
+
+        response = call_handler(handler, "GET", "/giphy/trending")
+        assert response.json == {"page": 1}
+
+        for _ in range(50):
+            if not GIPHY_CACHE.stats()["refreshing"]:
+                break
+            time.sleep(0.01)
+
+        response = call_handler(handler, "GET", "/giphy/trending")
+        assert response.json == {"page": 2}
+
+        assert req_mock.call_count == 2
+
+
+def test_get_by_ids_assembles_partial_cache_hits(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs?api_key=mock_giphy_api_key&ids=a,b",
+            json={
+                "data": [{"id": "a"}, {"id": "b"}],
+                "pagination": {"total_count": 2, "count": 2, "offset": 0},
+                "meta": {"status": 200, "msg": "OK", "response_id": "1"},
+            },
+        )
+        req_mock.get(
+            f"{base_url}/gifs?api_key=mock_giphy_api_key&ids=c",
+            json={
+                "data": [{"id": "c"}],
+                "pagination": {"total_count": 1, "count": 1, "offset": 0},
+                "meta": {"status": 200, "msg": "OK", "response_id": "2"},
+            },
+        )
+
+        response = call_handler(handler, "GET", "/giphy/gifs?ids=a,b")
+        assert response.status_code == 200
+        assert [it["id"] for it in response.json["data"]] == ["a", "b"]
+
+        response = call_handler(handler, "GET", "/giphy/gifs?ids=b,c,a")
+        assert response.status_code == 200
+        assert response.json == {
+            "data": [{"id": "b"}, {"id": "c"}, {"id": "a"}],
+            "pagination": {"total_count": 3, "count": 3, "offset": 0},
+            "meta": {"status": 200, "msg": "OK", "response_id": "2"},
+        }
+
+        response = call_handler(handler, "GET", "/giphy/gifs?ids=c,a")
+        assert [it["id"] for it in response.json["data"]] == ["c", "a"]
+
+        assert [it.qs["ids"] for it in req_mock.request_history] == [["a,b"], ["c"]]
+
+
+def test_get_by_ids_uses_gifs_from_search_results(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/search?api_key=mock_giphy_api_key&q=foo",
+            json={"data": [{"id": "a", "title": "foo"}]},
+        )
+
+        call_handler(handler, "GET", "/giphy/query?q=foo")
+        response = call_handler(handler, "GET", "/giphy/gifs?ids=a")
+
+        assert response.status_code == 200
+        assert response.json["data"] == [{"id": "a", "title": "foo"}]
+        assert req_mock.call_count == 1
+
+
+def test_gif_cache_is_bounded_by_size():
+    giphy_client = mock.MagicMock()
+    giphy_client.get_by_ids.return_value = '{"data": []}'
+    cache = GifMetadataCache(
+        giphy_client, ttl=60, max_bytes=100, max_ids_per_request=100, max_workers=1
+    )
+
+    # Each of these takes 61 bytes once serialized, so only the last one fits.
+    cache.add([{"id": "a", "title": "a" * 40}, {"id": "b", "title": "b" * 40}])
+    cache.add([{"id": "c", "title": "c" * 100}])
+
+    assert cache.get_many(["a", "b", "c"]) == {"b": {"id": "b", "title": "b" * 40}}
+    giphy_client.get_by_ids.assert_called_once_with("a,c")
+
+
+def _full_gif(id):
+    return {
+        "id": id,
+        "title": f"gif {id}",
+        "url": f"https://giphy.com/gifs/{id}",
+        "images": {
+            "original": {"url": f"{id}/original.gif"},
+            "fixed_width": {"url": f"{id}/fixed_width.gif"},
+            "preview_gif": {"url": f"{id}/preview.gif"},
+        },
+    }
+
+
+def test_query_projects_fields_and_renditions(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/search?api_key=mock_giphy_api_key&q=foo",
+            json={"data": [_full_gif("a")], "meta": {"status": 200}},
+        )
+
+        response = call_handler(
+            handler, "GET", "/giphy/query?q=foo&fields=Title&renditions=fixed_width"
+        )
+        assert response.status_code == 200
+        assert response.json == {
+            "data": [
+                {
+                    "id": "a",
+                    "title": "gif a",
+                    "images": {"fixed_width": {"url": "a/fixed_width.gif"}},
+                }
+            ],
+            "meta": {"status": 200},
+        }
+
+        response = call_handler(handler, "GET", "/giphy/query?q=foo&fields=url")
+        assert response.json["data"] == [{"id": "a", "url": "https://giphy.com/gifs/a"}]
+
+        response = call_handler(handler, "GET", "/giphy/query?q=foo")
+        assert response.json["data"] == [_full_gif("a")]
+
+        response = call_handler(handler, "GET", "/giphy/gifs?ids=a&renditions=original")
+        assert response.json["data"] == [
+            {**_full_gif("a"), "images": {"original": {"url": "a/original.gif"}}}
+        ]
+
+        assert req_mock.call_count == 3
+
+
+def test_trending_projection_is_cached_separately(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/trending?api_key=mock_giphy_api_key",
+            json={"data": [_full_gif("a")]},
+        )
+
+        for url in [
+            "/giphy/trending?renditions=preview_gif",
+            "/giphy/trending?renditions=preview_gif,%20PREVIEW_GIF",
+        ]:
+            response = call_handler(handler, "GET", url)
+            assert response.json["data"][0]["images"] == {
+                "preview_gif": {"url": "a/preview.gif"}
+            }
+
+        response = call_handler(handler, "GET", "/giphy/trending")
+        assert len(response.json["data"][0]["images"]) == 3
+
+        assert req_mock.call_count == 2
+
+
+def test_batch_query_fans_out_and_reports_errors_per_term(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        base_url = config.get("giphy_base_url")
+
+        req_mock.get(
+            f"{base_url}/gifs/search?api_key=mock_giphy_api_key&q=cats&limit=5",
+            json={"data": [{"id": "a"}]},
+        )
+        req_mock.get(
+            f"{base_url}/gifs/search?api_key=mock_giphy_api_key&q=dogs&offset=25",
+            json={"data": [{"id": "b"}]},
+        )
+        req_mock.get(
+            f"{base_url}/gifs/search?api_key=mock_giphy_api_key&q=birds",
+            status_code=500,
+        )
+
+        response = call_handler(
+            handler,
+            "POST",
+            "/giphy/query/batch",
+            data={
+                "queries": [
+                    {"q": "Cats", "limit": 5},
+                    {"q": "dogs", "offset": "25"},
+                    {"q": "birds"},
+                ]
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json == {
+            "results": {
+                "Cats": {"data": [{"id": "a"}]},
+                "dogs": {"data": [{"id": "b"}]},
+            },
+            "errors": {"birds": {"error": "the Giphy search failed", "status": 500}},
+        }
+
+        response = call_handler(handler, "GET", "/giphy/query?q=cats&limit=5")
+        assert response.json == {"data": [{"id": "a"}]}
+        assert req_mock.call_count == 3
+
+
+def test_batch_query_deadline(handler, call_handler, override_config, monkeypatch):
+    override_config(giphy_batch_deadline="0.2")
+
+    # requests_mock serializes requests, so the client is replaced instead.
+    class SlowGiphyClient:
+        def query(self, term, **kwargs):
+            if term == "slow":
+                time.sleep(1)
+
+            return json.dumps({"data": []})
+
+    monkeypatch.setattr("app.GIPHY_CLIENT", SlowGiphyClient())
+
+    response = call_handler(
+        handler,
+        "POST",
+        "/giphy/query/batch",
+        data={"queries": [{"q": "slow"}, {"q": "fast"}]},
+    )
+
+    assert response.status_code == 200
+    assert response.json == {
+        "results": {"fast": {"data": []}},
+        "errors": {"slow": {"error": "the Giphy search timed out", "status": 504}},
+    }
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {},
+        {"queries": []},
+        {"queries": ["cats"]},
+        {"queries": [{"q": "cats"}, {"q": "cats"}]},
+        {"queries": [{"q": ""}]},
+        {"queries": [{"q": ["cats"]}]},
+        {"queries": [{"q": {"cats": 1}}]},
+        {"queries": [{"q": "cats", "rating": ["g"]}]},
+        {"queries": [{"q": "cats", "limit": "many"}]},
+        {"queries": [{"q": str(i)} for i in range(21)]},
+    ],
+)
+def test_batch_query_validation(handler, call_handler, data):
+    response = call_handler(handler, "POST", "/giphy/query/batch", data=data)
+    assert response.status_code == 400
@@ -0,0 +1,46 @@
+from decimal import Decimal
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from json_provider import OrjsonProvider
+import pytest
+
+APP = Flask(__name__)
+
+
+@pytest.fixture
+def providers():
+    return OrjsonProvider(APP), DefaultJSONProvider(APP)
+
+
+def test_output_matches_standard_provider(providers):
+    fast, standard = providers
+    value = {"b": [1, 2.5, None, True], "a": {"tags": ["x", "y"]}, "c": "héllo"}
+
+    assert fast.loads(fast.dumps(value)) == value
+    assert fast.dumps(value) == standard.dumps(value, ensure_ascii=False).replace(
+        ", ", ","
+    ).replace(": ", ":")
+
+
+def test_unsupported_types_use_default(providers):
+    fast, standard = providers
+
+    assert fast.dumps({"count": Decimal("3")}) == '{"count":"3"}'
+
+
+def test_falls_back_to_standard_encoder(providers):
+    fast, standard = providers
+    value = {"big": 2**70}
+
+    assert fast.dumps(value) == standard.dumps(value)
+    assert fast.dumps(value, cls=None) == standard.dumps(value, cls=None)
+
+
+def test_response(providers):
+    fast, standard = providers
+
+    with APP.app_context():
+        response = fast.response({"b": 1, "a": 2})
+
+    assert response.mimetype == "application/json"
+    assert response.get_data() == b'{"a":2,"b":1}\n'
@@ -0,0 +1,134 @@
+from base64 import b64decode, b64encode
+from werkzeug.wrappers import Request, Response
+import lambda_adapter
+import json
+
+
+@Request.application
+def echo(request):
+    response = Response(
+        json.dumps(
+            {
+                "method": request.method,
+                "path": request.path,
+                "args": request.args.to_dict(flat=False),
+                "accept": request.headers.get("Accept"),
+                "cookies": request.cookies.to_dict(),
+                "host": request.host,
+                "scheme": request.scheme,
+                "remote_addr": request.remote_addr,
+                "body": request.get_data(as_text=True),
+            }
+        ),
+        mimetype="application/json",
+    )
+    response.set_cookie("a", "1")
+    response.set_cookie("b", "2")
+
+    return response
+
+
+def _event(**overrides):
+    return {
+        "httpMethod": "POST",
+        "path": "/things",
+        "queryStringParameters": {"q": "cats"},
+        "headers": {"Host": "api.example.com", "Content-Type": "text/plain"},
+        "body": "hello",
+        "requestContext": {"identity": {"sourceIp": "10.0.0.1"}},
+        **overrides,
+    }
+
+
+def test_single_value_event():
+    rv = lambda_adapter.response(echo, _event(), None)
+
+    assert rv["statusCode"] == 200
+    assert rv["isBase64Encoded"] is False
+    assert json.loads(rv["body"]) == {
+        "method": "POST",
+        "path": "/things",
+        "args": {"q": ["cats"]},
+        "accept": None,
+        "cookies": {},
+        "host": "api.example.com",
+        "scheme": "https",
+        "remote_addr": "10.0.0.1",
+        "body": "hello",
+    }
+
+
+def test_multi_value_headers_and_query_string():
+    event = _event(
+        multiValueQueryStringParameters={"q": ["cats", "dogs"]},
+        multiValueHeaders={
+            "Accept": ["application/json", "text/plain"],
+            "Cookie": ["a=1", "b=2"],
+        },
+    )
+
+    body = json.loads(lambda_adapter.response(echo, event, None)["body"])
+
+    assert body["args"] == {"q": ["cats", "dogs"]}
+    assert body["accept"] == "application/json,text/plain"
+    assert body["cookies"] == {"a": "1", "b": "2"}
+
+
+def test_binary_bodies_round_trip():
+    event = _event(body=b64encode(b"\x00\xffhello").decode(), isBase64Encoded=True)
+
+    rv = lambda_adapter.response(
+        Request.application(lambda request: Response(request.get_data())), event, None
+    )
+
+    # Not valid UTF-8, so it is returned base64 encoded whatever its type.
+    assert rv["isBase64Encoded"] is True
+    assert b64decode(rv["body"]) == b"\x00\xffhello"
+
+
+def test_repeated_response_headers_are_multi_valued():
+    rv = lambda_adapter.response(echo, _event(), None)
+
+    assert "Set-Cookie" not in rv["headers"]
+    assert [it.split(";")[0] for it in rv["multiValueHeaders"]["Set-Cookie"]] == [
+        "a=1",
+        "b=2",
+    ]
+
+
+def test_binary_responses_are_base64_encoded():
+    def compressed(environ, start_response):
+        start_response(
+            "200 OK",
+            [("Content-Type", "application/json"), ("Content-Encoding", "gzip")],
+        )
+        return [b"\x1f\x8b", b"\x00"]
+
+    rv = lambda_adapter.response(compressed, _event(), None)
+
+    assert rv["isBase64Encoded"] is True
+    assert b64decode(rv["body"]) == b"\x1f\x8b\x00"
+
+    # Uncompressed JSON stays text, which API Gateway passes on unchanged.
+    rv = lambda_adapter.response(echo, _event(), None)
+
+    assert rv["isBase64Encoded"] is False
+    assert json.loads(rv["body"])["body"] == "hello"
+
+
+def test_response_iterables_are_closed():
+    closed = []
+
+    class Output(list):
+        def close(self):
+            closed.append(True)
+
+    def app(environ, start_response):
+        start_response("204 No Content", [])
+        return Output()
+
+    rv = lambda_adapter.response(app, _event(), None)
+
+    assert rv["statusCode"] == 204
+    assert rv["body"] == ""
+    assert closed == [True]
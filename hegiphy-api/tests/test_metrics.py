@@ -0,0 +1,178 @@
+from botocore.stub import Stubber
+import favorites_client
+import requests_mock
+import config
+import json
+import metrics
+import pytest
+
+USER = "foo@bar.com"
+VERSION = f"version#{USER}"
+
+
+@pytest.fixture
+def auth_mock():
+    with requests_mock.mock(real_http=True) as req_mock:
+        req_mock.get("https://budb-hegiphy.auth0.com/userinfo", json={"email": USER})
+        yield req_mock
+
+
+def _query(handler, call_handler):
+    with requests_mock.mock() as req_mock:
+        req_mock.get(f"{config.get('giphy_base_url')}/gifs/search", json={"data": []})
+
+        return call_handler(handler, "GET", "/giphy/query?q=cats")
+
+
+def test_metrics_are_off_by_default(handler, call_handler, capsys):
+    response = _query(handler, call_handler)
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert capsys.readouterr().out == ""
+
+
+def test_server_timing_covers_auth_and_dynamodb(
+    handler, call_handler, override_config, auth_mock
+):
+    override_config(metrics="server-timing")
+
+    with Stubber(favorites_client.get_client()) as dynamodb_mock:
+        dynamodb_mock.add_response(
+            "get_item",
+            {"ConsumedCapacity": {"TableName": "hegiphy", "CapacityUnits": 1.0}},
+            {
+                "TableName": "hegiphy",
+                "Key": {"pk": {"S": VERSION}, "sk": {"S": VERSION}},
+                "ConsistentRead": True,
+                "ReturnConsumedCapacity": "TOTAL",
+            },
+        )
+        dynamodb_mock.add_response(
+            "query",
+            {
+                "Items": [],
+                "ConsumedCapacity": {"TableName": "hegiphy", "CapacityUnits": 0.5},
+            },
+            {
+                "TableName": "hegiphy",
+                "KeyConditionExpression": "pk = :tag",
+                "ExpressionAttributeValues": {":tag": {"S": f"tag#{USER}#bar"}},
+                "ReturnConsumedCapacity": "TOTAL",
+            },
+        )
+
+        response = call_handler(
+            handler, "GET", "/favorites?tag=bar", {"Authorization": "Bearer token"}
+        )
+
+        dynamodb_mock.assert_no_pending_responses()
+
+    assert response.status_code == 200
+
+    stages = dict(
+        it.split(";", 1) for it in response.headers["Server-Timing"].split(", ")
+    )
+
+    assert set(stages) == {
+        "auth",
+        "dynamodb.get_version",
+        "dynamodb.find_by_user_and_tag",
+        "dynamodb.capacity",
+        "serialize",
+        "total",
+    }
+    assert stages["dynamodb.capacity"] == 'desc="1.5"'
+    assert stages["auth"].startswith("dur=")
+
+
+def test_server_timing_covers_the_whole_favorites_list(
+    handler, call_handler, override_config, auth_mock
+):
+    override_config(metrics="server-timing")
+
+    with Stubber(favorites_client.get_client()) as dynamodb_mock:
+        dynamodb_mock.add_response(
+            "get_item",
+            {"ConsumedCapacity": {"TableName": "hegiphy", "CapacityUnits": 1.0}},
+            {
+                "TableName": "hegiphy",
+                "Key": {"pk": {"S": VERSION}, "sk": {"S": VERSION}},
+                "ConsistentRead": True,
+                "ReturnConsumedCapacity": "TOTAL",
+            },
+        )
+        dynamodb_mock.add_response(
+            "query",
+            {
+                "Items": [],
+                "ConsumedCapacity": {"TableName": "hegiphy", "CapacityUnits": 0.5},
+            },
+            {
+                "TableName": "hegiphy",
+                "KeyConditionExpression": "pk = :user",
+                "ExpressionAttributeValues": {":user": {"S": USER}},
+                "ReturnConsumedCapacity": "TOTAL",
+            },
+        )
+
+        response = call_handler(
+            handler, "GET", "/favorites", {"Authorization": "Bearer token"}
+        )
+
+        dynamodb_mock.assert_no_pending_responses()
+
+    assert response.status_code == 200
+
+    stages = dict(
+        it.split(";", 1) for it in response.headers["Server-Timing"].split(", ")
+    )
+
+    # The list is read before the response is returned, so the query is
+    # counted along with the version read.
+    assert set(stages) == {
+        "auth",
+        "dynamodb.get_version",
+        "dynamodb.find_by_user",
+        "dynamodb.iter_by_user",
+        "dynamodb.capacity",
+        "serialize",
+        "total",
+    }
+    assert stages["dynamodb.capacity"] == 'desc="1.5"'
+
+
+def test_embedded_metric_format(handler, call_handler, override_config, capsys):
+    override_config(metrics="emf")
+
+    response = _query(handler, call_handler)
+
+    assert "Server-Timing" not in response.headers
+
+    line = json.loads(capsys.readouterr().out)
+    (directive,) = line["_aws"]["CloudWatchMetrics"]
+
+    assert directive["Namespace"] == "hegiphy"
+    assert directive["Dimensions"] == [["Route"]]
+    assert {it["Name"] for it in directive["Metrics"]} == {
+        "giphy.gifs.search",
+        "total",
+        "dynamodb.capacity",
+    }
+    assert line["Route"] == "GET /giphy/query"
+    assert line["giphy.gifs.search"] <= line["total"]
+
+
+def test_generators_are_timed_each_time_they_produce():
+    @metrics.timed("stage")
+    def count():
+        yield from range(3)
+
+    metrics._CURRENT.set(metrics.RequestMetrics("route", ["emf"]))
+
+    try:
+        assert list(count()) == [0, 1, 2]
+        # Three items, plus the final call that finds the generator exhausted.
+        assert metrics._CURRENT.get().stages["stage"][1] == 4
+    finally:
+        metrics._CURRENT.set(None)
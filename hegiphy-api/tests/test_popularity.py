@@ -0,0 +1,257 @@
+from botocore.stub import ANY, Stubber
+from favorites_client import FavoritesClient, LEADERBOARD_KEY
+import favorites_client
+import pytest
+import requests_mock
+
+
+@pytest.fixture
+def dynamodb_mock():
+    with Stubber(favorites_client.get_client()) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture(autouse=True)
+def two_shards(override_config):
+    override_config(
+        popularity_counter_shards="2", leaderboard_size="1", leaderboard_candidates="2"
+    )
+
+
+def _key(value):
+    return {"pk": {"S": value}, "sk": {"S": value}}
+
+
+def _shard(id, shard, count):
+    return {**_key(f"count#{id}#{shard}"), "count": {"N": str(count)}}
+
+
+def _leaderboard(entries, revision):
+    return {
+        **LEADERBOARD_KEY,
+        "entries": {"M": {id: {"N": str(it)} for id, it in entries.items()}},
+        "revision": {"N": str(revision)},
+    }
+
+
+def _add_leaderboard_get(dynamodb_mock, entries, revision, consistent=True):
+    dynamodb_mock.add_response(
+        "get_item",
+        {"Item": _leaderboard(entries, revision)},
+        {"TableName": "hegiphy", "Key": LEADERBOARD_KEY, "ConsistentRead": consistent},
+    )
+
+
+def _add_counts_get(dynamodb_mock, ids, items, unprocessed=()):
+    response = {"Responses": {"hegiphy": items}}
+
+    if unprocessed:
+        response["UnprocessedKeys"] = {"hegiphy": {"Keys": list(unprocessed)}}
+
+    dynamodb_mock.add_response(
+        "batch_get_item",
+        response,
+        {
+            "RequestItems": {
+                "hegiphy": {
+                    "Keys": [_key(f"count#{id}#{it}") for id in ids for it in (0, 1)]
+                }
+            }
+        },
+    )
+
+
+def test_counts_are_summed_over_shards(dynamodb_mock, monkeypatch):
+    monkeypatch.setattr(favorites_client, "MAX_BATCH_ATTEMPTS", 1)
+
+    _add_counts_get(
+        dynamodb_mock,
+        ["a", "b", "c"],
+        [_shard("a", 0, 2), _shard("a", 1, 3), _shard("c", 1, 1)],
+        unprocessed=[_key("count#c#0")],
+    )
+
+    assert FavoritesClient().count_favorites(["a", "b", "c", "a"]) == {
+        "a": 5,
+        "b": 0,
+        "c": None,
+    }
+
+
+def test_a_new_leader_replaces_the_last_entry(dynamodb_mock):
+    _add_leaderboard_get(dynamodb_mock, {"a": 5, "b": 3}, 7)
+    _add_counts_get(dynamodb_mock, ["c"], [_shard("c", 0, 4)])
+    dynamodb_mock.add_client_error(
+        "put_item", service_error_code="ConditionalCheckFailedException"
+    )
+
+    # Someone else updated the leaderboard in the meantime.
+    _add_leaderboard_get(dynamodb_mock, {"a": 6, "b": 3}, 8)
+    _add_counts_get(dynamodb_mock, ["c"], [_shard("c", 0, 4)])
+    dynamodb_mock.add_response(
+        "put_item",
+        {},
+        {
+            "TableName": "hegiphy",
+            "Item": _leaderboard({"a": 6, "c": 4}, 9),
+            "ConditionExpression": "revision = :revision",
+            "ExpressionAttributeValues": {":revision": {"N": "8"}},
+        },
+    )
+
+    FavoritesClient().update_leaderboard(["c"])
+
+
+def test_counts_below_the_leaderboard_do_not_write_it(dynamodb_mock):
+    _add_leaderboard_get(dynamodb_mock, {"a": 5, "b": 3}, 7)
+    _add_counts_get(dynamodb_mock, ["c"], [_shard("c", 1, 3)])
+
+    FavoritesClient().update_leaderboard(["c"])
+
+
+def test_a_losing_leader_is_replaced_by_the_next_candidate(dynamodb_mock):
+    _add_leaderboard_get(dynamodb_mock, {"a": 5, "b": 3}, 7)
+    _add_counts_get(dynamodb_mock, ["a"], [_shard("a", 0, 2)])
+    dynamodb_mock.add_response(
+        "put_item",
+        {},
+        {
+            "TableName": "hegiphy",
+            "Item": _leaderboard({"b": 3, "a": 2}, 8),
+            "ConditionExpression": "revision = :revision",
+            "ExpressionAttributeValues": {":revision": {"N": "7"}},
+        },
+    )
+
+    FavoritesClient().update_leaderboard(["a"])
+
+
+def test_leaderboard_updates_give_up_with_a_warning(dynamodb_mock, caplog):
+    for revision in range(5):
+        _add_leaderboard_get(dynamodb_mock, {"a": 5}, revision)
+        _add_counts_get(dynamodb_mock, ["b"], [_shard("b", 0, 1)])
+        dynamodb_mock.add_client_error(
+            "put_item", service_error_code="ConditionalCheckFailedException"
+        )
+
+    assert not FavoritesClient().update_leaderboard(["b"])
+    assert "giving up on updating the leaderboard" in caplog.text
+
+
+def _counter_update(id, delta):
+    return {
+        "Update": {
+            "TableName": "hegiphy",
+            "Key": ANY,
+            "UpdateExpression": "ADD #count :delta",
+            "ExpressionAttributeNames": {"#count": "count"},
+            "ExpressionAttributeValues": {":delta": {"N": str(delta)}},
+        }
+    }
+
+
+def test_counts_are_updated_in_one_transaction(dynamodb_mock):
+    updates = [_counter_update("a", 1), _counter_update("b", -1)]
+    dynamodb_mock.add_client_error(
+        "transact_write_items", service_error_code="TransactionCanceledException"
+    )
+    dynamodb_mock.add_response("transact_write_items", {}, {"TransactItems": updates})
+
+    FavoritesClient()._update_counts({"a": 1, "b": -1})
+
+
+def test_most_favorited(handler, call_handler, dynamodb_mock):
+    _add_leaderboard_get(dynamodb_mock, {"b": 3, "a": 5}, 7, consistent=False)
+
+    response = call_handler(handler, "GET", "/popular?limit=1")
+
+    assert response.status_code == 200
+    assert response.json == [{"id": "a", "count": 5}]
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+
+
+def test_most_favorited_limit_is_bounded_by_the_leaderboard(handler, call_handler):
+    response = call_handler(handler, "GET", "/popular?limit=3")
+
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def signed_in():
+    with requests_mock.mock() as req_mock:
+        req_mock.get(
+            "https://budb-hegiphy.auth0.com/userinfo", json={"email": "foo@bar.com"}
+        )
+        yield {"Authorization": "Bearer foo-token"}
+
+
+def test_favorite_counts(handler, call_handler, dynamodb_mock, signed_in):
+    _add_counts_get(dynamodb_mock, ["a", "b"], [_shard("a", 1, 2)])
+
+    response = call_handler(handler, "GET", "/popular/counts?ids=a,b", signed_in)
+
+    assert response.status_code == 200
+    assert response.json == {"a": 2, "b": 0}
+    assert response.headers["Cache-Control"] == "private, max-age=60"
+
+
+def test_favorite_counts_require_auth(handler, call_handler):
+    response = call_handler(handler, "GET", "/popular/counts?ids=a,b")
+
+    assert response.status_code == 401
+
+
+def test_favorite_counts_are_bounded(handler, call_handler, signed_in):
+    ids = ",".join(str(it) for it in range(11))
+
+    response = call_handler(handler, "GET", f"/popular/counts?ids={ids}", signed_in)
+
+    assert response.status_code == 400
+
+
+def _stream_record(pk):
+    return {
+        "eventSource": "aws:dynamodb",
+        "eventName": "MODIFY",
+        "dynamodb": {"Keys": {"pk": {"S": pk}, "sk": {"S": pk}}},
+    }
+
+
+def test_counter_streams_update_the_leaderboard(handler, dynamodb_mock):
+    event = {
+        "Records": [
+            _stream_record("count#b#1"),
+            _stream_record("count#a#0"),
+            _stream_record("count#b#0"),
+            _stream_record("foo@bar.com"),
+        ]
+    }
+    _add_leaderboard_get(dynamodb_mock, {"a": 5}, 7)
+    _add_counts_get(dynamodb_mock, ["a", "b"], [_shard("a", 0, 6), _shard("b", 1, 1)])
+    dynamodb_mock.add_response(
+        "put_item",
+        {},
+        {
+            "TableName": "hegiphy",
+            "Item": _leaderboard({"a": 6, "b": 1}, 8),
+            "ConditionExpression": "revision = :revision",
+            "ExpressionAttributeValues": {":revision": {"N": "7"}},
+        },
+    )
+
+    assert handler(event, None) == {"updated": ["a", "b"]}
+
+
+def test_failed_leaderboard_updates_fail_the_stream_batch(
+    handler, dynamodb_mock, monkeypatch
+):
+    monkeypatch.setattr(favorites_client, "MAX_LEADERBOARD_ATTEMPTS", 1)
+    _add_leaderboard_get(dynamodb_mock, {"a": 5}, 7)
+    _add_counts_get(dynamodb_mock, ["b"], [_shard("b", 0, 1)])
+    dynamodb_mock.add_client_error(
+        "put_item", service_error_code="ConditionalCheckFailedException"
+    )
+
+    with pytest.raises(RuntimeError):
+        handler({"Records": [_stream_record("count#b#0")]}, None)
@@ -0,0 +1,72 @@
+from prefetch import Prefetcher
+import threading
+
+
+def _wait(prefetcher):
+    prefetcher._executor.submit(lambda: None).result()
+
+
+def test_prefetched_pages_are_counted_when_served():
+    prefetcher = Prefetcher(max_in_flight=1, budget=2, ttl=60, max_size=10)
+    loaded = []
+
+    assert prefetcher.submit("page2", "cats", lambda: loaded.append(2))
+    _wait(prefetcher)
+
+    assert loaded == [2]
+    assert prefetcher.served("page2")
+    assert not prefetcher.served("page2")
+    assert not prefetcher.served("page3")
+    assert prefetcher.stats() == {
+        "prefetched": 1,
+        "used": 1,
+        "skipped": 0,
+        "failed": 0,
+        "in_flight": 0,
+        "used_ratio": 1.0,
+    }
+
+
+def test_unused_pages_use_up_the_term_budget():
+    prefetcher = Prefetcher(max_in_flight=1, budget=2, ttl=60, max_size=10)
+
+    for page in ("page2", "page3"):
+        assert prefetcher.submit(page, "cats", lambda: None)
+        _wait(prefetcher)
+
+    assert not prefetcher.submit("page4", "cats", lambda: None)
+    assert prefetcher.submit("dogs2", "dogs", lambda: None)
+    _wait(prefetcher)
+
+    # Serving a prefetched page frees its place in the budget.
+    prefetcher.served("page2")
+
+    assert prefetcher.submit("page4", "cats", lambda: None)
+
+
+def test_prefetches_are_dropped_while_workers_are_busy():
+    prefetcher = Prefetcher(max_in_flight=1, budget=5, ttl=60, max_size=10)
+    release = threading.Event()
+
+    assert prefetcher.submit("page2", "cats", release.wait)
+    assert not prefetcher.submit("dogs2", "dogs", lambda: None)
+    assert prefetcher.stats()["skipped"] == 1
+
+    release.set()
+    _wait(prefetcher)
+
+    assert prefetcher.stats()["in_flight"] == 0
+
+
+def test_failed_prefetches_are_forgotten():
+    prefetcher = Prefetcher(max_in_flight=1, budget=1, ttl=60, max_size=10)
+
+    def fail():
+        raise RuntimeError()
+
+    assert prefetcher.submit("page2", "cats", fail)
+    _wait(prefetcher)
+
+    assert not prefetcher.served("page2")
+    assert prefetcher.stats()["failed"] == 1
+    assert prefetcher.submit("page2", "cats", lambda: None)
@@ -0,0 +1,78 @@
+from response_cache import CacheEntry, MemoryBackend, ResponseCache
+import asyncio
+import time
+
+
+def test_memory_backend_evicts_least_recently_used_within_budget():
+    backend = MemoryBackend(max_bytes=10)
+
+    backend.set("a", CacheEntry("aaaa", 0))
+    backend.set("b", CacheEntry("bbbb", 0))
+    backend.get("a")
+    backend.set("c", CacheEntry("cccc", 0))
+
+    assert backend.get("a") is not None
+    assert backend.get("b") is None
+    assert backend.get("c") is not None
+    assert backend.size == 8
+
+
+def test_memory_backend_skips_values_larger_than_budget():
+    backend = MemoryBackend(max_bytes=3)
+
+    backend.set("a", CacheEntry("aaaa", 0))
+
+    assert backend.get("a") is None
+    assert backend.size == 0
+
+
+def test_endpoint_without_ttl_is_not_cached():
+    cache = ResponseCache(MemoryBackend(1024), ttls={"query": 60})
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "value"
+
+    for _ in range(2):
+        assert cache.get_or_load("trending", {}, loader) == "value"
+        assert cache.get_or_load("query", {"term": "foo"}, loader) == "value"
+
+    assert len(calls) == 3
+
+
+def test_failed_refreshes_are_logged(caplog):
+    cache = ResponseCache(MemoryBackend(1024), ttls={"query": 60}, stale_ttl=60)
+    key = cache.make_key("query", {"term": "foo"})
+    cache.backend.set(key, CacheEntry("stale", time.time() - 90))
+
+    def loader():
+        raise RuntimeError("bad key")
+
+    assert cache.get_or_load("query", {"term": "foo"}, loader) == "stale"
+
+    for _ in range(50):
+        if not cache.stats()["refreshing"]:
+            break
+        time.sleep(0.01)
+
+    assert f"refreshing {key} failed" in caplog.text
+    assert "bad key" in caplog.text
+
+
+def test_failed_async_refreshes_are_logged(caplog):
+    cache = ResponseCache(MemoryBackend(1024), ttls={"query": 60}, stale_ttl=60)
+    key = cache.make_key("query", {"term": "foo"})
+    cache.backend.set(key, CacheEntry("stale", time.time() - 90))
+
+    async def loader():
+        raise RuntimeError("bad key")
+
+    async def scenario():
+        value = await cache.get_or_load_async("query", {"term": "foo"}, loader)
+        await asyncio.sleep(0)
+        return value
+
+    assert asyncio.run(scenario()) == "stale"
+    assert not cache.stats()["refreshing"]
+    assert f"refreshing {key} failed" in caplog.text
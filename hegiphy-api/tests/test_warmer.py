@@ -0,0 +1,74 @@
+from botocore.stub import Stubber
+from favorites_client import LEADERBOARD_KEY
+from recent_terms import RecentTerms
+import favorites_client
+import requests_mock
+import config
+import json
+
+
+def test_recent_terms_follow_recent_traffic():
+    terms = RecentTerms(max_size=2)
+
+    for term in ["cats", "cats", "cats", "dogs", "dogs", "owls"]:
+        terms.record(term)
+
+    assert terms.top(2) == ["cats", "dogs"]
+
+    terms.decay()
+    terms.record("owls")
+    terms.record("owls")
+
+    assert terms.top(3) == ["owls", "cats", "dogs"]
+
+
+def test_ping_warms_connections_and_popular_pages(handler, call_handler):
+    base_url = config.get("giphy_base_url")
+
+    with requests_mock.mock() as req_mock, Stubber(
+        favorites_client.get_client()
+    ) as dynamodb_mock:
+        req_mock.get(f"{base_url}/gifs/search?q=dogs", json={"term": "dogs"})
+        req_mock.get(f"{base_url}/gifs/search?q=cats", json={"term": "cats"})
+        req_mock.get(f"{base_url}/gifs/trending", json={"trending": True})
+        req_mock.head("https://budb-hegiphy.auth0.com/userinfo", status_code=401)
+        dynamodb_mock.add_response(
+            "get_item",
+            {},
+            {"TableName": "hegiphy", "Key": LEADERBOARD_KEY, "ConsistentRead": False},
+        )
+
+        call_handler(handler, "GET", "/giphy/query?q=dogs")
+
+        rv = handler({"source": "aws.events", "warmer": {"terms": [" Cats "]}}, None)
+
+        assert sorted(rv["warmed"]) == [
+            "auth",
+            "dynamodb",
+            "query cats",
+            "query dogs",
+            "trending",
+        ]
+        assert rv["failed"] == []
+        assert req_mock.call_count == 5
+
+        for path, body in [
+            ("/giphy/query?q=CATS", {"term": "cats"}),
+            ("/giphy/trending", {"trending": True}),
+        ]:
+            response = call_handler(handler, "GET", path)
+            assert json.loads(response.body) == body
+
+        assert req_mock.call_count == 5
+        dynamodb_mock.assert_no_pending_responses()
+
+
+def test_failed_warm_ups_are_reported(handler):
+    with requests_mock.mock() as req_mock, Stubber(favorites_client.get_client()):
+        req_mock.get(requests_mock.ANY, status_code=500)
+        req_mock.head(requests_mock.ANY, status_code=401)
+
+        rv = handler({"warmer": {}}, None)
+
+    assert rv["warmed"] == ["auth"]
+    assert sorted(rv["failed"]) == ["dynamodb", "trending"]
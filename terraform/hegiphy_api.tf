@@ -16,7 +16,7 @@ resource "aws_acm_certificate" "hegiphy_api" {
 
 resource "aws_acm_certificate_validation" "hegiphy_api" {
   certificate_arn = aws_acm_certificate.hegiphy_api.arn
-  validation_record_fqdns = [aws_route53_record.hegiphy_api_cert_validation.fqdn]
+  validation_record_fqdns = [for it in aws_route53_record.hegiphy_api_cert_validation : it.fqdn]
 }
 
 ###########################################################
@@ -24,13 +24,22 @@ resource "aws_acm_certificate_validation" "hegiphy_api" {
 ###########################################################
 
 resource "aws_route53_record" "hegiphy_api_cert_validation" {
-  name    = aws_acm_certificate.hegiphy_api.domain_validation_options.0.resource_record_name
-  type    = aws_acm_certificate.hegiphy_api.domain_validation_options.0.resource_record_type
+  for_each = {
+    for it in aws_acm_certificate.hegiphy_api.domain_validation_options : it.domain_name => it
+  }
+
+  name    = each.value.resource_record_name
+  type    = each.value.resource_record_type
   zone_id = data.aws_route53_zone.budjb_com_zone.zone_id
-  records = [aws_acm_certificate.hegiphy_api.domain_validation_options.0.resource_record_value]
+  records = [each.value.resource_record_value]
   ttl     = 60
 }
 
+moved {
+  from = aws_route53_record.hegiphy_api_cert_validation
+  to   = aws_route53_record.hegiphy_api_cert_validation["api.hegiphy.budjb.com"]
+}
+
 resource "aws_route53_record" "api_domain_record" {
   zone_id = data.aws_route53_zone.budjb_com_zone.zone_id
   name    = "api.hegiphy.budjb.com"
@@ -53,6 +62,11 @@ resource "aws_dynamodb_table" "hegiphy_table" {
   hash_key     = "pk"
   range_key    = "sk"
 
+  # Counter changes are streamed to the API Lambda, which keeps the most
+  # favorited leaderboard up to date off the request path.
+  stream_enabled   = true
+  stream_view_type = "KEYS_ONLY"
+
   attribute {
     name = "pk"
     type = "S"
@@ -109,18 +123,16 @@ resource "aws_iam_role_policy" "api_gateway_lambda_policy" {
   policy = data.aws_iam_policy_document.hegiphy_api_invoke_lambda.json
 }
 
-data "template_file" "api_gateway_spec" {
-  template = file("${path.module}/openapi.yml")
-
-  vars = {
-    lambda_arn = aws_lambda_function.hegiphy_api.invoke_arn
-    lambda_role   = aws_iam_role.api_gateway_role.arn
-  }
+locals {
+  api_gateway_spec = templatefile("${path.module}/openapi.yml", {
+    lambda_arn  = aws_lambda_function.hegiphy_api.invoke_arn
+    lambda_role = aws_iam_role.api_gateway_role.arn
+  })
 }
 
 resource "aws_api_gateway_rest_api" "api_gateway" {
   name = "HeGiphy API"
-  body = data.template_file.api_gateway_spec.rendered
+  body = local.api_gateway_spec
 }
 
 resource "aws_api_gateway_deployment" "api_gateway_deployment" {
@@ -128,7 +140,7 @@ resource "aws_api_gateway_deployment" "api_gateway_deployment" {
   stage_name  = "release"
 
   variables = {
-    "version" = md5(data.template_file.api_gateway_spec.rendered)
+    "version" = md5(local.api_gateway_spec)
   }
 
   lifecycle {
@@ -242,8 +254,11 @@ resource "aws_lambda_function" "hegiphy_api" {
   role                           = aws_iam_role.hegiphy_api_role.arn
   handler                        = "lambda_handler.handler"
   timeout                        = 28
+  # Leaves room for the Giphy response cache (32 MiB) and the GIF metadata
+  # cache (8 MiB) on top of the runtime and its libraries.
+  memory_size                    = 512
   publish                        = true
-  runtime                        = "python3.6"
+  runtime                        = "python3.11"
   description                    = "HeGiphy API"
 
   tracing_config {
@@ -256,3 +271,27 @@ resource "aws_lambda_alias" "lambda_alias" {
   function_name    = aws_lambda_function.hegiphy_api.arn
   function_version = aws_lambda_function.hegiphy_api.version
 }
+
+resource "aws_lambda_event_source_mapping" "leaderboard" {
+  event_source_arn                   = aws_dynamodb_table.hegiphy_table.stream_arn
+  function_name                      = aws_lambda_function.hegiphy_api.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 10
+  maximum_retry_attempts             = 3
+
+  # Only the popularity counters affect the leaderboard.
+  filter_criteria {
+    filter {
+      pattern = jsonencode({
+        dynamodb = {
+          Keys = {
+            pk = {
+              S = [{ prefix = "count#" }]
+            }
+          }
+        }
+      })
+    }
+  }
+}
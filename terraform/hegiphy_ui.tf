@@ -8,11 +8,22 @@ locals {
 
 resource "aws_s3_bucket" "ui_bucket" {
   bucket = "budjb-hegiphy-ui"
+}
+
+resource "aws_s3_bucket_acl" "ui_bucket" {
+  bucket = aws_s3_bucket.ui_bucket.id
   acl    = "public-read"
+}
+
+resource "aws_s3_bucket_website_configuration" "ui_bucket" {
+  bucket = aws_s3_bucket.ui_bucket.id
+
+  index_document {
+    suffix = "index.html"
+  }
 
-  website {
-    index_document = "index.html"
-    error_document = "index.html"
+  error_document {
+    key = "index.html"
   }
 }
 
@@ -30,7 +41,7 @@ resource "aws_acm_certificate" "hegiphy_ui" {
 
 resource "aws_acm_certificate_validation" "hegiphy_ui" {
   certificate_arn = aws_acm_certificate.hegiphy_ui.arn
-  validation_record_fqdns = [aws_route53_record.hegiphy_ui_cert_validation.fqdn]
+  validation_record_fqdns = [for it in aws_route53_record.hegiphy_ui_cert_validation : it.fqdn]
 }
 
 ###########################################################
@@ -39,7 +50,7 @@ resource "aws_acm_certificate_validation" "hegiphy_ui" {
 
 resource "aws_cloudfront_distribution" "hegiphy_ui" {
   origin {
-    domain_name = aws_s3_bucket.ui_bucket.website_endpoint
+    domain_name = aws_s3_bucket_website_configuration.ui_bucket.website_endpoint
     origin_id   = local.ui_s3_origin_id
 
     custom_origin_config {
@@ -106,9 +117,18 @@ resource "aws_route53_record" "hegiphy_ui" {
 }
 
 resource "aws_route53_record" "hegiphy_ui_cert_validation" {
-  name    = aws_acm_certificate.hegiphy_ui.domain_validation_options.0.resource_record_name
-  type    = aws_acm_certificate.hegiphy_ui.domain_validation_options.0.resource_record_type
+  for_each = {
+    for it in aws_acm_certificate.hegiphy_ui.domain_validation_options : it.domain_name => it
+  }
+
+  name    = each.value.resource_record_name
+  type    = each.value.resource_record_type
   zone_id = data.aws_route53_zone.budjb_com_zone.zone_id
-  records = [aws_acm_certificate.hegiphy_ui.domain_validation_options.0.resource_record_value]
+  records = [each.value.resource_record_value]
   ttl     = 60
 }
+
+moved {
+  from = aws_route53_record.hegiphy_ui_cert_validation
+  to   = aws_route53_record.hegiphy_ui_cert_validation["hegiphy.budjb.com"]
+}